@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from redis.exceptions import RedisError
+
+from .binance_pool import get_client
+from .ledger import sincronizar_fills
+from .redis_client import get_redis
+from .weight_governor import prioridade_binance
+
+# Dados da conta prontos para o dashboard. `atualizado_em` é o do dado mais antigo.
+# `fills` é só o resultado da última sincronização do ledger; os trades ficam no banco.
+AccountSnapshot = namedtuple("AccountSnapshot", ["fills", "saldos", "posicoes", "atualizado_em"])
+
+TIPOS = ("fills", "saldos", "posicoes")
+CHAVE_SNAPSHOT = "conta:{user_id}:{tipo}"
+CHAVE_LOCK = "conta:lock:{user_id}:{tipo}"
+
+
+class AccountSnapshotCache:
+    """
+    Cache por usuário dos dados da conta mostrados no dashboard.
+
+    Cada tipo de dado (sincronização dos fills, saldos e posições) fica no Redis com
+    o instante da última atualização. Dentro do TTL do tipo, o valor é servido direto;
+    depois dele continua sendo servido (até ACCOUNT_CACHE_MAX_STALE_SECONDS) enquanto
+    uma thread em segundo plano busca o valor novo. Só quando não há nada guardado a
+    requisição espera a Binance, e nesse caso as chamadas saem em paralelo.
+    """
+    TIMEOUT_BUSCA = 15  # segundos
+
+    def __init__(self, ttls=None, max_stale=None, workers=8):
+        self.ttls = ttls or {
+            "fills": settings.ACCOUNT_CACHE_TTL_TRADES,
+            "saldos": settings.ACCOUNT_CACHE_TTL_BALANCES,
+            "posicoes": settings.ACCOUNT_CACHE_TTL_POSITIONS,
+        }
+        self.max_stale = max_stale if max_stale is not None else settings.ACCOUNT_CACHE_MAX_STALE_SECONDS
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="account-cache")
+        self._em_atualizacao = set()
+        self._mutex = threading.Lock()
+
+    def obter(self, user_id, api_key, api_secret):
+        """
+        Retorna o snapshot da conta do usuário.
+
+        Raises:
+            BinanceAPIException: Se uma busca obrigatória (sem valor em cache) falhar.
+        """
+        agora = time.time()
+        entradas = self._ler(user_id)
+        faltando = []
+        for tipo in TIPOS:
+            entrada = entradas.get(tipo)
+            if entrada is None:
+                faltando.append(tipo)
+            elif agora - entrada["atualizado_em"] >= self.ttls[tipo]:
+                self._agendar(user_id, api_key, api_secret, tipo)
+
+        if faltando:
+            futuros = {
+                tipo: self._executor.submit(self._atualizar, user_id, api_key, api_secret, tipo)
+                for tipo in faltando
+            }
+            for tipo, futuro in futuros.items():
+                entradas[tipo] = futuro.result(timeout=self.TIMEOUT_BUSCA)
+
+        return AccountSnapshot(
+            fills=entradas["fills"]["dados"],
+            saldos=entradas["saldos"]["dados"],
+            posicoes=entradas["posicoes"]["dados"],
+            atualizado_em=min(entradas[tipo]["atualizado_em"] for tipo in TIPOS),
+        )
+
+    def invalidar(self, user_id, tipos=TIPOS):
+        """Descarta o cache (ex: depois de uma ordem manual) para a próxima leitura buscar de novo."""
+        try:
+            get_redis().delete(*[CHAVE_SNAPSHOT.format(user_id=user_id, tipo=tipo) for tipo in tipos])
+        except RedisError as e:
+            print(f"[Conta] Falha ao invalidar o cache do usuário {user_id}: {e}")
+
+    # --- Internos ---
+
+    def _ler(self, user_id):
+        chaves = [CHAVE_SNAPSHOT.format(user_id=user_id, tipo=tipo) for tipo in TIPOS]
+        try:
+            brutos = get_redis().mget(chaves)
+        except RedisError as e:
+            print(f"[Conta] Redis indisponível, buscando direto na Binance: {e}")
+            return {}
+        return {tipo: json.loads(bruto) for tipo, bruto in zip(TIPOS, brutos) if bruto}
+
+    def _agendar(self, user_id, api_key, api_secret, tipo):
+        chave = (user_id, tipo)
+        with self._mutex:
+            if chave in self._em_atualizacao:
+                return
+            self._em_atualizacao.add(chave)
+
+        def tarefa():
+            chave_lock = CHAVE_LOCK.format(user_id=user_id, tipo=tipo)
+            try:
+                # Só um processo web atualiza cada tipo por vez.
+                if get_redis().set(chave_lock, "1", nx=True, ex=self.TIMEOUT_BUSCA * 2):
+                    try:
+                        self._atualizar(user_id, api_key, api_secret, tipo)
+                    finally:
+                        get_redis().delete(chave_lock)
+            except Exception as e:
+                print(f"[Conta] Erro ao atualizar {tipo} do usuário {user_id} em segundo plano: {e}")
+            finally:
+                with self._mutex:
+                    self._em_atualizacao.discard(chave)
+
+        self._executor.submit(tarefa)
+
+    def _atualizar(self, user_id, api_key, api_secret, tipo):
+        client = get_client(api_key, api_secret, testnet=False)
+        # Dashboard é o primeiro a ceder peso da Binance; com o peso apertado fica o snapshot antigo.
+        with prioridade_binance("painel"):
+            entrada = {"dados": self._buscar(client, user_id, tipo), "atualizado_em": time.time()}
+        try:
+            get_redis().set(
+                CHAVE_SNAPSHOT.format(user_id=user_id, tipo=tipo), json.dumps(entrada), ex=self.max_stale
+            )
+        except RedisError as e:
+            print(f"[Conta] Falha ao gravar {tipo} do usuário {user_id} no Redis: {e}")
+        return entrada
+
+    @staticmethod
+    def _buscar(client, user_id, tipo):
+        # Guarda só o que o dashboard usa, para o snapshot ficar pequeno.
+        if tipo == "fills":
+            try:
+                return {"novos": sincronizar_fills(user_id, client)}
+            finally:
+                close_old_connections()
+        if tipo == "saldos":
+            return [
+                {"asset": b["asset"], "balance": b["balance"]}
+                for b in client.futures_account_balance() if float(b["balance"]) > 0
+            ]
+        return [
+            {k: p[k] for k in ("symbol", "positionAmt", "entryPrice", "unrealizedProfit")}
+            for p in client.futures_account()["positions"] if float(p["positionAmt"]) != 0
+        ]
+
+
+_cache = None
+
+
+def get_account_cache():
+    """Retorna o cache de snapshots da conta do processo, criando-o na primeira chamada."""
+    global _cache
+    if _cache is None:
+        _cache = AccountSnapshotCache()
+    return _cache
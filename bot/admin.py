@@ -1,7 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, BotControl
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .control_channel import EVENTO_PROFILE, publicar_evento
+from .models import UserProfile, BotControl, BotCheckpoint, OptimizationResult, ProfileSession
+from .profiler import finalizar_sessao
 
 # Define um "inline" para o UserProfile, para que ele apareça dentro do User
 class UserProfileInline(admin.StackedInline):
@@ -23,4 +31,71 @@ class UserAdmin(BaseUserAdmin):
 
 # Re-registra o UserAdmin
 admin.site.unregister(User)
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+admin.site.register(User, UserAdmin)
+
+
+# Resultados do otimizador (comando `optimize`), só para consulta
+@admin.register(OptimizationResult)
+class OptimizationResultAdmin(admin.ModelAdmin):
+    list_display = ('execucao', 'ranking', 'symbol', 'timeframe', 'ema_fast', 'ema_slow', 'leverage',
+                    'pnl_total', 'pnl_fora_amostra', 'trades', 'win_rate', 'max_drawdown_percent')
+    list_filter = ('execucao', 'symbol', 'timeframe')
+    ordering = ('-criado_em', 'ranking')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# Checkpoints dos bots: só consulta; apagar um faz o bot reiniciar do zero (com setup da conta)
+@admin.register(BotCheckpoint)
+class BotCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('user', 'versao', 'atualizado_em')
+    readonly_fields = ('user', 'versao', 'dados', 'atualizado_em')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# Sessões do profiler: criar uma sessão ativa liga o profiling nos workers na hora
+@admin.register(ProfileSession)
+class ProfileSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'escopo', 'bot', 'worker_id', 'status', 'iteracoes_feitas', 'iteracoes',
+                    'amostras', 'criado_em', 'link_download')
+    list_filter = ('status', 'escopo')
+    readonly_fields = ('status', 'iteracoes_feitas', 'amostras', 'criado_em', 'concluido_em', 'link_download')
+    exclude = ('stacks',)
+    actions = ('cancelar',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Os workers releem as sessões ativas ao receber o evento.
+        transaction.on_commit(lambda: publicar_evento(None, EVENTO_PROFILE))
+
+    def get_urls(self):
+        return [
+            path('<int:sessao_id>/download/', self.admin_site.admin_view(self.download),
+                 name='bot_profilesession_download'),
+        ] + super().get_urls()
+
+    def download(self, request, sessao_id):
+        sessao = get_object_or_404(ProfileSession, pk=sessao_id)
+        resposta = HttpResponse(sessao.stacks, content_type='text/plain; charset=utf-8')
+        resposta['Content-Disposition'] = f'attachment; filename="perfil-{sessao.pk}.folded"'
+        return resposta
+
+    @admin.display(description='Pilhas (collapsed)')
+    def link_download(self, obj):
+        if not obj.pk or not obj.stacks:
+            return '-'
+        return format_html('<a href="{}">baixar</a>', reverse('admin:bot_profilesession_download', args=[obj.pk]))
+
+    @admin.action(description='Encerrar sessões ativas (guarda as amostras já coletadas)')
+    def cancelar(self, request, queryset):
+        encerradas = sum(finalizar_sessao(sessao.id, status='cancelado') for sessao in queryset.filter(status='ativo'))
+        self.message_user(request, f"{encerradas} sessão(ões) encerrada(s).")
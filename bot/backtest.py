@@ -0,0 +1,196 @@
+import numpy as np
+
+from .indicators import ema_vetorizada
+from .market_data import INTERVALOS_MS
+from .ohlcv_store import fonte_store, get_ohlcv_store
+
+# ===================================================================
+# Backtest da estratégia EMA/pullback do TradingBot
+# ===================================================================
+
+COLUNAS_OHLCV = ("open_time", "open", "high", "low", "close", "volume")
+
+
+def carregar_ohlcv(caminho):
+    """
+    Lê candles de um CSV (formato das dumps de klines da Binance, com ou sem
+    cabeçalho), de um Parquet com as colunas de COLUNAS_OHLCV ou, se `caminho` é
+    "SYMBOL:timeframe" (ex: "BTCUSDT:1m"), do histórico local do `ingest_ohlcv`.
+
+    Returns:
+        dict: {"open_time": int64[], "open": float64[], ..., "volume": float64[]}
+
+    Raises:
+        ValueError: Se o histórico local de "SYMBOL:timeframe" está vazio.
+    """
+    fonte = fonte_store(caminho)
+    if fonte is not None:
+        # Views somente leitura sobre os arquivos mapeados: nada é copiado nem baixado.
+        dados = get_ohlcv_store().serie(*fonte).ler()
+        if len(dados["open_time"]) == 0:
+            raise ValueError(f"sem candles de {fonte[0]} {fonte[1]}; rode `manage.py ingest_ohlcv` antes.")
+        return dados
+    if str(caminho).endswith(".parquet"):
+        import pandas as pd  # só o Parquet precisa do pandas (e do pyarrow)
+
+        df = pd.read_parquet(caminho, columns=list(COLUNAS_OHLCV))
+        dados = {coluna: df[coluna].to_numpy(dtype=np.float64) for coluna in COLUNAS_OHLCV}
+    else:
+        with open(caminho) as arquivo:
+            primeira = arquivo.readline().split(",")[0].strip()
+        try:
+            float(primeira)
+            tem_cabecalho = False
+        except ValueError:
+            tem_cabecalho = True
+        matriz = np.loadtxt(
+            caminho, delimiter=",", skiprows=1 if tem_cabecalho else 0, usecols=range(6), ndmin=2
+        )
+        dados = {coluna: matriz[:, i] for i, coluna in enumerate(COLUNAS_OHLCV)}
+    dados["open_time"] = dados["open_time"].astype(np.int64)
+    return dados
+
+
+def reamostrar_closes(open_times, closes, timeframe):
+    """
+    Converte fechamentos de um timeframe menor (ex: 1m) para `timeframe`, pegando o
+    último fechamento de cada intervalo. O último candle pode estar incompleto.
+
+    Returns:
+        np.ndarray: Fechamentos no timeframe pedido.
+    """
+    intervalo_ms = INTERVALOS_MS[timeframe]
+    if len(open_times) == 0:
+        return np.asarray(closes, dtype=np.float64)
+    baldes = np.asarray(open_times, dtype=np.int64) // intervalo_ms
+    ultimos = np.flatnonzero(np.diff(baldes))
+    return np.asarray(closes, dtype=np.float64)[np.append(ultimos, len(baldes) - 1)]
+
+
+def executar_backtest(closes, ema_fast, ema_slow, quantidade_usdt=20.0, leverage=5,
+                      taxa=0.0004, slippage=0.0005, max_distancia_percent=3.0, capital_inicial=100.0):
+    """
+    Reproduz a máquina de estados do TradingBot sobre candles fechados.
+
+    Mesma semântica do `run_single_check`: IDLE abre no cruzamento se o preço estiver
+    a até `max_distancia_percent` da EMA lenta, senão espera o pullback; o sinal
+    pendente é cancelado se as EMAs desfizerem o cruzamento; em posição, o cruzamento
+    oposto fecha e abre o lado contrário na mesma checagem. A avaliação acontece no
+    fechamento de cada candle. Liquidação não é modelada (o bot usa margem cruzada).
+
+    Args:
+        closes: Fechamentos dos candles.
+        ema_fast, ema_slow (int): Períodos das EMAs.
+        quantidade_usdt (float): Margem por operação, como no BotControl.
+        leverage (int): Alavancagem; a posição vale quantidade_usdt * leverage.
+        taxa (float): Taxa por lado sobre o nocional (0.0004 = 0,04% taker).
+        slippage (float): Deslizamento contra a ordem, em fração do preço.
+        max_distancia_percent (float): Mesmo parâmetro da estratégia EmaPullback.
+        capital_inicial (float): Base da curva de capital para o drawdown percentual.
+
+    Returns:
+        dict: pnl_total, trades, win_rate, max_drawdown, max_drawdown_percent, taxas_pagas
+        e a lista de trades (índice de entrada/saída, lado, preços, PnL e `forcado`, o
+        fechamento no fim da série de uma posição ainda aberta).
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    fast = ema_vetorizada(closes, ema_fast)
+    slow = ema_vetorizada(closes, ema_slow)
+
+    # Tudo que não depende do estado é vetorizado; só a máquina de estados fica no loop.
+    fast_p, slow_p = fast[:-1], slow[:-1]
+    fast_a, slow_a = fast[1:], slow[1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cruzou_cima = np.concatenate(([False], (fast_p < slow_p) & (fast_a > slow_a)))
+        cruzou_baixo = np.concatenate(([False], (fast_p > slow_p) & (fast_a < slow_a)))
+        acima = fast > slow
+        abaixo = fast < slow
+        perto = np.abs(closes - slow) / slow * 100 <= max_distancia_percent
+
+    cruzou_cima, cruzou_baixo = cruzou_cima.tolist(), cruzou_baixo.tolist()
+    acima, abaixo, perto = acima.tolist(), abaixo.tolist(), perto.tolist()
+    precos = closes.tolist()
+
+    trades = []
+    estado = "IDLE"
+    pendente = None
+    posicao = None  # (lado, indice_entrada, preco_entrada, quantidade, taxa_entrada)
+    nocional = quantidade_usdt * leverage
+
+    def abrir(lado, i):
+        preco = precos[i] * (1 + slippage if lado == "long" else 1 - slippage)
+        quantidade = nocional / precos[i]
+        return (lado, i, preco, quantidade, preco * quantidade * taxa)
+
+    def fechar(pos, i, forcado=False):
+        lado, entrada_i, entrada, quantidade, taxa_entrada = pos
+        saida = precos[i] * (1 - slippage if lado == "long" else 1 + slippage)
+        bruto = (saida - entrada) * quantidade if lado == "long" else (entrada - saida) * quantidade
+        taxas = taxa_entrada + saida * quantidade * taxa
+        trades.append({
+            "lado": lado, "entrada_i": entrada_i, "saida_i": i,
+            "preco_entrada": entrada, "preco_saida": saida, "pnl": bruto - taxas, "taxas": taxas,
+            "forcado": forcado,
+        })
+
+    for i in range(max(ema_fast, ema_slow), len(precos)):
+        if estado == "IDLE":
+            sinal = "long" if cruzou_cima[i] else "short" if cruzou_baixo[i] else None
+            if sinal:
+                if perto[i]:
+                    posicao = abrir(sinal, i)
+                    estado = "IN_POSITION"
+                else:
+                    estado = "AWAITING_PULLBACK"
+                    pendente = sinal
+
+        elif estado == "AWAITING_PULLBACK":
+            valido = acima[i] if pendente == "long" else abaixo[i]
+            if not valido:
+                estado = "IDLE"
+                pendente = None
+            elif perto[i]:
+                posicao = abrir(pendente, i)
+                estado = "IN_POSITION"
+                pendente = None
+
+        elif estado == "IN_POSITION":
+            lado = posicao[0]
+            if (lado == "long" and abaixo[i]) or (lado == "short" and acima[i]):
+                fechar(posicao, i)
+                posicao = abrir("short" if lado == "long" else "long", i)
+
+    if posicao is not None:
+        # Posição aberta no fim da série é fechada no último preço para o relatório,
+        # marcada como `forcado`: a estratégia não mandou fechar ali.
+        fechar(posicao, len(precos) - 1, forcado=True)
+
+    return resumir_trades(trades, capital_inicial)
+
+
+def resumir_trades(trades, capital_inicial):
+    """
+    Métricas de uma lista de trades do backtest, na ordem em que foram fechados.
+
+    Returns:
+        dict: pnl_total, trades, win_rate, max_drawdown, max_drawdown_percent, taxas_pagas, lista_trades.
+    """
+    pnls = np.array([t["pnl"] for t in trades], dtype=np.float64)
+    if len(pnls) == 0:
+        return {
+            "pnl_total": 0.0, "trades": 0, "win_rate": 0.0, "max_drawdown": 0.0,
+            "max_drawdown_percent": 0.0, "taxas_pagas": 0.0, "lista_trades": [],
+        }
+    equity = capital_inicial + np.cumsum(pnls)
+    picos = np.maximum.accumulate(np.concatenate(([capital_inicial], equity)))[1:]
+    drawdowns = picos - equity
+    indice_pior = int(np.argmax(drawdowns))
+    return {
+        "pnl_total": round(float(pnls.sum()), 4),
+        "trades": int(len(pnls)),
+        "win_rate": round(float((pnls > 0).mean() * 100), 2),
+        "max_drawdown": round(float(drawdowns[indice_pior]), 4),
+        "max_drawdown_percent": round(float(drawdowns[indice_pior] / picos[indice_pior] * 100), 2),
+        "taxas_pagas": round(float(sum(t["taxas"] for t in trades)), 4),
+        "lista_trades": trades,
+    }
@@ -0,0 +1,367 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import Client as ClienteHttp
+from django.urls import reverse
+
+from .models import AccountFill, BotControl, UserProfile
+
+# ===================================================================
+# Microbenchmarks dos caminhos quentes do bot
+# ===================================================================
+
+# Cada amostra roda a função quantas vezes couber nesse tempo, para medir bem
+# operações de microssegundos sem inflar as lentas.
+TEMPO_MINIMO_AMOSTRA = 0.02  # segundos
+
+
+def medir(funcao, amostras=15):
+    """
+    Mede o tempo por chamada de `funcao`.
+
+    Returns:
+        dict: {"mediana_us", "p95_us", "iteracoes"} (iterações por amostra).
+    """
+    funcao()  # aquecimento (caches, imports, conexões)
+    iteracoes = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(iteracoes):
+            funcao()
+        decorrido = time.perf_counter() - inicio
+        if decorrido >= TEMPO_MINIMO_AMOSTRA or iteracoes >= 100_000:
+            break
+        iteracoes *= 2
+
+    tempos = [decorrido / iteracoes]
+    for _ in range(amostras - 1):
+        inicio = time.perf_counter()
+        for _ in range(iteracoes):
+            funcao()
+        tempos.append((time.perf_counter() - inicio) / iteracoes)
+    tempos.sort()
+    return {
+        "mediana_us": statistics.median(tempos) * 1e6,
+        "p95_us": tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))] * 1e6,
+        "iteracoes": iteracoes,
+    }
+
+
+def _passeio(n, seed=42):
+    rng = random.Random(seed)
+    closes = [100.0]
+    for _ in range(n - 1):
+        closes.append(closes[-1] * (1 + rng.gauss(0, 0.002)))
+    return closes
+
+
+def _criar_usuario(nome, symbol="BTCUSDT"):
+    user = User.objects.create(username=nome)
+    perfil = UserProfile.objects.create(
+        user=user, api_key=f"bench-{nome}", api_secret="bench",
+        telegram_bot_token="bench", telegram_chat_id="1",
+    )
+    control = BotControl.objects.create(user=user, symbol=symbol, timeframe="1m", ema_fast=6, ema_slow=12)
+    return user, perfil, control
+
+
+# --- Cenários ---
+# Cada cenário recebe as opções e gera pares (nome, função sem argumentos). Cenários com
+# preparação cara (usuários, milhares de linhas no banco) consultam `incluir(nome)` antes
+# de preparar, para que `--filtro` não pague o setup do que não vai rodar.
+
+def _incluir_todos(nome):
+    return True
+
+
+def cenarios_ema(janelas=(50, 200, 1000), **_):
+    try:
+        from .ema_analyzer import EmaAnalyzer
+    except ImportError as e:
+        print(f"[Benchmark] pandas_ta indisponível, pulando EmaAnalyzer: {e}")
+        return
+    for janela in janelas:
+        closes = _passeio(janela)
+
+        def ema(closes=closes):
+            analyzer = EmaAnalyzer(closes)
+            analyzer.calcular_ema(6)
+            analyzer.calcular_ema(12)
+
+        yield f"ema_analyzer[{janela}]", ema
+
+
+def cenarios_indicadores(janelas=(200, 1000), **_):
+    from .indicators import INDICADORES, IndicatorCache
+    from .market_data import CandleSeries
+
+    parametros = {"ema": {"period": 21}, "rsi": {}, "atr": {}, "bbands": {}}
+    for janela in janelas:
+        closes = np.array(_passeio(janela))
+        colunas = {"close": closes, "high": closes * 1.001, "low": closes * 0.999}
+        for nome, params in parametros.items():
+            yield f"indicador_{nome}[{janela}]", (
+                lambda nome=nome, params=params, colunas=colunas: INDICADORES[nome](colunas, **params)
+            )
+
+    # 50 bots no mesmo par e candle: só o primeiro calcula, os outros leem do cache.
+    closes = tuple(_passeio(200))
+    serie = CandleSeries("BTCUSDT", "1m", tuple(range(0, 60_000 * 200, 60_000)), closes, closes, closes, 200, 0)
+
+    def frota(serie=serie):
+        cache = IndicatorCache(capacidade=64)
+        for _ in range(50):
+            cache.obter(serie, "ema", period=6)
+            cache.obter(serie, "ema", period=12)
+
+    yield "indicadores_frota_50_bots", frota
+
+    # Custo por checagem das EMAs do EmaPullback com um candle novo a cada chamada (pior
+    # caso do incremental), contra recalcular a série de 200 candles como antes.
+    for nome, funcao in _checagens_ema(janela=200):
+        yield nome, funcao
+
+
+def _checagens_ema(janela, fast=6, slow=12, ticks=2000):
+    from .indicators import IndicatorCache, ema_vetorizada
+    from .market_data import CandleSeries
+
+    closes = _passeio(janela + ticks, seed=7)
+    open_times = list(range(0, 60_000 * len(closes), 60_000))
+    series = [
+        CandleSeries("BTCUSDT", "1m", tuple(open_times[t:t + janela]), tuple(closes[t:t + janela]),
+                     (), (), janela, 0)
+        for t in range(ticks)
+    ]
+    estado = {"cache": IndicatorCache(capacidade=64), "tick": 0}
+
+    def proxima_serie():
+        # Cada chamada vê a série um candle à frente; no fim, recomeça com um cache novo.
+        if estado["tick"] == ticks:
+            estado["cache"], estado["tick"] = IndicatorCache(capacidade=64), 0
+        serie = series[estado["tick"]]
+        estado["tick"] += 1
+        return serie
+
+    def incremental():
+        serie = proxima_serie()
+        estado["cache"].ema_atual(serie, fast)
+        estado["cache"].ema_atual(serie, slow)
+
+    def recalculando():
+        serie = proxima_serie()
+        ema_vetorizada(serie.closes[:-1], fast)
+        ema_vetorizada(serie.closes[:-1], slow)
+
+    yield f"ema_checagem_incremental[{janela}]", incremental
+    yield f"ema_checagem_recalculando[{janela}]", recalculando
+
+
+def cenarios_bot(incluir=_incluir_todos, **_):
+    from .bot_logic import TradingBot
+
+    if not (incluir("run_single_check") or incluir("obter_precisao_quantidade")):
+        return
+    _, perfil, control = _criar_usuario("bench_bot")
+    bot = TradingBot(control, perfil)
+    yield "run_single_check", bot.run_single_check
+    yield "obter_precisao_quantidade", bot.obter_precisao_quantidade
+
+
+def cenarios_telegram(**_):
+    from .telegram import enviar_notificacao
+
+    yield "enviar_notificacao", lambda: enviar_notificacao("*Benchmark* de envio", "bench", "1")
+
+
+def cenarios_dashboard(tamanhos_dashboard=(10, 1_000, 100_000), incluir=_incluir_todos, **_):
+    from .ledger import atualizar_resumo_diario
+
+    agora = datetime.now(dt_timezone.utc)
+    for tamanho in tamanhos_dashboard:
+        nome = f"dashboard[{tamanho}]"
+        if not incluir(nome):
+            continue
+        user, _, _ = _criar_usuario(f"bench_dash_{tamanho}")
+        rng = random.Random(tamanho)
+        # Fills espalhados pelos últimos 7 dias: é a janela que o dashboard agrega.
+        passo = timedelta(days=7) / tamanho
+        AccountFill.objects.bulk_create(
+            [
+                AccountFill(
+                    user=user, trade_id=i, order_id=i, symbol="BTCUSDT", side="BUY" if i % 2 else "SELL",
+                    price=100.0, qty=0.01, realized_pnl=rng.gauss(0, 1), commission=0.0004,
+                    commission_asset="USDT", time=agora - passo * (i + 1),
+                )
+                for i in range(tamanho)
+            ],
+            batch_size=5000,
+        )
+        atualizar_resumo_diario(user.id, {(agora - timedelta(days=d)).date() for d in range(8)})
+
+        navegador = ClienteHttp()
+        navegador.force_login(user)
+        url = reverse("dashboard")
+
+        def renderizar(navegador=navegador, url=url):
+            resposta = navegador.get(url)
+            if resposta.status_code != 200:
+                raise RuntimeError(f"dashboard respondeu {resposta.status_code}")
+
+        yield nome, renderizar
+
+
+CENARIOS = (cenarios_ema, cenarios_indicadores, cenarios_bot, cenarios_telegram, cenarios_dashboard)
+
+
+# --- Inicialização (processo Python novo) ---
+
+# Módulos pesados que não podem entrar no boot do web nem do worker.
+MODULOS_PROIBIDOS = ("pandas", "pandas_ta")
+AMOSTRAS_INICIALIZACAO = 5
+
+ALVOS_INICIALIZACAO = {
+    # O web só atende depois de carregar o URLconf (e com ele as views).
+    "inicializacao_wsgi": "import config.wsgi\nfrom django.urls import get_resolver\nget_resolver().url_patterns",
+    # O worker do Celery importa as tasks de todos os apps ao subir.
+    "inicializacao_celery": "from config.celery import app\napp.loader.import_default_modules()",
+}
+
+_SCRIPT_INICIALIZACAO = """
+import json, sys, time
+inicio = time.perf_counter()
+{codigo}
+segundos = time.perf_counter() - inicio
+# VmRSS e não ru_maxrss: no Linux o pico herdado do processo pai sobrevive ao exec.
+with open("/proc/self/status") as status:
+    rss_kb = next(int(linha.split()[1]) for linha in status if linha.startswith("VmRSS:"))
+print(json.dumps({{
+    "segundos": segundos,
+    "rss_mb": rss_kb / 1024,
+    "proibidos": [m for m in {proibidos!r} if m in sys.modules],
+}}))
+"""
+
+
+def medir_inicializacao(codigo, amostras=AMOSTRAS_INICIALIZACAO):
+    """
+    Mede o tempo de import e o RSS de um processo novo que executa `codigo`.
+
+    Returns:
+        dict: {"mediana_us", "p95_us", "iteracoes", "rss_mb", "proibidos"}, onde `proibidos`
+        lista os MODULOS_PROIBIDOS que foram carregados.
+
+    Raises:
+        RuntimeError: Se o processo falhar (ex: import quebrado).
+    """
+    script = _SCRIPT_INICIALIZACAO.format(codigo=codigo, proibidos=MODULOS_PROIBIDOS)
+    medidas = []
+    # A primeira rodada é descartada: compila os .pyc e aquece o cache de disco.
+    for rodada in range(amostras + 1):
+        processo = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        if processo.returncode != 0:
+            raise RuntimeError(f"Inicialização falhou: {processo.stderr.strip().splitlines()[-1:]}")
+        # Prints durante o import podem vir antes; o resultado é a última linha.
+        if rodada:
+            medidas.append(json.loads(processo.stdout.strip().splitlines()[-1]))
+    tempos = sorted(m["segundos"] for m in medidas)
+    return {
+        "mediana_us": statistics.median(tempos) * 1e6,
+        "p95_us": tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))] * 1e6,
+        "iteracoes": 1,
+        "rss_mb": statistics.median(m["rss_mb"] for m in medidas),
+        "proibidos": sorted({nome for m in medidas for nome in m["proibidos"]}),
+    }
+
+
+def executar(filtro=None, amostras=15, silenciar=True, **opcoes):
+    """
+    Roda os cenários. Precisa estar dentro de `simulator.ambiente_isolado`.
+
+    Args:
+        filtro (str): Só roda os benchmarks cujo nome contém o texto.
+        silenciar (bool): Descarta os prints do código medido.
+
+    Yields:
+        tuple: (nome, resultado de `medir`).
+    """
+    def incluir(nome):
+        return not filtro or filtro in nome
+
+    for cenario in CENARIOS:
+        with _saida(silenciar):
+            pares = list(cenario(incluir=incluir, **opcoes))
+        for nome, funcao in pares:
+            if not incluir(nome):
+                continue
+            with _saida(silenciar):
+                resultado = medir(funcao, amostras)
+            yield nome, resultado
+    for nome, codigo in ALVOS_INICIALIZACAO.items():
+        if not incluir(nome):
+            continue
+        yield nome, medir_inicializacao(codigo, min(amostras, AMOSTRAS_INICIALIZACAO))
+
+
+def _saida(silenciar):
+    return contextlib.redirect_stdout(io.StringIO()) if silenciar else contextlib.nullcontext()
+
+
+# --- Baselines ---
+
+CAMPOS_COMPARADOS = ("mediana_us", "rss_mb")
+
+def carregar_baseline(caminho):
+    """Resultados gravados em `caminho`, ou {} se o arquivo não existe."""
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho) as arquivo:
+        return json.load(arquivo).get("resultados", {})
+
+
+def salvar_baseline(caminho, resultados):
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    dados = {
+        "gerado_em": datetime.now(dt_timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+    with open(caminho, "w") as arquivo:
+        json.dump(dados, arquivo, indent=2, sort_keys=True)
+
+
+def comparar(resultados, baseline, limite):
+    """
+    Compara a mediana (e o RSS, nos benchmarks de inicialização) com o baseline.
+
+    Returns:
+        list: (nome, campo, base ou None, atual, variacao ou None, regrediu)
+    """
+    linhas = []
+    for nome, resultado in resultados.items():
+        for campo in CAMPOS_COMPARADOS:
+            if campo not in resultado:
+                continue
+            base = baseline.get(nome, {}).get(campo)
+            if not base:
+                linhas.append((nome, campo, None, resultado[campo], None, False))
+                continue
+            variacao = resultado[campo] / base - 1
+            linhas.append((nome, campo, base, resultado[campo], variacao, variacao > limite))
+    return linhas
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from binance.client import Client
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .weight_governor import ClienteGovernado
+
+_Entrada = namedtuple("_Entrada", ["client", "api_secret", "usado_em"])
+
+
+class BinanceClientPool:
+    """
+    Clientes da Binance reaproveitados por (api_key, testnet) dentro do processo.
+
+    Criar um `Client` abre uma sessão HTTP nova e faz um ping no servidor; aqui cada
+    credencial ganha um cliente único, sem ping, e todas as sessões usam o mesmo
+    HTTPAdapter, então as conexões TLS ficam vivas entre tasks e requisições e o
+    total por processo é limitado a BINANCE_POOL_CONNECTIONS por host (no mínimo
+    BOT_RUNNER_THREADS: com pool_block, uma thread sem conexão livre espera sem
+    timeout, e uma ordem ficaria atrás das checagens dos outros bots). No lugar do
+    ping, o pool mede o offset do relógio contra o `futures_time()` de tempos em
+    tempos e aplica em cada cliente entregue.
+
+    Clientes parados há mais de BINANCE_POOL_IDLE_SECONDS (ou os menos usados, acima de
+    BINANCE_POOL_MAX_CLIENTS) são descartados. Se o secret de uma chave mudar, o
+    cliente é recriado. Com BINANCE_WEIGHT_GOVERNOR_ENABLED, os clientes são
+    `ClienteGovernado`, que dividem o peso por minuto do IP entre todos os workers.
+    """
+    INTERVALO_LIMPEZA = 60  # segundos
+
+    def __init__(self, max_clientes=None, ocioso_segundos=None, conexoes=None, sincronizar_segundos=None,
+                 fabrica=None):
+        self.max_clientes = max_clientes or settings.BINANCE_POOL_MAX_CLIENTS
+        self.ocioso_segundos = ocioso_segundos or settings.BINANCE_POOL_IDLE_SECONDS
+        self.sincronizar_segundos = sincronizar_segundos or settings.BINANCE_TIME_SYNC_SECONDS
+        # fabrica(api_key, api_secret, testnet) substitui o Client real (ex: simulador no loadtest).
+        self.fabrica = fabrica
+        self.conexoes = conexoes or max(settings.BINANCE_POOL_CONNECTIONS, settings.BOT_RUNNER_THREADS)
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.conexoes, pool_block=True)
+        self._clientes = OrderedDict()  # (api_key, testnet) -> _Entrada
+        self._offsets = {}              # testnet -> (offset_ms, medido_em)
+        self._ultima_limpeza = time.monotonic()
+        self._mutex = threading.Lock()
+        self._mutex_relogio = threading.Lock()
+
+    def obter(self, api_key, api_secret, testnet=False):
+        """
+        Retorna o cliente da credencial, criando-o se preciso.
+
+        Args:
+            api_key (str): Chave de API do usuário.
+            api_secret (str): Secret correspondente.
+            testnet (bool): Ambiente de testes da Binance.
+        """
+        chave = (api_key, testnet)
+        agora = time.monotonic()
+        with self._mutex:
+            entrada = self._clientes.get(chave)
+            if entrada is None or entrada.api_secret != api_secret:
+                # Chave nova ou secret rotacionado.
+                client = self._criar(api_key, api_secret, testnet)
+            else:
+                client = entrada.client
+            self._clientes[chave] = _Entrada(client, api_secret, agora)
+            self._clientes.move_to_end(chave)
+            if agora - self._ultima_limpeza >= self.INTERVALO_LIMPEZA or len(self._clientes) > self.max_clientes:
+                self._limpar(agora)
+
+        client.timestamp_offset = self._offset(testnet)
+        return client
+
+    def descartar(self, api_key, testnet=False):
+        """Remove o cliente da chave (ex: chave revogada pelo usuário)."""
+        with self._mutex:
+            self._clientes.pop((api_key, testnet), None)
+
+    def __len__(self):
+        return len(self._clientes)
+
+    # --- Internos ---
+
+    def _criar(self, api_key, api_secret, testnet):
+        if self.fabrica is not None:
+            return self.fabrica(api_key, api_secret, testnet)
+        classe = ClienteGovernado if settings.BINANCE_WEIGHT_GOVERNOR_ENABLED else Client
+        client = classe(api_key, api_secret, testnet=testnet, ping=False)
+        client.session.mount("https://", self._adapter)
+        client.session.mount("http://", self._adapter)
+        return client
+
+    def _limpar(self, agora):
+        # Não fecha as sessões: o adapter (e suas conexões) é compartilhado.
+        for chave in [c for c, e in self._clientes.items() if agora - e.usado_em > self.ocioso_segundos]:
+            del self._clientes[chave]
+        while len(self._clientes) > self.max_clientes:
+            self._clientes.popitem(last=False)
+        self._ultima_limpeza = agora
+
+    def _offset(self, testnet):
+        offset, medido_em = self._offsets.get(testnet, (0, None))
+        if medido_em is not None and time.monotonic() - medido_em < self.sincronizar_segundos:
+            return offset
+        # Só uma thread mede; as outras seguem com o offset anterior.
+        if not self._mutex_relogio.acquire(blocking=medido_em is None):
+            return offset
+        try:
+            offset, medido_em = self._offsets.get(testnet, (0, None))
+            if medido_em is not None and time.monotonic() - medido_em < self.sincronizar_segundos:
+                return offset
+            relogio = self._criar(None, None, testnet)
+            antes = time.time() * 1000
+            servidor = relogio.futures_time()["serverTime"]
+            depois = time.time() * 1000
+            offset = int(servidor - (antes + depois) / 2)
+            self._offsets[testnet] = (offset, time.monotonic())
+            return offset
+        except Exception as e:
+            print(f"[BinancePool] Não foi possível sincronizar o relógio com a Binance: {e}")
+            # Tenta de novo só no próximo intervalo para não pagar o timeout a cada ordem.
+            self._offsets[testnet] = (offset, time.monotonic())
+            return offset
+        finally:
+            self._mutex_relogio.release()
+
+
+_pool = None
+_pool_mutex = threading.Lock()
+
+
+def get_binance_pool():
+    """Retorna o pool de clientes da Binance do processo, criando-o na primeira chamada."""
+    global _pool
+    with _pool_mutex:
+        if _pool is None:
+            _pool = BinanceClientPool()
+    return _pool
+
+
+def get_client(api_key, api_secret, testnet=False):
+    """Atalho para `get_binance_pool().obter(...)`."""
+    return get_binance_pool().obter(api_key, api_secret, testnet)
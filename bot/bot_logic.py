@@ -1,51 +1,52 @@
+import random
 import time
-import math
-import numpy as np
-import pandas as pd
-import pandas_ta as ta
+from decimal import Decimal
 
-from binance.client import Client
 from binance.exceptions import BinanceAPIException
 from django.conf import settings
-from django.utils import timezone
+from django.db import connection
 
 # Importa os modelos e a função de notificação
-from .models import Trade
-from .telegram import enviar_notificacao
+from .binance_pool import get_client
+from .checkpoint import CheckpointBot, normalizar
+from .exchange_info import get_symbol_registry
+from .indicators import get_indicator_cache
+from .market_data import get_market_data_hub
+from .metrics import BUCKETS_QUERIES, ContadorQueries, get_metrics
+from .profiler import get_profiler
+from .strategies import ABRIR, AGUARDAR, CANCELAR, FECHAR, REVERTER, Contexto, criar_estrategia
+from .telegram import enviar_notificacao_async
+from .trade_store import TradeBatch, buscar_trade_aberto, registrar_abertura, registrar_fechamento
+from .user_stream import get_user_streams
+from .weight_governor import prioridade_binance
 
 # ===================================================================
-# CLASSE 1: EmaAnalyzer (sem alterações)
-# ===================================================================
-class EmaAnalyzer:
-    def __init__(self, prices):
-        self.prices = np.array(prices)
-
-    def calcular_ema(self, period):
-        if len(self.prices) < period:
-            return []
-        df = pd.DataFrame(self.prices, columns=["close"])
-        return ta.ema(df["close"], length=period).dropna().tolist()
-
-# ===================================================================
-# CLASSE 2: BinanceTrader (sem alterações)
+# CLASSE 1: BinanceTrader
 # ===================================================================
 class BinanceTrader:
-    def __init__(self, api_key, api_secret):
-        self.client = Client(api_key, api_secret, testnet=True)
+    def __init__(self, api_key, api_secret, rotulos=None):
+        # Cliente compartilhado do pool do processo (sessão keep-alive, sem ping).
+        self.client = get_client(api_key, api_secret, testnet=True)
+        self.rotulos = rotulos or {}
 
     def market_order(self, symbol, side, quantity_str, reduceOnly=False):
         try:
             print(f"Enviando ordem: {symbol}, {side}, {quantity_str}, reduceOnly={reduceOnly}")
-            ordem = self.client.futures_create_order(
-                symbol=symbol, side=side, type='MARKET', quantity=quantity_str, reduceOnly=reduceOnly
-            )
+            # RESULT devolve avgPrice/executedQty da execução, sem precisar consultar depois.
+            with get_metrics().cronometrar("bot_order_submit_seconds", **self.rotulos):
+                ordem = self.client.futures_create_order(
+                    symbol=symbol, side=side, type='MARKET', quantity=quantity_str, reduceOnly=reduceOnly,
+                    newOrderRespType='RESULT'
+                )
             print(f"Ordem {side} enviada com sucesso para {symbol}.")
             return ordem
         except BinanceAPIException as e:
             print(f"Erro de API da Binance: {e.message}")
+            get_metrics().incrementar("bot_errors_total", etapa="ordem", tipo=f"binance_{e.code}")
             return None
         except Exception as e:
             print(f"Erro inesperado ao enviar ordem: {e}")
+            get_metrics().incrementar("bot_errors_total", etapa="ordem", tipo=type(e).__name__)
             return None
 
     def get_current_price(self, symbol):
@@ -56,7 +57,7 @@ class BinanceTrader:
             return None
             
 # ===================================================================
-# CLASSE 3: TradingBot (com lógica para registrar trades)
+# CLASSE 2: TradingBot (com lógica para registrar trades)
 # ===================================================================
 class TradingBot:
     def __init__(self, control_params, user_profile):
@@ -64,190 +65,469 @@ class TradingBot:
         self.quantidade_usdt = float(control_params.quantidade_usdt)
         self.leverage = control_params.leverage
         self.timeframe = control_params.timeframe
-        self.ema_fast_period = control_params.ema_fast
-        self.ema_slow_period = control_params.ema_slow
         self.user_profile = user_profile
-        self.trader = BinanceTrader(user_profile.api_key, user_profile.api_secret)
+        # Rótulo das métricas por bot; sem ele, só os agregados.
+        self.rotulos = {"bot": str(user_profile.user_id)} if settings.METRICS_PER_BOT else {}
+        self.trader = BinanceTrader(user_profile.api_key, user_profile.api_secret, self.rotulos)
+        self.serie = None
         self.prices = []
-        
-        try:
-            self.trader.client.futures_change_leverage(symbol=self.symbol, leverage=self.leverage)
-            self.trader.client.futures_change_margin_type(symbol=self.symbol, marginType="CROSSED")
-        except Exception as e:
-            print(f"[{self.symbol}] Aviso ao configurar: {e}")
+        self.open_times = []
+        # A estratégia só decide; ordens e estado continuam aqui no bot.
+        self.estrategia = criar_estrategia(control_params)
+        # Livro de posições do user data stream (trades manuais, liquidações, app).
+        self.user_stream = (
+            get_user_streams().obter(user_profile.user_id, self.trader.client)
+            if settings.USER_STREAM_ENABLED else None
+        )
 
         self.estado = "IDLE"
         self.posicao_atual_tipo = None
         self.sinal_pendente_tipo = None
         self.preco_entrada = 0.0
         self.quantidade_em_moeda = 0.0
-        self.MAX_DISTANCE_FROM_EMA_PERCENT = 3.0
-        
-        self.atualizar_estado_posicao()
+        # Alavancagem/margem já aplicadas na Binance: {"symbol", "leverage", "em"}.
+        self.conta_configurada = None
+        # Com a posição vinda do checkpoint, quando conferi-la na Binance (None: já conferida).
+        self.verificar_posicao_em = None
+
+        self.checkpoint = CheckpointBot(user_profile.user_id) if settings.BOT_CHECKPOINT_ENABLED else None
+        salvo = self.checkpoint.carregar() if self.checkpoint is not None else None
+        if salvo is not None:
+            self._restaurar_checkpoint(*salvo)
+        if not self._conta_ja_configurada():
+            self.configurar_conta()
+        if self.verificar_posicao_em is None:
+            self.atualizar_estado_posicao()
+        self._salvar_checkpoint()
+
+    def configurar_conta(self):
+        try:
+            self.trader.client.futures_change_leverage(symbol=self.symbol, leverage=self.leverage)
+            try:
+                self.trader.client.futures_change_margin_type(symbol=self.symbol, marginType="CROSSED")
+            except BinanceAPIException as e:
+                if e.code != -4046:  # -4046: a margem já é CROSSED
+                    raise
+            self.conta_configurada = {"symbol": self.symbol, "leverage": self.leverage, "em": time.time()}
+        except Exception as e:
+            print(f"[{self.symbol}] Aviso ao configurar: {e}")
+
+    def _conta_ja_configurada(self):
+        """True se o checkpoint mostra alavancagem e margem já aplicadas para o símbolo atual, há pouco tempo."""
+        conta = self.conta_configurada
+        return (
+            conta is not None
+            and (conta["symbol"], conta["leverage"]) == (self.symbol, self.leverage)
+            and time.time() - conta["em"] < settings.BOT_CHECKPOINT_CONFIG_TTL_SECONDS
+        )
+
+    # --- Checkpoint (retomada após restart) ---
+
+    def _snapshot(self):
+        return {
+            "symbol": self.symbol,
+            "timeframe": self.timeframe,
+            "estrategia": self.estrategia.nome,
+            "parametros": self.estrategia.parametros_indicadores(),
+            "estado": self.estado,
+            "sinal_pendente": self.sinal_pendente_tipo,
+            "posicao_tipo": self.posicao_atual_tipo,
+            "quantidade": self.quantidade_em_moeda,
+            "preco_entrada": self.preco_entrada,
+            "conta": self.conta_configurada,
+        }
+
+    def _salvar_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.salvar(self._snapshot())
+
+    def _restaurar_checkpoint(self, dados, idade):
+        """
+        Retoma o estado salvo, no que ele ainda vale para a configuração atual.
+
+        Outro símbolo invalida tudo. Outro timeframe ou estratégia invalida só o sinal
+        pendente (como no `reconfigurar`). Um checkpoint recente vale como posição atual
+        e a conferência na Binance é sorteada nos próximos minutos, para a frota inteira
+        não consultar a posição no mesmo segundo após um deploy.
+        """
+        if dados["symbol"] != self.symbol:
+            return
+        self.conta_configurada = dados["conta"]
+        self.estado = dados["estado"]
+        self.posicao_atual_tipo = dados["posicao_tipo"]
+        self.quantidade_em_moeda = dados["quantidade"]
+        self.preco_entrada = dados["preco_entrada"]
+        self.sinal_pendente_tipo = dados["sinal_pendente"]
+        mesmos_indicadores = (
+            dados["timeframe"] == self.timeframe
+            and dados["estrategia"] == self.estrategia.nome
+            and dados["parametros"] == normalizar(self.estrategia.parametros_indicadores())
+        )
+        if self.estado == "AWAITING_PULLBACK" and not mesmos_indicadores:
+            self.estado = "IDLE"
+            self.sinal_pendente_tipo = None
+        if idade < settings.BOT_CHECKPOINT_TRUST_SECONDS:
+            self.verificar_posicao_em = time.time() + random.uniform(0, settings.BOT_CHECKPOINT_VERIFY_SPREAD_SECONDS)
+        print(f"[{self.symbol}] Estado retomado do checkpoint ({idade:.0f}s): {self.estado}"
+              f"{' | sinal ' + self.sinal_pendente_tipo if self.sinal_pendente_tipo else ''}"
+              f"{' | ' + self.posicao_atual_tipo if self.posicao_atual_tipo else ''}")
+
+    def _conferir_posicao(self):
+        """Confere na Binance a posição que veio do checkpoint. Returns: True se conferiu."""
+        if self.atualizar_estado_posicao():
+            self.verificar_posicao_em = None
+            return True
+        return False
+
+    def reconfigurar(self, control_params):
+        """
+        Aplica novas configurações do BotControl sem reiniciar o bot.
+
+        Troca de símbolo com posição aberta é recusada (a posição ficaria sem dono);
+        os demais parâmetros são aplicados normalmente.
+        """
+        novo_symbol = control_params.symbol.upper()
+        if novo_symbol != self.symbol and self.estado == "IN_POSITION":
+            print(f"[{self.symbol}] Troca para {novo_symbol} ignorada: há posição aberta. Feche-a antes de trocar o símbolo.")
+            novo_symbol = self.symbol
+
+        mudou_symbol = novo_symbol != self.symbol
+        mudou_alavancagem = control_params.leverage != self.leverage
+        nova_estrategia = criar_estrategia(control_params)
+        mudou_indicadores = (
+            mudou_symbol
+            or control_params.timeframe != self.timeframe
+            or nova_estrategia.nome != self.estrategia.nome
+            or nova_estrategia.parametros_indicadores() != self.estrategia.parametros_indicadores()
+        )
+
+        self.symbol = novo_symbol
+        self.quantidade_usdt = float(control_params.quantidade_usdt)
+        self.leverage = control_params.leverage
+        self.timeframe = control_params.timeframe
+
+        if mudou_indicadores:
+            self.serie = None
+            self.prices = []
+            self.open_times = []
+            self.estrategia = nova_estrategia
+            # Um sinal pendente calculado com os indicadores antigos não vale mais.
+            if self.estado == "AWAITING_PULLBACK":
+                self.estado = "IDLE"
+                self.sinal_pendente_tipo = None
+
+        if mudou_symbol or mudou_alavancagem:
+            self.configurar_conta()
+        if mudou_symbol:
+            self.verificar_posicao_em = None
+            self.atualizar_estado_posicao()
+        self._salvar_checkpoint()
+
+        print(f"[{self.symbol}] Configuração aplicada: {self.timeframe} | {self.estrategia.descricao()} | {self.leverage}x | {self.quantidade_usdt} USDT")
 
     def carregar_precos_historicos(self):
         try:
-            limit = max(200, self.ema_slow_period * 2)
-            candles = self.trader.client.futures_klines(symbol=self.symbol, interval=self.timeframe, limit=limit)
-            self.prices = [float(c[4]) for c in candles]
+            limit = max(200, self.estrategia.candles_necessarios() * 2)
+            # A série vem do hub compartilhado: bots no mesmo symbol/timeframe
+            # reaproveitam a mesma busca em vez de chamar futures_klines cada um.
+            with get_metrics().cronometrar("bot_kline_fetch_seconds", **self.rotulos):
+                serie = get_market_data_hub().obter_candles(self.trader.client, self.symbol, self.timeframe, limit)
+            self.serie = serie
+            self.prices = serie.closes[-limit:]
+            self.open_times = serie.open_times[-limit:]
         except Exception as e:
             print(f"[{self.symbol}] Erro ao carregar históricos: {e}")
+            get_metrics().incrementar("bot_errors_total", etapa="klines", tipo=type(e).__name__)
 
     def atualizar_estado_posicao(self):
+        """Returns: False se a posição não pôde ser lida (o estado local fica como estava)."""
+        # Com o user data stream conectado, a posição vem do livro local, sem REST.
+        if self._sincronizar_com_livro():
+            return True
         try:
             posicoes = self.trader.client.futures_position_information(symbol=self.symbol)
-            posicao_encontrada = False
+            quantidade, entrada = 0.0, 0.0
             for pos in posicoes:
                 if pos["symbol"] == self.symbol and float(pos["positionAmt"]) != 0:
-                    quantidade = float(pos["positionAmt"])
-                    novo_tipo = "long" if quantidade > 0 else "short"
-                    if self.estado == "IDLE":
-                        self.estado = "IN_POSITION"
-                    self.posicao_atual_tipo = novo_tipo
-                    self.quantidade_em_moeda = abs(quantidade)
-                    self.preco_entrada = float(pos["entryPrice"])
-                    posicao_encontrada = True
+                    quantidade, entrada = float(pos["positionAmt"]), float(pos["entryPrice"])
                     break
-
-            if not posicao_encontrada and self.estado == "IN_POSITION":
-                self.estado = "IDLE"
-                self.posicao_atual_tipo = None
-                self.quantidade_em_moeda = 0.0
+            self._aplicar_posicao(quantidade, entrada)
+            return True
         except Exception as e:
             print(f"[{self.symbol}] Erro ao atualizar estado da posição: {e}")
+            get_metrics().incrementar("bot_errors_total", etapa="posicao", tipo=type(e).__name__)
+            return False
+
+    def _sincronizar_com_livro(self):
+        """Aplica a posição do user data stream. Returns: False se o livro não é confiável agora."""
+        posicao = self.user_stream.posicao(self.symbol) if self.user_stream is not None else None
+        if posicao is None:
+            return False
+        quantidade_antes, tipo_antes = self.quantidade_em_moeda, self.posicao_atual_tipo
+        self._aplicar_posicao(posicao["amt"], posicao["entrada"])
+        self.verificar_posicao_em = None  # o livro já confirma a posição do checkpoint
+        if (self.posicao_atual_tipo, self.quantidade_em_moeda) != (tipo_antes, quantidade_antes):
+            print(f"[{self.symbol}] Posição mudou fora do bot: {tipo_antes} {quantidade_antes} -> "
+                  f"{self.posicao_atual_tipo} {self.quantidade_em_moeda}")
+        return True
+
+    def _aplicar_posicao(self, quantidade, entrada):
+        if quantidade != 0:
+            if self.estado == "IDLE":
+                self.estado = "IN_POSITION"
+            self.posicao_atual_tipo = "long" if quantidade > 0 else "short"
+            self.quantidade_em_moeda = abs(quantidade)
+            self.preco_entrada = entrada
+        elif self.estado == "IN_POSITION":
+            self.estado = "IDLE"
+            self.posicao_atual_tipo = None
+            self.quantidade_em_moeda = 0.0
+
+    def encerrar(self):
+        """Libera os recursos compartilhados do bot (user data stream) ao parar."""
+        if self.user_stream is not None:
+            get_user_streams().liberar(self.user_profile.user_id)
+            self.user_stream = None
+
+    def obter_filtros_simbolo(self):
+        # Filtros vêm do registro compartilhado: nenhuma chamada de rede no caminho da ordem.
+        return get_symbol_registry(self.trader.client).obter(self.symbol, self.trader.client)
 
     def obter_precisao_quantidade(self):
-        try:
-            info = self.trader.client.futures_exchange_info()
-            for symbol_info in info["symbols"]:
-                if symbol_info["symbol"] == self.symbol:
-                    return int(symbol_info["quantityPrecision"])
-            return 3
-        except:
+        filtros = self.obter_filtros_simbolo()
+        if filtros is None:
+            print(f"[{self.symbol}] AVISO: filtros do símbolo indisponíveis, usando precisão 3.")
             return 3
+        return filtros.quantity_precision
+
+    def formatar_quantidade(self, quantidade, preco=None):
+        filtros = self.obter_filtros_simbolo()
+        if filtros is None:
+            print(f"[{self.symbol}] AVISO: filtros do símbolo indisponíveis, usando precisão 3.")
+            return f"{quantidade:.3f}"
+        return get_symbol_registry(self.trader.client).formatar_quantidade(filtros, quantidade, preco)
+
+    def _dados_execucao(self, ordem):
+        """
+        Preço médio e quantidade executada a partir da resposta da ordem (RESULT).
+
+        Returns:
+            tuple: (preco_medio, quantidade_executada). O preço cai para o ticker só se
+            a Binance não informar avgPrice.
+        """
+        preco = float(ordem.get("avgPrice") or 0)
+        quantidade = float(ordem.get("executedQty") or 0)
+        if preco <= 0:
+            preco = self.trader.get_current_price(self.symbol)
+        return preco, quantidade
+
+    def _definir_posicao(self, tipo, quantidade, preco):
+        """Atualiza o estado local com a posição resultante da ordem, sem consultar a Binance."""
+        if tipo and quantidade > 0:
+            self.estado = "IN_POSITION"
+            self.posicao_atual_tipo = tipo
+            self.quantidade_em_moeda = quantidade
+            self.preco_entrada = preco
+        else:
+            self.estado = "IDLE"
+            self.posicao_atual_tipo = None
+            self.quantidade_em_moeda = 0.0
+            self.preco_entrada = 0.0
 
     def fechar_posicao_atual(self, motivo):
         if not self.posicao_atual_tipo: return False
         
         side = "SELL" if self.posicao_atual_tipo == "long" else "BUY"
-        precisao = self.obter_precisao_quantidade()
-        qtd_str = f"{self.quantidade_em_moeda:.{precisao}f}"
-        
-        trade_aberto = Trade.objects.filter(user=self.user_profile.user, symbol=self.symbol, is_open=True).first()
+        qtd_str = self.formatar_quantidade(self.quantidade_em_moeda)
+        if qtd_str is None:
+            print(f"[{self.symbol}] Quantidade {self.quantidade_em_moeda} abaixo do mínimo do símbolo. Nada a fechar.")
+            return False
 
         order_result = self.trader.market_order(self.symbol, side, qtd_str, reduceOnly=True)
         
         if order_result:
-            enviar_notificacao(
+            enviar_notificacao_async(
                 f"🚨 *Posição Fechada* 🚨\nSímbolo: `{self.symbol}`\nMotivo: {motivo}",
                 token=self.user_profile.telegram_bot_token, chat_id=self.user_profile.telegram_chat_id
             )
-            
-            if trade_aberto:
-                preco_saida = self.trader.get_current_price(self.symbol)
-                if preco_saida:
-                    pnl_usdt = (preco_saida - trade_aberto.entry_price) * trade_aberto.quantity
-                    if self.posicao_atual_tipo == 'short': pnl_usdt = -pnl_usdt
-                    
-                    margem_inicial = (trade_aberto.entry_price * trade_aberto.quantity) / self.leverage
-                    pnl_percent = (pnl_usdt / margem_inicial) * 100 if margem_inicial > 0 else 0
-
-                    trade_aberto.exit_price = preco_saida
-                    trade_aberto.exit_timestamp = timezone.now()
-                    trade_aberto.pnl = pnl_usdt
-                    trade_aberto.pnl_percent = pnl_percent
-                    trade_aberto.is_open = False
-                    trade_aberto.save()
 
+            preco_saida, _ = self._dados_execucao(order_result)
+            trade_aberto = buscar_trade_aberto(self.user_profile.user, self.symbol)
+            if trade_aberto and preco_saida:
+                registrar_fechamento(trade_aberto, preco_saida, self.leverage)
+            self._definir_posicao(None, 0.0, 0.0)
             return True
         
         print("Falha ao fechar a posição.")
         return False
-            
-    def _is_price_near_ema(self, price, ema):
-        if ema == 0: return False
-        distance_percent = (abs(price - ema) / ema) * 100
-        return distance_percent <= self.MAX_DISTANCE_FROM_EMA_PERCENT
 
+    def reverter_posicao(self, novo_tipo, preco_atual, motivo):
+        """
+        Inverte a posição com uma única ordem a mercado do tamanho atual + o novo.
+
+        Na Binance em modo one-way, a ordem oposta com o dobro do tamanho fecha a
+        posição e abre a contrária numa só execução: um round trip, sem espera entre
+        fechar e abrir. O preço médio da execução vira a saída do trade antigo e a
+        entrada do novo.
+
+        O tamanho da perna que fecha vem da posição conferida agora (livro do user data
+        stream ou Binance), não do estado local: um valor velho do checkpoint, ou uma
+        posição mexida fora do bot, faria a ordem abrir mais (ou menos) que o pedido.
+        """
+        if not self.atualizar_estado_posicao():
+            print(f"[{self.symbol}] Posição não conferida; reversão adiada para a próxima checagem.")
+            return
+        if self.posicao_atual_tipo is None:
+            # Fechada fora do bot: não há o que inverter, só abre o lado novo.
+            print(f"[{self.symbol}] Nenhuma posição aberta na Binance; abrindo {novo_tipo} direto.")
+            self._abrir_posicao(novo_tipo, preco_atual)
+            return
+        if self.posicao_atual_tipo == novo_tipo:
+            print(f"[{self.symbol}] Posição já está {novo_tipo}; nada a reverter.")
+            return
+
+        qtd_atual = self.formatar_quantidade(self.quantidade_em_moeda)
+        qtd_nova = self.formatar_quantidade((self.quantidade_usdt * self.leverage) / preco_atual, preco_atual)
+        if qtd_atual is None or qtd_nova is None:
+            # Uma das pernas fica abaixo do mínimo: faz em duas ordens.
+            if self.fechar_posicao_atual(motivo):
+                self._abrir_posicao(novo_tipo, preco_atual)
+            return
+
+        side = "BUY" if novo_tipo == "long" else "SELL"
+        qtd_total = str(Decimal(qtd_atual) + Decimal(qtd_nova))
+        order_result = self.trader.market_order(self.symbol, side, qtd_total)
+        if not order_result:
+            print("Falha ao reverter a posição.")
+            return
+
+        preco, executada = self._dados_execucao(order_result)
+        if preco and executada >= float(qtd_atual):
+            quantidade_nova = round(executada - float(qtd_atual), 12)
+            trade_aberto = buscar_trade_aberto(self.user_profile.user, self.symbol)
+            with TradeBatch() as lote:
+                if trade_aberto:
+                    lote.fechar(trade_aberto, preco, self.leverage)
+                if quantidade_nova > 0:
+                    lote.abrir(self.user_profile.user, self.symbol, novo_tipo, preco, quantidade_nova)
+            self._definir_posicao(novo_tipo, quantidade_nova, preco)
+        else:
+            # Execução parcial, sem executedQty ou sem preço: os trades ficam como estão e
+            # a posição real vem da Binance (ou é conferida na próxima checagem).
+            print(f"[{self.symbol}] Reversão executou {executada} de {qtd_total} (preço {preco}). Conferindo posição.")
+            if not self.atualizar_estado_posicao():
+                self.verificar_posicao_em = time.time()
+
+        enviar_notificacao_async(
+            f"🔄 *Posição Revertida*\nSímbolo: `{self.symbol}`\nMotivo: {motivo}\n"
+            f"Novo lado: *{novo_tipo.upper()}*\nPreço médio: `{preco}`",
+            token=self.user_profile.telegram_bot_token, chat_id=self.user_profile.telegram_chat_id
+        )
+            
     def _abrir_posicao(self, sinal_tipo, preco_atual):
-        precisao = self.obter_precisao_quantidade()
         quantidade_moeda = (self.quantidade_usdt * self.leverage) / preco_atual
-        qtd_str = f"{quantidade_moeda:.{precisao}f}"
+        qtd_str = self.formatar_quantidade(quantidade_moeda, preco_atual)
+        if qtd_str is None:
+            print(f"[{self.symbol}] Quantidade {quantidade_moeda} abaixo do minQty/minNotional do símbolo. Ordem não enviada.")
+            return False
         side = "BUY" if sinal_tipo == "long" else "SELL"
         
         order_result = self.trader.market_order(self.symbol, side, qtd_str)
         if order_result:
-            enviar_notificacao(
+            enviar_notificacao_async(
                 f"✅ *Posição Aberta*\nSímbolo: `{self.symbol}`\nTipo: *{sinal_tipo.upper()}*",
                 token=self.user_profile.telegram_bot_token, chat_id=self.user_profile.telegram_chat_id
             )
-            # Salva o novo trade no banco de dados
-            Trade.objects.create(
-                user=self.user_profile.user,
-                symbol=self.symbol,
-                side=sinal_tipo,
-                entry_price=self.trader.get_current_price(self.symbol),
-                quantity=float(qtd_str)
+            # Preço e quantidade vêm da própria execução, sem consultar a Binance de novo.
+            preco_entrada, executada = self._dados_execucao(order_result)
+            quantidade = executada or float(qtd_str)
+            if not preco_entrada:
+                # Sem avgPrice nem ticker: a entrada vem da posição na Binance.
+                print(f"[{self.symbol}] Ordem sem preço de execução. Conferindo posição.")
+                if not self.atualizar_estado_posicao():
+                    self.verificar_posicao_em = time.time()
+                    return True
+                if self.posicao_atual_tipo != sinal_tipo or not self.preco_entrada:
+                    return True
+                preco_entrada, quantidade = self.preco_entrada, self.quantidade_em_moeda
+            registrar_abertura(
+                self.user_profile.user, self.symbol, sinal_tipo,
+                entry_price=preco_entrada, quantity=quantidade,
             )
-            self.atualizar_estado_posicao()
+            self._definir_posicao(sinal_tipo, quantidade, preco_entrada)
             return True
         return False
 
     def run_single_check(self):
+        # Mede o ciclo inteiro (tempo, queries no banco, erros) em volta da estratégia.
+        metricas = get_metrics()
+        queries = ContadorQueries()
+        inicio = time.perf_counter()
+        try:
+            # Com uma ProfileSession ativa para este bot (ou worker), a checagem é amostrada.
+            with connection.execute_wrapper(queries), get_profiler().perfilar("bot", self.user_profile.user_id):
+                try:
+                    self._checar()
+                finally:
+                    # Só grava se a checagem mudou o estado (sinal, entrada, saída).
+                    self._salvar_checkpoint()
+        except Exception as e:
+            metricas.incrementar("bot_errors_total", etapa="ciclo", tipo=type(e).__name__)
+            raise
+        finally:
+            metricas.observar("bot_cycle_seconds", time.perf_counter() - inicio, **self.rotulos)
+            metricas.observar("bot_cycle_db_queries", queries.total, buckets=BUCKETS_QUERIES, **self.rotulos)
+
+    def _checar(self):
+        # Trades manuais e liquidações aparecem antes da estratégia, não depois.
+        self._sincronizar_com_livro()
+        if self.verificar_posicao_em is not None and time.time() >= self.verificar_posicao_em:
+            self._conferir_posicao()
         print(f"\n--- [{self.symbol} | {self.timeframe}] Checando... Estado: {self.estado} ---")
         self.carregar_precos_historicos()
-        if len(self.prices) < self.ema_slow_period: return
+        if self.serie is None or len(self.prices) <= self.estrategia.candles_necessarios(): return
 
         preco_atual = self.prices[-1]
-        analyzer = EmaAnalyzer(self.prices)
-        ema_fast = analyzer.calcular_ema(self.ema_fast_period)
-        ema_slow = analyzer.calcular_ema(self.ema_slow_period)
-        if len(ema_fast) < 2 or len(ema_slow) < 2: return
+        contexto = Contexto(
+            serie=self.serie, preco_atual=preco_atual, estado=self.estado,
+            posicao_tipo=self.posicao_atual_tipo, sinal_pendente=self.sinal_pendente_tipo,
+            indicadores=get_indicator_cache(),
+        )
+        # Os indicadores saem do cache compartilhado: calculados uma vez por candle
+        # para todos os bots no mesmo symbol/timeframe.
+        with get_metrics().cronometrar("bot_indicator_seconds", **self.rotulos):
+            decisao = self.estrategia.decidir(contexto)
+        if decisao is not None:
+            self._executar_decisao(decisao, preco_atual)
 
-        ema_fast_a, ema_fast_p = ema_fast[-1], ema_fast[-2]
-        ema_slow_a, ema_slow_p = ema_slow[-1], ema_slow[-2]
-        
-        print(f"[{self.symbol}] Preço: {preco_atual:.4f} | EMA Rápida: {ema_fast_a:.4f} | EMA Lenta: {ema_slow_a:.4f}")
+    def _executar_decisao(self, decisao, preco_atual):
+        if decisao.acao in (ABRIR, REVERTER, FECHAR):
+            # Tudo no caminho da ordem (conferir a posição, preço de fallback) passa como
+            # ordem no governador de peso: não espera janela nem fica atrás do dashboard.
+            with prioridade_binance("ordem"):
+                self._executar_ordem(decisao, preco_atual)
+            return
+        if decisao.acao == AGUARDAR:
+            print(decisao.motivo)
+            self.estado = "AWAITING_PULLBACK"
+            self.sinal_pendente_tipo = decisao.lado
+        elif decisao.acao == CANCELAR:
+            print(decisao.motivo)
+            self.estado = "IDLE"
+            self.sinal_pendente_tipo = None
 
-        if self.estado == "IDLE":
-            cruzou_para_cima = ema_fast_p < ema_slow_p and ema_fast_a > ema_slow_a
-            cruzou_para_baixo = ema_fast_p > ema_slow_p and ema_fast_a < ema_slow_a
-            sinal_tipo = "long" if cruzou_para_cima else "short" if cruzou_para_baixo else None
-            
-            if sinal_tipo:
-                if self._is_price_near_ema(preco_atual, ema_slow_a):
-                    print(f"SINAL DE {sinal_tipo.upper()} e preço próximo da EMA. Abrindo posição.")
-                    self._abrir_posicao(sinal_tipo, preco_atual)
-                else:
-                    print(f"Sinal de {sinal_tipo.upper()} detectado, mas preço distante. Aguardando pullback.")
-                    self.estado = "AWAITING_PULLBACK"
-                    self.sinal_pendente_tipo = sinal_tipo
-
-        elif self.estado == "AWAITING_PULLBACK":
-            sinal_ainda_valido = (self.sinal_pendente_tipo == "long" and ema_fast_a > ema_slow_a) or \
-                                 (self.sinal_pendente_tipo == "short" and ema_fast_a < ema_slow_a)
-
-            if not sinal_ainda_valido:
-                print(f"Sinal de {self.sinal_pendente_tipo.upper()} invalidado. Cancelando espera.")
-                self.estado = "IDLE"
+    def _executar_ordem(self, decisao, preco_atual):
+        if self.verificar_posicao_em is not None:
+            # Nenhuma ordem sai com a posição do checkpoint sem conferir na Binance antes.
+            antes = (self.estado, self.posicao_atual_tipo)
+            if not self._conferir_posicao() or (self.estado, self.posicao_atual_tipo) != antes:
+                print(f"[{self.symbol}] Posição do checkpoint não confirmada; decisão adiada para a próxima checagem.")
+                return
+        if decisao.acao == ABRIR:
+            print(decisao.motivo)
+            if self._abrir_posicao(decisao.lado, preco_atual):
                 self.sinal_pendente_tipo = None
-            elif self._is_price_near_ema(preco_atual, ema_slow_a):
-                print(f"Pullback para {self.sinal_pendente_tipo.upper()} confirmado! Abrindo posição.")
-                self._abrir_posicao(self.sinal_pendente_tipo, preco_atual)
-                self.sinal_pendente_tipo = None
-
-        elif self.estado == "IN_POSITION":
-            reversao_long = self.posicao_atual_tipo == "long" and ema_fast_a < ema_slow_a
-            reversao_short = self.posicao_atual_tipo == "short" and ema_fast_a > ema_slow_a
-            
-            if reversao_long:
-                motivo = f"Reversão Long->Short"
-                if self.fechar_posicao_atual(motivo):
-                    time.sleep(2)
-                    self._abrir_posicao("short", preco_atual)
-
-            elif reversao_short:
-                motivo = f"Reversão Short->Long"
-                if self.fechar_posicao_atual(motivo):
-                    time.sleep(2)
-                    self._abrir_posicao("long", preco_atual)
\ No newline at end of file
+        elif decisao.acao == REVERTER and self.estado == "IN_POSITION":
+            self.reverter_posicao(decisao.lado, preco_atual, decisao.motivo)
+        elif decisao.acao == FECHAR and self.estado == "IN_POSITION":
+            self.fechar_posicao_atual(decisao.motivo)
@@ -0,0 +1,71 @@
+import json
+
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .models import BotCheckpoint
+
+# ===================================================================
+# Checkpoint do estado dos bots (retomada rápida após restart ou deploy)
+# ===================================================================
+
+# Versão do formato de `BotCheckpoint.dados`. Ao mudar os campos, incremente: checkpoints
+# de outra versão são ignorados e o bot começa do zero, como antes dos checkpoints.
+VERSAO = 1
+
+
+def normalizar(valor):
+    """Converte `valor` para a forma em que o JSONField o devolve (tuplas viram listas)."""
+    return json.loads(json.dumps(valor))
+
+
+class CheckpointBot:
+    """
+    Último estado salvo de um bot: máquina de estados, sinal pendente, posição conhecida
+    e a configuração de conta (alavancagem/margem) já aplicada na Binance.
+
+    O estado só muda em transições (sinal, entrada, saída, reconfiguração), então
+    `salvar()` compara com o último snapshot gravado e só escreve quando algo mudou: uma
+    checagem sem transição não gera query. A gravação é um único UPDATE (INSERT na primeira).
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._ultimo = None
+
+    def carregar(self):
+        """
+        Returns:
+            tuple | None: (dados, idade_em_segundos), ou None se não há checkpoint
+            compatível com a versão atual.
+        """
+        try:
+            checkpoint = BotCheckpoint.objects.filter(user_id=self.user_id).first()
+        except DatabaseError as e:
+            print(f"[Checkpoint {self.user_id}] Falha ao ler o checkpoint: {e}")
+            return None
+        if checkpoint is None:
+            return None
+        if checkpoint.versao != VERSAO:
+            print(f"[Checkpoint {self.user_id}] Checkpoint na versão {checkpoint.versao} (atual: {VERSAO}); ignorado.")
+            return None
+        self._ultimo = checkpoint.dados
+        return checkpoint.dados, (timezone.now() - checkpoint.atualizado_em).total_seconds()
+
+    def salvar(self, dados):
+        """
+        Grava o snapshot se ele mudou desde a última gravação.
+
+        Returns:
+            bool: True se houve gravação.
+        """
+        dados = normalizar(dados)
+        if dados == self._ultimo:
+            return False
+        try:
+            BotCheckpoint(user_id=self.user_id, versao=VERSAO, dados=dados, atualizado_em=timezone.now()).save()
+        except DatabaseError as e:
+            print(f"[Checkpoint {self.user_id}] Falha ao gravar o checkpoint: {e}")
+            return False
+        self._ultimo = dados
+        return True
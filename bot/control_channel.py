@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+CANAL_CONTROLE = "bot:controle"
+CHAVE_RODANDO = "bot:running:{user_id}"
+
+EVENTO_START = "start"
+EVENTO_STOP = "stop"
+EVENTO_RECONFIGURE = "reconfigure"
+# Sessões do profiler mudaram (publicado com user_id None, vale para todos os processos).
+EVENTO_PROFILE = "profile"
+# Evento sintético entregue aos assinantes após uma reconexão, porque o pub/sub
+# do Redis não guarda mensagens publicadas enquanto estávamos desconectados.
+EVENTO_RESYNC = "resync"
+
+
+def publicar_evento(user_id, tipo):
+    """
+    Avisa os bots em execução sobre start/stop/reconfigure de um usuário.
+
+    Além do PUBLISH, grava a flag `bot:running:<user_id>`, que serve para
+    ressincronizar quem perdeu mensagens durante uma reconexão.
+
+    Returns:
+        bool: True se o evento foi publicado no Redis.
+    """
+    try:
+        pipe = get_redis().pipeline()
+        if tipo == EVENTO_START:
+            pipe.set(CHAVE_RODANDO.format(user_id=user_id), "1")
+        elif tipo == EVENTO_STOP:
+            pipe.set(CHAVE_RODANDO.format(user_id=user_id), "0")
+        pipe.publish(CANAL_CONTROLE, json.dumps({"user_id": user_id, "tipo": tipo}))
+        pipe.execute()
+        return True
+    except RedisError as e:
+        print(f"[Controle] Falha ao publicar evento {tipo} do usuário {user_id}: {e}")
+        return False
+
+
+def ler_flag_rodando(user_id):
+    """
+    Lê a flag de execução do Redis, sem tocar no banco.
+
+    Returns:
+        bool | None: Estado da flag, ou None se ela não existe ou o Redis falhou.
+    """
+    try:
+        valor = get_redis().get(CHAVE_RODANDO.format(user_id=user_id))
+    except RedisError:
+        return None
+    if valor is None:
+        return None
+    return valor == b"1"
+
+
+class ControlChannel:
+    """
+    Assinatura única por processo do canal de controle dos bots.
+
+    Uma thread escuta o pub/sub e entrega cada evento aos callbacks registrados
+    para aquele usuário (ou para todos). Os callbacks rodam na thread do canal e
+    devem apenas marcar flags para o loop do bot aplicar.
+    """
+    ESPERA_RECONEXAO = 2  # segundos
+
+    def __init__(self):
+        self.conectado = False
+        self._assinantes = {}
+        self._globais = []
+        self._mutex = threading.Lock()
+        self._thread = None
+
+    def assinar(self, callback, user_id=None):
+        """Registra `callback(evento)` para um usuário, ou para todos se user_id for None."""
+        with self._mutex:
+            if user_id is None:
+                self._globais.append(callback)
+            else:
+                self._assinantes.setdefault(user_id, []).append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._rodar, name="bot-control-channel", daemon=True)
+                self._thread.start()
+
+    def cancelar(self, callback, user_id=None):
+        with self._mutex:
+            lista = self._globais if user_id is None else self._assinantes.get(user_id, [])
+            if callback in lista:
+                lista.remove(callback)
+            if user_id is not None and not lista:
+                self._assinantes.pop(user_id, None)
+
+    def _rodar(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CANAL_CONTROLE)
+                if not self.conectado:
+                    self.conectado = True
+                    self._entregar({"user_id": None, "tipo": EVENTO_RESYNC})
+                while True:
+                    mensagem = pubsub.get_message(timeout=1.0)
+                    if mensagem is not None:
+                        self._entregar(json.loads(mensagem["data"]))
+            except (RedisError, ValueError) as e:
+                if self.conectado:
+                    print(f"[Controle] Canal de controle desconectado: {e}")
+                self.conectado = False
+                time.sleep(self.ESPERA_RECONEXAO)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except RedisError:
+                        pass
+
+    def _entregar(self, evento):
+        user_id = evento.get("user_id")
+        with self._mutex:
+            if user_id is None:
+                # Resync vale para todos os assinantes.
+                callbacks = list(self._globais) + [c for lista in self._assinantes.values() for c in lista]
+            else:
+                callbacks = list(self._globais) + list(self._assinantes.get(user_id, []))
+        for callback in callbacks:
+            try:
+                callback(evento)
+            except Exception as e:
+                print(f"[Controle] Erro ao tratar evento {evento}: {e}")
+
+
+_canal = None
+
+
+def get_control_channel():
+    """Retorna o canal de controle do processo, criando-o na primeira chamada."""
+    global _canal
+    if _canal is None:
+        _canal = ControlChannel()
+    return _canal
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+# ===================================================================
+# EmaAnalyzer: cálculo completo com pandas_ta, só como referência
+# ===================================================================
+# Fica fora do bot_logic para o pandas (e o pandas_ta) não entrar no import do web
+# nem do worker: só quem compara com a referência (bench_ema, benchmark) o importa.
+
+class EmaAnalyzer:
+    def __init__(self, prices):
+        self.prices = np.array(prices)
+
+    def calcular_ema(self, period):
+        if len(self.prices) < period:
+            return []
+        df = pd.DataFrame(self.prices, columns=["close"])
+        return ta.ema(df["close"], length=period).dropna().tolist()
@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+import uuid
+from collections import namedtuple
+from decimal import Decimal, ROUND_DOWN
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+# Filtros de um símbolo necessários para dimensionar ordens sem ir à Binance.
+SymbolFilters = namedtuple(
+    "SymbolFilters",
+    ["symbol", "quantity_precision", "step_size", "min_qty", "min_notional", "tick_size"],
+)
+
+CHAVE_FILTROS = "exinfo:filtros:{ambiente}"
+CHAVE_LOCK = "exinfo:lock:{ambiente}"
+
+# Libera o lock apenas se ele ainda pertence a quem o adquiriu.
+_LUA_LIBERAR_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SymbolRegistry:
+    """
+    Cache dos filtros de todos os símbolos de futuros, compartilhado pelo processo.
+
+    O `futures_exchange_info()` (vários MB) é baixado uma vez por
+    `EXCHANGE_INFO_TTL_SECONDS` entre todos os workers: o resultado compacto vai para
+    o Redis e os outros processos leem de lá. Perto do vencimento a atualização
+    acontece em segundo plano, então quem está enviando ordem nunca espera a rede
+    depois da primeira carga. Dentro do processo, só uma thread faz a carga inicial;
+    as outras esperam por ela.
+    """
+    RENOVAR_EM = 0.8  # fração do TTL a partir da qual a atualização em segundo plano começa
+    ESPERA_LOCK = 10.0  # segundos esperando outro worker publicar na carga inicial
+    LOCK_TIMEOUT = 30  # segundos que um worker pode segurar o lock de download
+    ESPERA_CARGA = 40.0  # segundos que as outras threads do processo esperam a carga inicial
+
+    def __init__(self, ambiente, ttl=None):
+        self.ambiente = ambiente
+        self.ttl = ttl if ttl is not None else settings.EXCHANGE_INFO_TTL_SECONDS
+        self._filtros = {}
+        self._atualizado_em = 0.0
+        self._mutex = threading.Lock()
+        self._atualizando = False
+        self._carga_inicial = None  # threading.Event da carga inicial em andamento
+
+    def obter(self, symbol, client):
+        """
+        Retorna os filtros de `symbol`, ou None se ainda não foi possível carregá-los.
+
+        Args:
+            symbol (str): Par negociado, ex: "BTCUSDT".
+            client: Cliente da Binance usado caso o registro precise ser carregado.
+        """
+        idade = time.time() - self._atualizado_em
+        if not self._filtros:
+            self._carregar_uma_vez(client)
+        elif idade >= self.ttl * self.RENOVAR_EM:
+            self._agendar_atualizacao(client)
+        return self._filtros.get(symbol)
+
+    def formatar_quantidade(self, filtros, quantidade, preco=None):
+        """
+        Arredonda `quantidade` para baixo no stepSize e valida minQty/minNotional.
+
+        Returns:
+            str | None: Quantidade pronta para a ordem, ou None se ficar abaixo dos mínimos.
+        """
+        step = Decimal(filtros.step_size)
+        qtd = (Decimal(str(quantidade)) / step).to_integral_value(rounding=ROUND_DOWN) * step
+        if qtd < Decimal(filtros.min_qty):
+            return None
+        if preco is not None and qtd * Decimal(str(preco)) < Decimal(filtros.min_notional):
+            return None
+        return f"{qtd:.{filtros.quantity_precision}f}"
+
+    # --- Internos ---
+
+    def _carregar_uma_vez(self, client):
+        # Vários bots sobem juntos no mesmo worker: um carrega, os outros esperam o resultado.
+        with self._mutex:
+            carga = self._carga_inicial
+            dono = carga is None
+            if dono:
+                carga = self._carga_inicial = threading.Event()
+        if not dono:
+            carga.wait(self.ESPERA_CARGA)
+            return
+        try:
+            self._carregar(client)
+        finally:
+            with self._mutex:
+                self._carga_inicial = None
+            carga.set()
+
+    def _agendar_atualizacao(self, client):
+        with self._mutex:
+            if self._atualizando:
+                return
+            self._atualizando = True
+        threading.Thread(target=self._carregar, args=(client,), name="exchange-info-refresh", daemon=True).start()
+
+    def _carregar(self, client):
+        try:
+            # Outro worker pode já ter renovado: o Redis é mais barato que a Binance.
+            if self._ler_redis() and time.time() - self._atualizado_em < self.ttl * self.RENOVAR_EM:
+                return
+
+            chave_lock = CHAVE_LOCK.format(ambiente=self.ambiente)
+            token = uuid.uuid4().hex
+            try:
+                # set(nx=True) devolve None quando a chave já existe: normaliza para False.
+                adquiriu = bool(get_redis().set(chave_lock, token, nx=True, ex=self.LOCK_TIMEOUT))
+            except RedisError:
+                adquiriu = None
+            if adquiriu is not None and not adquiriu:
+                if self._filtros:
+                    # Outro worker está baixando; seguimos com os filtros atuais.
+                    return
+                # Carga inicial (ex: frota subindo após um deploy): espera quem tem o lock
+                # publicar, em vez de todos os processos baixarem o exchange info juntos.
+                prazo = time.monotonic() + self.ESPERA_LOCK
+                while time.monotonic() < prazo:
+                    time.sleep(0.2)
+                    if self._ler_redis():
+                        return
+                print("[ExchangeInfo] Outro worker não publicou os filtros a tempo; baixando.")
+
+            try:
+                info = client.futures_exchange_info()
+                self._filtros = {s["symbol"]: self._extrair(s) for s in info["symbols"]}
+                self._atualizado_em = time.time()
+                self._publicar()
+            finally:
+                if adquiriu:
+                    # Se o download passou do LOCK_TIMEOUT, o lock pode já ser de outro worker.
+                    try:
+                        get_redis().eval(_LUA_LIBERAR_LOCK, 1, chave_lock, token)
+                    except RedisError:
+                        pass
+        except Exception as e:
+            print(f"[ExchangeInfo] Erro ao atualizar filtros dos símbolos: {e}")
+        finally:
+            with self._mutex:
+                self._atualizando = False
+
+    @staticmethod
+    def _extrair(symbol_info):
+        filtros = {f["filterType"]: f for f in symbol_info.get("filters", [])}
+        lot = filtros.get("LOT_SIZE", {})
+        preco = filtros.get("PRICE_FILTER", {})
+        notional = filtros.get("MIN_NOTIONAL", {})
+        precisao = int(symbol_info["quantityPrecision"])
+        return SymbolFilters(
+            symbol=symbol_info["symbol"],
+            quantity_precision=precisao,
+            step_size=lot.get("stepSize", f"{Decimal(1).scaleb(-precisao)}"),
+            min_qty=lot.get("minQty", "0"),
+            min_notional=notional.get("notional", notional.get("minNotional", "0")),
+            tick_size=preco.get("tickSize", "0"),
+        )
+
+    def _ler_redis(self):
+        try:
+            bruto = get_redis().get(CHAVE_FILTROS.format(ambiente=self.ambiente))
+        except RedisError:
+            return False
+        if not bruto:
+            return False
+        dados = json.loads(bruto)
+        if dados["atualizado_em"] <= self._atualizado_em:
+            return bool(self._filtros)
+        self._filtros = {s: SymbolFilters(*campos) for s, campos in dados["filtros"].items()}
+        self._atualizado_em = dados["atualizado_em"]
+        return True
+
+    def _publicar(self):
+        dados = {
+            "atualizado_em": self._atualizado_em,
+            "filtros": {s: list(f) for s, f in self._filtros.items()},
+        }
+        try:
+            get_redis().set(CHAVE_FILTROS.format(ambiente=self.ambiente), json.dumps(dados), ex=self.ttl * 2)
+        except RedisError as e:
+            print(f"[ExchangeInfo] Falha ao publicar filtros no Redis: {e}")
+
+
+_registros = {}
+
+
+def get_symbol_registry(client):
+    """Retorna o registro de filtros do ambiente (testnet ou produção) do `client`."""
+    ambiente = "testnet" if getattr(client, "testnet", False) else "mainnet"
+    if ambiente not in _registros:
+        # setdefault: threads chegando juntas recebem todas o mesmo registro.
+        _registros.setdefault(ambiente, SymbolRegistry(ambiente))
+    return _registros[ambiente]
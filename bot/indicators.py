@@ -0,0 +1,313 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+# ===================================================================
+# EMA incremental (O(1) por candle fechado)
+# ===================================================================
+
+class IncrementalEma:
+    """
+    EMA atualizada em O(1) por candle fechado.
+
+    Segue a mesma definição do `pandas_ta.ema` (presma=True, adjust=False): o
+    primeiro valor é a SMA dos `period` primeiros fechamentos e os seguintes usam
+    alpha = 2 / (period + 1).
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.valor = None
+
+    def semear(self, closes):
+        """Recalcula a EMA do zero a partir dos fechamentos de candles já fechados."""
+        if len(closes) < self.period:
+            self.valor = None
+            return None
+        valor = sum(closes[:self.period]) / self.period
+        alpha = self.alpha
+        for close in closes[self.period:]:
+            valor += alpha * (close - valor)
+        self.valor = valor
+        return valor
+
+    def atualizar(self, close):
+        """Consolida um novo candle fechado na EMA."""
+        self.valor += self.alpha * (close - self.valor)
+        return self.valor
+
+    def espiar(self, close):
+        """EMA considerando o candle em formação, sem alterar o estado consolidado."""
+        return self.valor + self.alpha * (close - self.valor)
+
+
+# ===================================================================
+# Indicadores vetorizados (NumPy) sobre a série inteira
+# ===================================================================
+
+def _suavizar(valores, period, alpha):
+    """
+    Média exponencial com semente SMA: e[period-1] = média dos `period` primeiros e,
+    depois, e[t] = (1-a)·e[t-1] + a·x[t]. Com a = 2/(period+1) é a EMA do pandas_ta;
+    com a = 1/period é a RMA de Wilder (RSI e ATR).
+
+    A recorrência vira uma soma acumulada com pesos (1-a)^-t. Para o peso não estourar
+    o float64, a série é processada em blocos e o último valor de cada bloco semeia o
+    seguinte.
+
+    Returns:
+        np.ndarray: Mesmo tamanho de `valores`, com NaN antes do índice period-1.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    n = len(valores)
+    saida = np.full(n, np.nan)
+    if n < period:
+        return saida
+
+    beta = 1.0 - alpha
+    saida[period - 1] = valores[:period].mean()
+
+    # Bloco máximo tal que beta^-bloco fique bem abaixo do limite do float64.
+    bloco = max(1, int(300 / -math.log(beta))) if beta > 0 else n
+    inicio = period
+    while inicio < n:
+        fim = min(n, inicio + bloco)
+        x = valores[inicio:fim]
+        k = np.arange(1, fim - inicio + 1, dtype=np.float64)
+        potencias = beta ** k
+        saida[inicio:fim] = potencias * (saida[inicio - 1] + np.cumsum(alpha * x / potencias))
+        inicio = fim
+    return saida
+
+
+def ema_vetorizada(closes, period):
+    """
+    EMA com a mesma definição do `pandas_ta.ema` (semente SMA, adjust=False),
+    calculada sem loop Python.
+
+    Returns:
+        np.ndarray: Mesmo tamanho de `closes`, com NaN antes do índice period-1.
+    """
+    return _suavizar(closes, period, 2.0 / (period + 1))
+
+
+def rsi(closes, period=14):
+    """
+    RSI de Wilder: ganhos e perdas médios suavizados pela RMA.
+
+    Returns:
+        np.ndarray: Mesmo tamanho de `closes`, com NaN antes do índice `period`.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    saida = np.full(len(closes), np.nan)
+    if len(closes) <= period:
+        return saida
+    variacao = np.diff(closes)
+    ganhos = _suavizar(np.clip(variacao, 0, None), period, 1.0 / period)
+    perdas = _suavizar(np.clip(-variacao, 0, None), period, 1.0 / period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valores = 100.0 - 100.0 / (1.0 + ganhos / perdas)
+    # Sem perdas na janela o RSI é 100 (ganhos/0 = inf já dá isso; 0/0 não).
+    valores[(perdas == 0) & ~np.isnan(perdas)] = 100.0
+    saida[1:] = valores
+    return saida
+
+
+def atr(highs, lows, closes, period=14):
+    """
+    ATR de Wilder: RMA do true range (max(high-low, |high-close ant.|, |low-close ant.|)).
+
+    Returns:
+        np.ndarray: Mesmo tamanho de `closes`, com NaN antes do índice period-1.
+    """
+    highs = np.asarray(highs, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) == 0:
+        return np.full(0, np.nan)
+    anterior = np.concatenate(([closes[0]], closes[:-1]))
+    true_range = np.maximum(highs - lows, np.maximum(np.abs(highs - anterior), np.abs(lows - anterior)))
+    return _suavizar(true_range, period, 1.0 / period)
+
+
+def bandas_bollinger(closes, period=20, desvios=2.0):
+    """
+    Bandas de Bollinger: média simples de `period` fechamentos ± `desvios` desvios-padrão
+    (populacionais, como no pandas_ta).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: (inferior, media, superior), com NaN antes
+        do índice period-1.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    n = len(closes)
+    inferior, media, superior = (np.full(n, np.nan) for _ in range(3))
+    if n < period:
+        return inferior, media, superior
+    janelas = np.lib.stride_tricks.sliding_window_view(closes, period)
+    media[period - 1:] = janelas.mean(axis=1)
+    desvio = janelas.std(axis=1)
+    inferior[period - 1:] = media[period - 1:] - desvios * desvio
+    superior[period - 1:] = media[period - 1:] + desvios * desvio
+    return inferior, media, superior
+
+
+# Cada indicador recebe as colunas dos candles fechados e os parâmetros nomeados.
+INDICADORES = {
+    "ema": lambda c, period: ema_vetorizada(c["close"], period),
+    "rsi": lambda c, period=14: rsi(c["close"], period),
+    "atr": lambda c, period=14: atr(c["high"], c["low"], c["close"], period),
+    "bbands": lambda c, period=20, desvios=2.0: np.vstack(bandas_bollinger(c["close"], period, desvios)),
+}
+
+
+class IndicatorCache:
+    """
+    Indicadores calculados uma vez por candle para todos os bots do processo.
+
+    A chave é (symbol, timeframe, indicador, parâmetros, primeiro e último candle
+    fechado): 50 bots no mesmo par com a mesma EMA fazem um cálculo por candle, e bots
+    com períodos diferentes reaproveitam as colunas já convertidas para NumPy. Só os
+    candles fechados entram no cálculo; o candle em formação fica com a estratégia.
+    As entradas menos usadas saem quando o cache passa de INDICATOR_CACHE_SIZE.
+
+    Os arrays devolvidos são somente leitura, porque são compartilhados entre os bots.
+
+    A EMA do caminho quente tem um atalho, `ema_atual()`: uma IncrementalEma por
+    (symbol, timeframe, period), semeada uma vez e atualizada só com os candles que
+    fecharam desde a última consulta, sem recalcular a série.
+    """
+
+    def __init__(self, capacidade=None):
+        self.capacidade = capacidade or settings.INDICATOR_CACHE_SIZE
+        self.acertos = 0
+        self.calculos = 0
+        self.sementes_ema = 0
+        self._itens = OrderedDict()
+        self._mutex = threading.Lock()
+        self._emas = OrderedDict()  # (symbol, timeframe, period) -> [IncrementalEma, open time consolidado]
+        self._mutex_emas = threading.Lock()
+
+    def obter(self, serie, nome, **params):
+        """
+        Valores do indicador `nome` sobre os candles fechados de `serie`.
+
+        Args:
+            serie (CandleSeries): Série do hub; o último candle (em formação) é ignorado.
+            nome (str): Chave de INDICADORES, ex: "ema".
+            **params: Parâmetros do indicador, ex: period=21.
+
+        Returns:
+            np.ndarray: Um valor por candle fechado (NaN no aquecimento); "bbands" devolve
+            três linhas (inferior, média, superior).
+        """
+        chave = self._chave(serie, nome, tuple(sorted(params.items())))
+        valor = self._ler(chave)
+        if valor is None:
+            valor = INDICADORES[nome](self._colunas(serie), **params)
+            valor.setflags(write=False)
+            self._gravar(chave, valor)
+        return valor
+
+    def ema_atual(self, serie, period):
+        """
+        EMA consolidada no último candle fechado de `serie`, mantida de forma incremental.
+
+        Normalmente fechou zero ou um candle desde a consulta anterior (de qualquer bot do
+        par), então o custo é constante. Na primeira consulta, ou se a série não alcança o
+        último candle consolidado (buraco), a EMA é semeada de novo a partir da série.
+
+        Returns:
+            float | None: A EMA, ou None se ainda não há `period` candles fechados.
+        """
+        fechados = len(serie.open_times) - 1
+        if fechados < 1:
+            return None
+        ultimo = serie.open_times[-2]
+        chave = (serie.symbol, serie.timeframe, period)
+        with self._mutex_emas:
+            estado = self._emas.get(chave)
+            if estado is None:
+                estado = self._emas[chave] = [IncrementalEma(period), None]
+                while len(self._emas) > self.capacidade:
+                    self._emas.popitem(last=False)
+            else:
+                self._emas.move_to_end(chave)
+            ema, consolidado = estado
+            if ema.valor is not None and consolidado == ultimo:
+                return ema.valor
+            if ema.valor is not None and consolidado > ultimo:
+                # Série mais velha que o estado (um bot leu o hub antes de outro): calcula à
+                # parte, sem voltar o estado compartilhado.
+                return IncrementalEma(period).semear(serie.closes[:-1])
+
+            inicio = None
+            if ema.valor is not None:
+                i = fechados - 1
+                while i >= 0 and serie.open_times[i] > consolidado:
+                    i -= 1
+                if i >= 0 and serie.open_times[i] == consolidado:
+                    inicio = i + 1
+            if inicio is None:
+                ema.semear(serie.closes[:-1])
+                self.sementes_ema += 1
+            else:
+                for close in serie.closes[inicio:-1]:
+                    ema.atualizar(close)
+            estado[1] = ultimo
+            return ema.valor
+
+    def __len__(self):
+        return len(self._itens)
+
+    # --- Internos ---
+
+    @staticmethod
+    def _chave(serie, nome, params):
+        return (serie.symbol, serie.timeframe, nome, params, serie.open_times[0], serie.open_times[-2])
+
+    def _colunas(self, serie):
+        chave = self._chave(serie, "_colunas", ())
+        colunas = self._ler(chave)
+        if colunas is None:
+            colunas = {
+                "close": np.asarray(serie.closes[:-1], dtype=np.float64),
+                "high": np.asarray(serie.highs[:-1], dtype=np.float64),
+                "low": np.asarray(serie.lows[:-1], dtype=np.float64),
+            }
+            for coluna in colunas.values():
+                coluna.setflags(write=False)
+            self._gravar(chave, colunas)
+        return colunas
+
+    def _ler(self, chave):
+        with self._mutex:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+            return valor
+
+    def _gravar(self, chave, valor):
+        with self._mutex:
+            self.calculos += 1
+            self._itens[chave] = valor
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+
+_cache = None
+_cache_mutex = threading.Lock()
+
+
+def get_indicator_cache():
+    """Retorna o cache de indicadores do processo, criando-o na primeira chamada."""
+    global _cache
+    with _cache_mutex:
+        if _cache is None:
+            _cache = IndicatorCache()
+    return _cache
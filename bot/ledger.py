@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import AccountFill, DailyPnl
+
+# Maior intervalo aceito pelo /fapi/v1/userTrades entre startTime e endTime.
+JANELA_MAXIMA_MS = 7 * 24 * 60 * 60 * 1000
+LIMITE_POR_PAGINA = 1000
+
+
+def sincronizar_fills(user_id, client):
+    """
+    Traz para o banco os fills da conta feitos depois do último já guardado.
+
+    O `userTrades` sem símbolo só pagina por tempo (o `fromId` exige símbolo), então a
+    busca começa no horário do último fill salvo e cada página cheia continua do mesmo
+    ms do seu último fill (outros fills podem dividir esse ms); os repetidos são
+    descartados aqui e pela restrição única (user, symbol, trade_id). Se uma página
+    cheia cabe inteira num só ms, o resto dele vem por `fromId` em cada símbolo. Na
+    primeira vez, volta LEDGER_BACKFILL_DAYS dias. Depois atualiza o DailyPnl dos dias
+    que receberam fills.
+
+    Returns:
+        int: Quantidade de fills distintos recebidos da Binance.
+    """
+    ultimo = (
+        AccountFill.objects.filter(user_id=user_id).order_by("-time").values_list("time", flat=True).first()
+    )
+    agora_ms = int(timezone.now().timestamp() * 1000)
+    if ultimo is not None:
+        inicio_ms = int(ultimo.timestamp() * 1000)
+    else:
+        inicio_ms = agora_ms - settings.LEDGER_BACKFILL_DAYS * 24 * 60 * 60 * 1000
+
+    recebidos = []
+    while inicio_ms <= agora_ms:
+        fim_ms = min(inicio_ms + JANELA_MAXIMA_MS - 1, agora_ms)
+        pagina = client.futures_account_trades(startTime=inicio_ms, endTime=fim_ms, limit=LIMITE_POR_PAGINA)
+        recebidos.extend(pagina)
+        if len(pagina) >= LIMITE_POR_PAGINA:
+            # Página cheia: continua do último horário recebido (o mesmo ms, não +1).
+            proximo = max(int(t["time"]) for t in pagina)
+            if proximo > inicio_ms:
+                inicio_ms = proximo
+            else:
+                # A página inteira caiu num único ms: por tempo não dá para avançar.
+                recebidos.extend(_restante_do_ms(client, pagina, inicio_ms))
+                inicio_ms += 1
+        else:
+            inicio_ms = fim_ms + 1
+
+    # As páginas se sobrepõem no ms de corte: um fill por (symbol, id).
+    recebidos = list({(t["symbol"], int(t["id"])): t for t in recebidos}.values())
+    if not recebidos:
+        return 0
+
+    fills = [
+        AccountFill(
+            user_id=user_id,
+            trade_id=int(t["id"]),
+            order_id=int(t["orderId"]),
+            symbol=t["symbol"],
+            side=t["side"],
+            price=float(t["price"]),
+            qty=float(t["qty"]),
+            realized_pnl=float(t["realizedPnl"]),
+            commission=float(t["commission"]),
+            commission_asset=t.get("commissionAsset", ""),
+            time=datetime.fromtimestamp(int(t["time"]) / 1000, tz=dt_timezone.utc),
+        )
+        for t in recebidos
+    ]
+    with transaction.atomic():
+        AccountFill.objects.bulk_create(fills, ignore_conflicts=True, batch_size=500)
+        atualizar_resumo_diario(user_id, {f.time.date() for f in fills})
+    return len(fills)
+
+
+def _restante_do_ms(client, pagina, instante_ms):
+    """Fills do ms `instante_ms` que não vieram na `pagina`, buscados por `fromId` em cada símbolo."""
+    ultimos_ids = {}
+    for t in pagina:
+        ultimos_ids[t["symbol"]] = max(ultimos_ids.get(t["symbol"], 0), int(t["id"]))
+    restante = []
+    for symbol, ultimo_id in ultimos_ids.items():
+        while True:
+            lote = client.futures_account_trades(symbol=symbol, fromId=ultimo_id + 1, limit=LIMITE_POR_PAGINA)
+            restante.extend(t for t in lote if int(t["time"]) == instante_ms)
+            if len(lote) < LIMITE_POR_PAGINA or any(int(t["time"]) > instante_ms for t in lote):
+                break
+            ultimo_id = max(int(t["id"]) for t in lote)
+    return restante
+
+
+def atualizar_resumo_diario(user_id, dias):
+    """Recalcula o DailyPnl dos `dias` informados a partir dos fills guardados."""
+    if not dias:
+        return
+    inicio = datetime.combine(min(dias), datetime.min.time(), tzinfo=dt_timezone.utc)
+    fim = datetime.combine(max(dias) + timedelta(days=1), datetime.min.time(), tzinfo=dt_timezone.utc)
+    linhas = (
+        AccountFill.objects.filter(user_id=user_id, time__gte=inicio, time__lt=fim)
+        .annotate(dia=TruncDate("time", tzinfo=dt_timezone.utc))
+        .values("dia")
+        .annotate(
+            trades=Count("id", filter=~Q(realized_pnl=0)),
+            wins=Count("id", filter=Q(realized_pnl__gt=0)),
+            pnl=Sum("realized_pnl"),
+            comissao=Sum("commission"),
+        )
+    )
+    for linha in linhas:
+        DailyPnl.objects.update_or_create(
+            user_id=user_id, dia=linha["dia"],
+            defaults={"trades": linha["trades"], "wins": linha["wins"], "pnl": linha["pnl"], "comissao": linha["comissao"]},
+        )
+
+
+def indicadores_periodo(user_id, dias=7, ultimos_trades=50):
+    """
+    KPIs e dados dos gráficos do dashboard, só com consultas agregadas/limitadas.
+
+    O período é móvel (os últimos `dias` * 24 h até agora), como antes do ledger: os
+    dias inteiros saem do DailyPnl e só o pedaço do primeiro dia é somado direto dos
+    fills. A curva de capital é por trade: o PnL acumulado do período depois de cada
+    um dos últimos `ultimos_trades` trades fechados.
+
+    Returns:
+        tuple: (kpis, perf_data). perf_data é None se não houve trade fechado no período.
+    """
+    inicio = timezone.now() - timedelta(days=dias)
+    primeiro_dia_inteiro = inicio.astimezone(dt_timezone.utc).date() + timedelta(days=1)
+    meia_noite = datetime.combine(primeiro_dia_inteiro, datetime.min.time(), tzinfo=dt_timezone.utc)
+    parcial = AccountFill.objects.filter(user_id=user_id, time__gte=inicio, time__lt=meia_noite).aggregate(
+        trades=Count("id", filter=~Q(realized_pnl=0)),
+        wins=Count("id", filter=Q(realized_pnl__gt=0)),
+        pnl=Sum("realized_pnl"),
+    )
+    inteiros = DailyPnl.objects.filter(user_id=user_id, dia__gte=primeiro_dia_inteiro).aggregate(
+        trades=Sum("trades"), wins=Sum("wins"), pnl=Sum("pnl"),
+    )
+    total_trades = (parcial["trades"] or 0) + (inteiros["trades"] or 0)
+    kpis = {"total_trades": total_trades, "win_rate": 0, "total_pnl": 0}
+    if total_trades == 0:
+        return kpis, None
+
+    wins = (parcial["wins"] or 0) + (inteiros["wins"] or 0)
+    total_pnl = (parcial["pnl"] or 0.0) + (inteiros["pnl"] or 0.0)
+    kpis["win_rate"] = round(wins / total_trades * 100, 2)
+    kpis["total_pnl"] = round(total_pnl, 2)
+
+    # Só os últimos N trades fechados vão para os gráficos (usa o índice user/time).
+    recentes = list(
+        AccountFill.objects.filter(user_id=user_id, time__gte=inicio)
+        .exclude(realized_pnl=0)
+        .order_by("-time")
+        .values("symbol", "realized_pnl", "time")[:ultimos_trades]
+    )[::-1]
+
+    # Trades do período anteriores aos N mostrados entram como ponto de partida da curva.
+    acumulado, curva = total_pnl - sum(t["realized_pnl"] for t in recentes), []
+    for t in recentes:
+        acumulado += t["realized_pnl"]
+        curva.append(round(acumulado, 2))
+
+    perf_data = {
+        "total_trades": total_trades,
+        "pnl_por_trade_labels": [f"{t['symbol']}-{i + 1}" for i, t in enumerate(recentes)],
+        "pnl_por_trade_data": [round(t["realized_pnl"], 2) for t in recentes],
+        "equity_curve_labels": [t["time"].astimezone(dt_timezone.utc).strftime("%d/%m %H:%M") for t in recentes],
+        "equity_curve_data": curva,
+    }
+    return kpis, perf_data
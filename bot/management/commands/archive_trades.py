@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.trade_store import arquivar_trades
+
+
+class Command(BaseCommand):
+    help = "Move os trades fechados mais antigos da tabela Trade para o arquivo mensal (TradeArchive)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--meses", type=int, default=3, help="Meses fechados mantidos na tabela principal.")
+        parser.add_argument("--lote", type=int, default=5000, help="Tamanho do lote fora do PostgreSQL.")
+
+    def handle(self, *args, **options):
+        if options["meses"] < 0:
+            raise CommandError("--meses não pode ser negativo.")
+        movidos = arquivar_trades(options["meses"], options["lote"])
+        if not movidos:
+            self.stdout.write("Nada a arquivar.")
+            return
+        for mes, quantidade in movidos.items():
+            self.stdout.write(f"{mes}: {quantidade} trade(s) arquivado(s)")
+        self.stdout.write(self.style.SUCCESS(f"Total: {sum(movidos.values())}"))
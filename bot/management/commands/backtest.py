@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.backtest import carregar_ohlcv, executar_backtest
+
+
+class Command(BaseCommand):
+    help = "Roda o backtest da estratégia EMA/pullback sobre candles de um CSV ou Parquet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="CSV (klines da Binance), Parquet com open_time/open/high/low/close/volume "
+                                             "ou SYMBOL:timeframe do histórico local (ex: BTCUSDT:1m).")
+        parser.add_argument("--ema-fast", type=int, default=6)
+        parser.add_argument("--ema-slow", type=int, default=12)
+        parser.add_argument("--quantidade", type=float, default=20.0, help="Margem por operação em USDT.")
+        parser.add_argument("--leverage", type=int, default=5)
+        parser.add_argument("--taxa", type=float, default=0.0004, help="Taxa por lado (0.0004 = 0,04%%).")
+        parser.add_argument("--slippage", type=float, default=0.0005, help="Deslizamento em fração do preço.")
+        parser.add_argument("--capital", type=float, default=100.0, help="Capital inicial para o drawdown percentual.")
+        parser.add_argument("--listar-trades", action="store_true")
+
+    def handle(self, *args, **options):
+        try:
+            dados = carregar_ohlcv(options["arquivo"])
+        except (OSError, ValueError, ImportError) as e:
+            raise CommandError(f"Não foi possível ler {options['arquivo']}: {e}")
+        if options["ema_fast"] >= options["ema_slow"]:
+            raise CommandError("A EMA rápida deve ser menor que a EMA lenta.")
+
+        inicio = time.perf_counter()
+        resultado = executar_backtest(
+            dados["close"], options["ema_fast"], options["ema_slow"],
+            quantidade_usdt=options["quantidade"], leverage=options["leverage"],
+            taxa=options["taxa"], slippage=options["slippage"], capital_inicial=options["capital"],
+        )
+        duracao = time.perf_counter() - inicio
+
+        if options["listar_trades"]:
+            for t in resultado["lista_trades"]:
+                self.stdout.write(
+                    f"{t['lado']:<5} candle {t['entrada_i']} -> {t['saida_i']}: "
+                    f"{t['preco_entrada']:.4f} -> {t['preco_saida']:.4f} | PnL {t['pnl']:.4f}"
+                    + (" (fechado no fim da série)" if t["forcado"] else "")
+                )
+
+        self.stdout.write(f"Candles: {len(dados['close'])} | tempo: {duracao * 1000:.0f} ms")
+        self.stdout.write(f"Trades: {resultado['trades']} | win rate: {resultado['win_rate']:.2f}%")
+        self.stdout.write(f"PnL total: {resultado['pnl_total']:.4f} USDT (taxas: {resultado['taxas_pagas']:.4f})")
+        self.stdout.write(
+            f"Drawdown máximo: {resultado['max_drawdown']:.4f} USDT ({resultado['max_drawdown_percent']:.2f}%)"
+        )
@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from binance.client import Client
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.binance_pool import BinanceClientPool
+
+
+def _percentis(amostras):
+    ordenadas = sorted(amostras)
+    p99 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))]
+    return statistics.median(ordenadas) * 1000, p99 * 1000
+
+
+class Command(BaseCommand):
+    help = "Mede p50/p99 de ordens e das chamadas do dashboard com um Client novo por chamada e com o pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--api-key", required=True)
+        parser.add_argument("--api-secret", required=True)
+        parser.add_argument("--testnet", action="store_true")
+        parser.add_argument("--chamadas", type=int, default=30)
+        parser.add_argument("--symbol", default="BTCUSDT")
+        parser.add_argument("--quantidade", default="0.001")
+
+    def handle(self, *args, **options):
+        api_key, api_secret, testnet = options["api_key"], options["api_secret"], options["testnet"]
+        pool = BinanceClientPool()
+
+        # Ordem de teste (/fapi/v1/order/test): mesmo caminho da ordem real, sem executar.
+        def ordem(client):
+            client.futures_create_test_order(
+                symbol=options["symbol"], side="BUY", type="MARKET", quantity=options["quantidade"]
+            )
+
+        # O que o dashboard busca a cada carga sem cache.
+        def dashboard(client):
+            client.futures_account_balance()
+            client.futures_account()
+
+        cenarios = {
+            "Client novo por chamada": lambda: Client(api_key, api_secret, testnet=testnet),
+            "Pool": lambda: pool.obter(api_key, api_secret, testnet),
+        }
+        for nome_operacao, operacao in (("futures_create_order", ordem), ("dashboard", dashboard)):
+            for nome_cenario, fabrica in cenarios.items():
+                amostras = []
+                for _ in range(options["chamadas"]):
+                    inicio = time.perf_counter()
+                    try:
+                        operacao(fabrica())
+                    except Exception as e:
+                        raise CommandError(f"{nome_operacao} falhou: {e}")
+                    amostras.append(time.perf_counter() - inicio)
+                p50, p99 = _percentis(amostras)
+                self.stdout.write(f"{nome_operacao:<22} {nome_cenario:<24} p50 {p50:8.1f} ms | p99 {p99:8.1f} ms")
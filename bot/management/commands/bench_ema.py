@@ -0,0 +1,81 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.indicators import IndicatorCache, ema_vetorizada
+from bot.market_data import CandleSeries
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o custo por checagem da EMA incremental do IndicatorCache com o recálculo da "
+        "série (NumPy) e com o EmaAnalyzer (pandas_ta), e confere os valores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--janela", type=int, default=200, help="Candles por checagem (limit do bot).")
+        parser.add_argument("--ticks", type=int, default=2000, help="Quantidade de checagens simuladas.")
+        parser.add_argument("--fast", type=int, default=6)
+        parser.add_argument("--slow", type=int, default=12)
+        parser.add_argument("--tolerancia", type=float, default=1e-8, help="Erro relativo máximo aceito.")
+
+    def handle(self, *args, **options):
+        janela, ticks = options["janela"], options["ticks"]
+        fast, slow = options["fast"], options["slow"]
+
+        # Passeio aleatório: a cada checagem fecha um candle novo (pior caso do incremental).
+        rng = random.Random(42)
+        closes = [100.0]
+        for _ in range(janela + ticks):
+            closes.append(closes[-1] * (1 + rng.gauss(0, 0.002)))
+        open_times = list(range(0, 60_000 * len(closes), 60_000))
+        series = [
+            CandleSeries("BTCUSDT", "1m", tuple(open_times[t:t + janela]), tuple(closes[t:t + janela]),
+                         (), (), janela, 0)
+            for t in range(ticks)
+        ]
+
+        cache = IndicatorCache()
+        resultados = []
+        inicio = time.perf_counter()
+        for serie in series:
+            resultados.append((cache.ema_atual(serie, fast), cache.ema_atual(serie, slow)))
+        custo_incremental = (time.perf_counter() - inicio) / ticks
+        self.stdout.write(f"EMA incremental (IndicatorCache.ema_atual): {custo_incremental * 1e6:.2f} µs/checagem")
+
+        inicio = time.perf_counter()
+        for serie in series:
+            ema_vetorizada(serie.closes[:-1], fast)
+            ema_vetorizada(serie.closes[:-1], slow)
+        custo_numpy = (time.perf_counter() - inicio) / ticks
+        self.stdout.write(f"Recalculando a série (NumPy): {custo_numpy * 1e6:.2f} µs/checagem")
+        self.stdout.write(f"Ganho sobre o recálculo: {custo_numpy / custo_incremental:.1f}x")
+
+        try:
+            from bot.ema_analyzer import EmaAnalyzer
+        except ImportError as e:
+            self.stdout.write(self.style.WARNING(f"pandas_ta indisponível, pulando a referência: {e}"))
+        else:
+            inicio = time.perf_counter()
+            for serie in series:
+                analyzer = EmaAnalyzer(serie.closes)
+                analyzer.calcular_ema(fast)
+                analyzer.calcular_ema(slow)
+            custo_pandas = (time.perf_counter() - inicio) / ticks
+            self.stdout.write(f"EmaAnalyzer (pandas_ta): {custo_pandas * 1e6:.2f} µs/checagem")
+            self.stdout.write(f"Ganho sobre o pandas_ta: {custo_pandas / custo_incremental:.1f}x")
+
+        # Confere os valores contra a EMA da série completa desde a semeadura, que é
+        # exatamente o que o estado incremental representa.
+        referencia = {p: ema_vetorizada(np.array(closes), p) for p in (fast, slow)}
+        pior = 0.0
+        for t, obtidos in enumerate(resultados):
+            ultimo_fechado = t + janela - 2
+            for period, obtido in zip((fast, slow), obtidos):
+                ref = referencia[period][ultimo_fechado]
+                pior = max(pior, abs(obtido - ref) / abs(ref))
+        self.stdout.write(f"Maior erro relativo contra a série completa: {pior:.2e}")
+        if pior > options["tolerancia"]:
+            raise CommandError(f"EMA incremental divergiu da referência ({pior:.2e} > {options['tolerancia']:.0e}).")
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.benchmarks import carregar_baseline, comparar, executar, salvar_baseline
+from bot.simulator import SimulatedExchange, ambiente_isolado
+
+
+def _formatar(us):
+    if us is None:
+        return "-"
+    return f"{us / 1000:.2f} ms" if us >= 1000 else f"{us:.1f} µs"
+
+
+def _formatar_campo(campo, valor):
+    if campo == "rss_mb":
+        return "-" if valor is None else f"{valor:.1f} MB"
+    return _formatar(valor)
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmarks dos caminhos quentes (EmaAnalyzer, indicadores, run_single_check, precisão de "
+        "quantidade, Telegram e dashboard) contra o simulador, mais o tempo de import e o RSS do web e do "
+        "worker do Celery, comparando com o baseline em JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--baseline", default=None, help="Arquivo JSON do baseline (padrão: BENCHMARK_BASELINE_PATH).")
+        parser.add_argument("--salvar", action="store_true", help="Grava os resultados como novo baseline.")
+        parser.add_argument("--limite", type=float, default=None,
+                            help="Piora máxima da mediana antes de reprovar (padrão: BENCHMARK_REGRESSION_THRESHOLD).")
+        parser.add_argument("--filtro", default=None, help="Só roda benchmarks cujo nome contém o texto.")
+        parser.add_argument("--amostras", type=int, default=15)
+        parser.add_argument("--dashboard-tamanhos", default="10,1000,100000",
+                            help="Quantidades de trades no ledger para o benchmark do dashboard.")
+        parser.add_argument("--mostrar-prints", action="store_true", help="Não silencia os prints do código medido.")
+
+    def handle(self, *args, **options):
+        caminho = options["baseline"] or settings.BENCHMARK_BASELINE_PATH
+        limite = options["limite"] if options["limite"] is not None else settings.BENCHMARK_REGRESSION_THRESHOLD
+        tamanhos = tuple(int(n) for n in options["dashboard_tamanhos"].split(",") if n)
+
+        baseline = carregar_baseline(caminho)
+        resultados = {}
+        # Latência zero no simulador: mede só o nosso código, não a rede.
+        exchange = SimulatedExchange(simbolos=("BTCUSDT",), aceleracao=1.0, seed=1)
+        with ambiente_isolado(exchange):
+            for nome, resultado in executar(
+                filtro=options["filtro"], amostras=options["amostras"],
+                silenciar=not options["mostrar_prints"], tamanhos_dashboard=tamanhos,
+            ):
+                resultados[nome] = resultado
+                linha = (
+                    f"{nome:<28} mediana {_formatar(resultado['mediana_us']):>11} | "
+                    f"p95 {_formatar(resultado['p95_us']):>11}"
+                )
+                if "rss_mb" in resultado:
+                    linha += f" | RSS {_formatar_campo('rss_mb', resultado['rss_mb']):>9}"
+                self.stdout.write(linha)
+
+        regressoes = []
+        for nome, resultado in resultados.items():
+            # pandas no boot do web ou do worker reprova mesmo sem baseline.
+            if resultado.get("proibidos"):
+                regressoes.append(nome)
+                self.stdout.write(self.style.ERROR(
+                    f"{nome}: {', '.join(resultado['proibidos'])} carregado(s) na inicialização."
+                ))
+
+        if baseline:
+            self.stdout.write(f"\nComparação com {caminho} (limite +{limite:.0%}):")
+            for nome, campo, base, atual, variacao, regrediu in comparar(resultados, baseline, limite):
+                rotulo = nome if campo == "mediana_us" else f"{nome} (RSS)"
+                if variacao is None:
+                    self.stdout.write(f"{rotulo:<34} sem baseline")
+                    continue
+                linha = (
+                    f"{rotulo:<34} {_formatar_campo(campo, base):>11} -> "
+                    f"{_formatar_campo(campo, atual):>11} ({variacao:+.1%})"
+                )
+                if regrediu:
+                    regressoes.append(rotulo)
+                    self.stdout.write(self.style.ERROR(linha + "  REGRESSÃO"))
+                else:
+                    self.stdout.write(linha)
+
+        if options["salvar"]:
+            # Um --filtro atualiza só os benchmarks medidos e mantém os demais.
+            salvar_baseline(caminho, {**baseline, **resultados})
+            self.stdout.write(self.style.SUCCESS(f"Baseline gravado em {caminho}."))
+        elif regressoes:
+            raise CommandError(f"{len(regressoes)} benchmark(s) acima do limite: {', '.join(regressoes)}")
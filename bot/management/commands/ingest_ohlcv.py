@@ -0,0 +1,83 @@
+import time
+
+from binance.exceptions import BinanceAPIException, BinanceRequestException
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.backtest import carregar_ohlcv
+from bot.binance_pool import get_client
+from bot.market_data import INTERVALOS_MS
+from bot.ohlcv_store import get_ohlcv_store
+from bot.weight_governor import PesoEsgotado
+
+# limit < 500 mantém o peso de cada página em 2.
+PAGINA = 499
+
+
+class Command(BaseCommand):
+    help = (
+        "Baixa (ou importa de CSV/Parquet) candles fechados para o histórico local em disco, "
+        "continuando do último candle gravado de cada symbol/timeframe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="+", help="Pares, ex: BTCUSDT ETHUSDT.")
+        parser.add_argument("--timeframe", action="append", default=[],
+                            help="Timeframe a gravar (repetível; padrão: 1m).")
+        parser.add_argument("--dias", type=float, default=30,
+                            help="Dias de histórico quando a série ainda está vazia.")
+        parser.add_argument("--arquivo", default=None,
+                            help="Importa este CSV/Parquet (um symbol e um timeframe) em vez de chamar a Binance.")
+        parser.add_argument("--testnet", action="store_true")
+
+    def handle(self, *args, **options):
+        timeframes = options["timeframe"] or ["1m"]
+        invalidos = [tf for tf in timeframes if tf not in INTERVALOS_MS]
+        if invalidos:
+            raise CommandError(f"Timeframe(s) inválido(s): {', '.join(invalidos)}")
+        symbols = [s.upper() for s in options["symbols"]]
+        store = get_ohlcv_store()
+
+        if options["arquivo"]:
+            if len(symbols) != 1 or len(timeframes) != 1:
+                raise CommandError("--arquivo importa um symbol e um timeframe por vez.")
+            try:
+                dados = carregar_ohlcv(options["arquivo"])
+                gravados = store.serie(symbols[0], timeframes[0]).acrescentar(dados)
+            except (OSError, ValueError, ImportError) as e:
+                raise CommandError(f"Não foi possível importar {options['arquivo']}: {e}")
+            self.stdout.write(f"{symbols[0]} {timeframes[0]}: {gravados} candles importados.")
+            return
+
+        client = get_client(None, None, options["testnet"])
+        for symbol in symbols:
+            for timeframe in timeframes:
+                try:
+                    gravados = self._baixar(client, store, symbol, timeframe, options["dias"])
+                except (BinanceAPIException, BinanceRequestException) as e:
+                    raise CommandError(f"Falha ao baixar {symbol} {timeframe}: {e}")
+                serie = store.serie(symbol, timeframe)
+                self.stdout.write(f"{symbol} {timeframe}: {gravados} candles novos, {len(serie)} no total.")
+
+    def _baixar(self, client, store, symbol, timeframe, dias):
+        intervalo_ms = INTERVALOS_MS[timeframe]
+        serie = store.serie(symbol, timeframe)
+        ultimo = serie.ultimo_open_time()
+        agora_ms = int(time.time() * 1000)
+        inicio = ultimo + intervalo_ms if ultimo is not None else agora_ms - int(dias * 86_400_000)
+
+        gravados = 0
+        while inicio + intervalo_ms <= agora_ms:
+            try:
+                # Klines entram no teto de "mercado": o backfill nunca toma o peso reservado às ordens.
+                pagina = client.futures_klines(symbol=symbol, interval=timeframe, startTime=inicio, limit=PAGINA)
+            except PesoEsgotado as e:
+                self.stdout.write(f"[Ingest] Peso da Binance esgotado; aguardando {e.espera:.1f}s.")
+                time.sleep(max(e.espera, 1.0))
+                continue
+            if not pagina:
+                break
+            gravados += store.acrescentar_klines(symbol, timeframe, pagina, agora_ms)
+            inicio = int(pagina[-1][0]) + intervalo_ms
+            if len(pagina) < PAGINA:
+                break
+        return gravados
@@ -0,0 +1,196 @@
+import contextlib
+import io
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from redis.exceptions import RedisError
+
+from bot import redis_client
+from bot.backtest import carregar_ohlcv
+from bot.models import BotControl, UserProfile
+from bot.simulator import SimulatedExchange, ambiente_isolado
+
+
+def _rss_mb():
+    """RSS atual do processo em MB (cai para o pico do getrusage fora do Linux)."""
+    try:
+        with open("/proc/self/status") as arquivo:
+            for linha in arquivo:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe N bots de usuários simulados contra o simulador de exchange e mede latência do ciclo de "
+        "checagem, queries/s no banco, operações/s no Redis e memória por bot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bots", default="10,100",
+                            help="Tamanhos de frota testados em sequência, ex: 100,500,1000.")
+        parser.add_argument("--duracao", type=float, default=30, help="Segundos medidos em cada tamanho.")
+        parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos entre checagens de cada bot.")
+        parser.add_argument("--threads", type=int, default=64)
+        parser.add_argument("--simbolos", default="BTCUSDT,ETHUSDT,SOLUSDT,BNBUSDT")
+        parser.add_argument("--timeframe", default="1m")
+        parser.add_argument("--aceleracao", type=float, default=60.0, help="Velocidade do relógio simulado.")
+        parser.add_argument("--latencia-ms", type=float, default=50.0, help="Latência média de cada chamada.")
+        parser.add_argument("--taxa-erro", type=float, default=0.0, help="Probabilidade de erro por chamada.")
+        parser.add_argument("--caminho", action="append", default=[],
+                            help="SYMBOL=arquivo com klines de 1m gravados (repetível).")
+        parser.add_argument("--redis-url", default=None,
+                            help="Redis usado no teste (padrão: o REDIS_URL configurado, banco 15).")
+        parser.add_argument("--mostrar-bots", action="store_true", help="Não silencia os prints dos bots.")
+
+    def handle(self, *args, **options):
+        try:
+            tamanhos = sorted(int(n) for n in options["bots"].split(","))
+        except ValueError:
+            raise CommandError("--bots deve ser uma lista de inteiros, ex: 100,500,1000.")
+        simbolos = [s.strip().upper() for s in options["simbolos"].split(",") if s.strip()]
+
+        caminhos = {}
+        for item in options["caminho"]:
+            symbol, _, arquivo = item.partition("=")
+            dados = carregar_ohlcv(arquivo)
+            caminhos[symbol.upper()] = (dados["open_time"], dados["close"])
+            if symbol.upper() not in simbolos:
+                simbolos.append(symbol.upper())
+
+        exchange = SimulatedExchange(
+            simbolos=simbolos, aceleracao=options["aceleracao"], latencia_ms=options["latencia_ms"],
+            taxa_erro=options["taxa_erro"], caminhos=caminhos,
+        )
+
+        self.executor = ThreadPoolExecutor(max_workers=options["threads"], thread_name_prefix="loadtest")
+        self.bots = []
+        with ambiente_isolado(exchange, options["redis_url"]):
+            try:
+                self.stdout.write(
+                    f"{'bots':>6} {'checks/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'atraso p95':>11} "
+                    f"{'queries/s':>10} {'redis ops/s':>12} {'MB/bot':>7} {'erros':>6}  status"
+                )
+                for tamanho in tamanhos:
+                    # Os prints dos bots são silenciados; o relatório sai pelo self.stdout.
+                    saida_bots = (
+                        contextlib.nullcontext() if options["mostrar_bots"]
+                        else contextlib.redirect_stdout(io.StringIO())
+                    )
+                    with saida_bots:
+                        linha = self._rodar_tamanho(tamanho, simbolos, options)
+                    self.stdout.write(linha)
+            finally:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+
+    # --- Internos ---
+
+    def _criar_bots(self, tamanho, simbolos, options):
+        from bot.bot_logic import TradingBot
+
+        novos = []
+        for i in range(len(self.bots), tamanho):
+            user = User.objects.create(username=f"loadtest_{i}")
+            perfil = UserProfile.objects.create(
+                user=user, api_key=f"sim-{i}", api_secret="sim",
+                telegram_bot_token="loadtest", telegram_chat_id=str(i),
+            )
+            control = BotControl.objects.create(
+                user=user, symbol=simbolos[i % len(simbolos)], timeframe=options["timeframe"],
+                ema_fast=6, ema_slow=12, quantidade_usdt=20.0, leverage=5, is_running=True,
+            )
+            novos.append((control, perfil))
+
+        def iniciar(args):
+            try:
+                return TradingBot(*args)
+            finally:
+                close_old_connections()
+
+        self.bots.extend(self.executor.map(iniciar, novos))
+
+    def _rodar_tamanho(self, tamanho, simbolos, options):
+        rss_antes = _rss_mb()
+        quantidade_antes = len(self.bots)
+        self._criar_bots(tamanho, simbolos, options)
+        mb_por_bot = (_rss_mb() - rss_antes) / max(1, len(self.bots) - quantidade_antes)
+
+        intervalo = options["intervalo"]
+        latencias, atrasos = [], []
+        contadores = {"queries": 0, "erros": 0}
+        mutex = threading.Lock()
+
+        def contar_query(execute, sql, params, many, context):
+            with mutex:
+                contadores["queries"] += 1
+            return execute(sql, params, many, context)
+
+        def checar(bot, previsto):
+            inicio = time.monotonic()
+            try:
+                with connection.execute_wrapper(contar_query):
+                    bot.run_single_check()
+            except Exception:
+                with mutex:
+                    contadores["erros"] += 1
+            fim = time.monotonic()
+            with mutex:
+                latencias.append(fim - inicio)
+                atrasos.append(inicio - previsto)
+            return bot
+
+        redis_antes = self._comandos_redis()
+        inicio = time.monotonic()
+        prazo = inicio + options["duracao"]
+        # Espalha as checagens no intervalo, como o runner faz com bots de horários diferentes.
+        proximas = [(inicio + intervalo * i / len(self.bots), bot) for i, bot in enumerate(self.bots)]
+        em_voo = {}
+        while time.monotonic() < prazo:
+            agora = time.monotonic()
+            pendentes = []
+            for previsto, bot in proximas:
+                if previsto <= agora and id(bot) not in em_voo:
+                    em_voo[id(bot)] = self.executor.submit(checar, bot, previsto)
+                    pendentes.append((previsto + intervalo, bot))
+                else:
+                    pendentes.append((previsto, bot))
+            proximas = pendentes
+            for chave in [c for c, f in em_voo.items() if f.done()]:
+                del em_voo[chave]
+            time.sleep(0.005)
+        for futuro in list(em_voo.values()):
+            futuro.result()
+        duracao = time.monotonic() - inicio
+        redis_depois = self._comandos_redis()
+
+        checks = len(latencias)
+        atraso_p95 = _percentil(atrasos, 0.95)
+        saturado = atraso_p95 > intervalo or contadores["erros"] > checks * 0.05
+        redis_ops = f"{(redis_depois - redis_antes) / duracao:12.0f}" if None not in (redis_antes, redis_depois) else f"{'n/d':>12}"
+        return (
+            f"{len(self.bots):>6} {checks / duracao:9.1f} {_percentil(latencias, 0.5) * 1000:8.1f} "
+            f"{_percentil(latencias, 0.95) * 1000:8.1f} {_percentil(latencias, 0.99) * 1000:8.1f} "
+            f"{atraso_p95 * 1000:9.0f}ms {contadores['queries'] / duracao:10.1f} {redis_ops} "
+            f"{mb_por_bot:7.2f} {contadores['erros']:>6}  {'SATURADO' if saturado else 'ok'}"
+        )
+
+    def _comandos_redis(self):
+        try:
+            return int(redis_client.get_redis().info("stats")["total_commands_processed"])
+        except (RedisError, KeyError):
+            return None
@@ -0,0 +1,108 @@
+import os
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.backtest import carregar_ohlcv
+from bot.market_data import INTERVALOS_MS
+from bot.models import OptimizationResult
+from bot.optimizer import gerar_combinacoes, otimizar
+
+
+def _valores(texto):
+    """Aceita lista ("6,9,12") ou faixa "inicio:fim[:passo]" (fim incluído)."""
+    if ":" in texto:
+        partes = [int(p) for p in texto.split(":")]
+        passo = partes[2] if len(partes) > 2 else 1
+        return list(range(partes[0], partes[1] + 1, passo))
+    return [int(p) for p in texto.split(",")]
+
+
+class Command(BaseCommand):
+    help = "Busca em grid ou aleatória de ema_fast/ema_slow/timeframe/leverage sobre arquivos de candles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivos", nargs="+",
+                            help="CSV/Parquet por símbolo; o símbolo vem do nome (ex: BTCUSDT-1m-2024.csv). "
+                                 "SYMBOL:timeframe (ex: BTCUSDT:1m) lê o histórico do ingest_ohlcv.")
+        parser.add_argument("--ema-fast", default="3:15", help="Lista (6,9) ou faixa inicio:fim[:passo].")
+        parser.add_argument("--ema-slow", default="10:50:2")
+        parser.add_argument("--timeframes", default="15m", help="Separados por vírgula, ex: 5m,15m,1h.")
+        parser.add_argument("--leverages", default="5")
+        parser.add_argument("--modo", choices=["grid", "random"], default="grid")
+        parser.add_argument("--amostras", type=int, default=200, help="Combinações sorteadas no modo random.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--dobras", type=int, default=0, help="Trechos de teste do walk-forward, usados no ranking (0 = ranking pela série inteira). "
+                                 "Os parâmetros não são reescolhidos por dobra.")
+        parser.add_argument("--fracao-treino", type=float, default=0.7)
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--quantidade", type=float, default=20.0)
+        parser.add_argument("--taxa", type=float, default=0.0004)
+        parser.add_argument("--slippage", type=float, default=0.0005)
+        parser.add_argument("--top", type=int, default=10)
+
+    def handle(self, *args, **options):
+        timeframes = options["timeframes"].split(",")
+        invalidos = [tf for tf in timeframes if tf not in INTERVALOS_MS]
+        if invalidos:
+            raise CommandError(f"Timeframe(s) inválido(s): {', '.join(invalidos)}")
+        if not 0 < options["fracao_treino"] < 1:
+            raise CommandError("--fracao-treino deve estar entre 0 e 1.")
+
+        series = {}
+        origens = {}
+        for caminho in options["arquivos"]:
+            symbol = os.path.basename(caminho).split("-")[0].split(".")[0].split(":")[0].upper()
+            if symbol in origens:
+                # Os resultados são por símbolo: o segundo arquivo sobrescreveria o primeiro.
+                raise CommandError(
+                    f"{origens[symbol]} e {caminho} são do mesmo símbolo ({symbol}); junte os candles num arquivo só."
+                )
+            origens[symbol] = caminho
+            try:
+                dados = carregar_ohlcv(caminho)
+            except (OSError, ValueError, ImportError) as e:
+                raise CommandError(f"Não foi possível ler {caminho}: {e}")
+            series[symbol] = (dados["open_time"], dados["close"])
+
+        combinacoes = gerar_combinacoes(
+            _valores(options["ema_fast"]), _valores(options["ema_slow"]), timeframes,
+            _valores(options["leverages"]), modo=options["modo"], amostras=options["amostras"], seed=options["seed"],
+        )
+        if not combinacoes:
+            raise CommandError("Nenhuma combinação com ema_fast < ema_slow.")
+
+        execucao = uuid.uuid4().hex[:12]
+        total = len(combinacoes) * len(series)
+        chave = "pnl_fora_amostra" if options["dobras"] > 0 else "pnl_total"
+        self.stdout.write(f"Execução {execucao}: {total} avaliações em {options['workers']} processos.")
+
+        parametros = {
+            "quantidade_usdt": options["quantidade"], "taxa": options["taxa"], "slippage": options["slippage"],
+        }
+        inicio = time.perf_counter()
+        salvos = []
+        for n, resultado in enumerate(otimizar(series, combinacoes, options["dobras"], options["fracao_treino"],
+                                               options["workers"], parametros), start=1):
+            # Cada resultado vai para o banco assim que chega, para acompanhar pelo admin.
+            salvos.append(OptimizationResult.objects.create(execucao=execucao, **resultado))
+            self.stdout.write(
+                f"[{n}/{total}] {resultado['symbol']} {resultado['timeframe']} "
+                f"EMA {resultado['ema_fast']}/{resultado['ema_slow']} x{resultado['leverage']}: "
+                f"{chave} {resultado[chave]:.4f} | trades {resultado['trades']}"
+            )
+        duracao = time.perf_counter() - inicio
+
+        salvos.sort(key=lambda r: getattr(r, chave), reverse=True)
+        for posicao, registro in enumerate(salvos, start=1):
+            registro.ranking = posicao
+        OptimizationResult.objects.bulk_update(salvos, ["ranking"], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(f"\nConcluído em {duracao:.1f}s ({total / duracao:.1f} avaliações/s)."))
+        for registro in salvos[:options["top"]]:
+            self.stdout.write(
+                f"#{registro.ranking} {registro.symbol} {registro.timeframe} EMA {registro.ema_fast}/{registro.ema_slow} "
+                f"x{registro.leverage} | {chave} {getattr(registro, chave):.4f} | win rate {registro.win_rate:.2f}% "
+                f"| DD {registro.max_drawdown_percent:.2f}%"
+            )
@@ -0,0 +1,25 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from bot.runner import BotRunner
+
+
+class Command(BaseCommand):
+    help = "Executa o runner dedicado de bots (substitui uma tarefa do Celery por usuário)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--worker-id", default=None, help="Identificador do worker no anel (padrão: host:pid).")
+        parser.add_argument("--threads", type=int, default=None, help="Threads para checagens (padrão: BOT_RUNNER_THREADS).")
+
+    def handle(self, *args, **options):
+        runner = BotRunner(worker_id=options["worker_id"], threads=options["threads"])
+
+        # SIGTERM (deploy/restart) encerra de forma limpa: os leases são liberados e
+        # outro worker adota os bots sem esperar o timeout.
+        def _sinal(signum, frame):
+            runner.parar()
+
+        signal.signal(signal.SIGTERM, _sinal)
+        signal.signal(signal.SIGINT, _sinal)
+        runner.rodar()
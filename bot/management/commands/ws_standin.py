@@ -0,0 +1,158 @@
+import asyncio
+import random
+import threading
+import time
+
+from aiohttp import web
+from django.core.management.base import BaseCommand
+
+
+class KlineStandIn:
+    """
+    Servidor websocket que imita os streams combinados de kline/markPrice da Binance
+    (`/stream?streams=...`), com um passeio aleatório de preço e candles acelerados.
+
+    `iniciar()` sobe o servidor numa thread própria (porta 0 = qualquer livre), para os
+    testes do KlineStream; o comando `ws_standin` roda o mesmo app em primeiro plano.
+    """
+
+    def __init__(self, candle_segundos=5.0, preco=100.0, volatilidade=0.002, derrubar_apos=0.0,
+                 intervalo=0.5, host="127.0.0.1", porta=0):
+        self.candle_segundos = candle_segundos
+        self.preco = preco
+        self.volatilidade = volatilidade
+        self.derrubar_apos = derrubar_apos
+        self.intervalo = intervalo
+        self.host = host
+        self.porta = porta
+        self.conexoes_recebidas = 0
+        self._loop = None
+        self._runner = None
+        self._conexoes = set()
+        self._pronto = threading.Event()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.porta}"
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/stream", self._stream)
+        return app
+
+    def iniciar(self):
+        threading.Thread(target=self._rodar, name="kline-standin", daemon=True).start()
+        self._pronto.wait(5)
+        return self
+
+    def parar(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._desligar(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def derrubar_conexoes(self):
+        """Fecha todas as conexões abertas (para testar o fallback e a reconexão do consumidor)."""
+        for ws in list(self._conexoes):
+            asyncio.run_coroutine_threadsafe(ws.close(), self._loop)
+
+    # --- Internos ---
+
+    def _rodar(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.app())
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.porta)
+        self._loop.run_until_complete(site.start())
+        self.porta = site._server.sockets[0].getsockname()[1]
+        self._pronto.set()
+        self._loop.run_forever()
+
+    async def _desligar(self):
+        for ws in list(self._conexoes):
+            await ws.close()
+        await self._runner.cleanup()
+
+    async def _stream(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._conexoes.add(ws)
+        self.conexoes_recebidas += 1
+        tarefa = asyncio.create_task(self._transmitir(ws, request.query.get("streams", "").split("/")))
+        try:
+            # Lê o socket para responder ao close/ping do cliente.
+            async for _ in ws:
+                pass
+        finally:
+            tarefa.cancel()
+            self._conexoes.discard(ws)
+        return ws
+
+    async def _transmitir(self, ws, streams):
+        duracao_ms = int(self.candle_segundos * 1000)
+        preco = self.preco
+        rng = random.Random()
+        inicio_conexao = time.monotonic()
+
+        agora_ms = int(time.time() * 1000)
+        abertura = agora_ms - agora_ms % duracao_ms
+        candle = {"o": preco, "h": preco, "l": preco}
+
+        while not ws.closed:
+            await asyncio.sleep(self.intervalo)
+            if self.derrubar_apos and time.monotonic() - inicio_conexao >= self.derrubar_apos:
+                await ws.close()
+                break
+
+            preco *= 1 + rng.gauss(0, self.volatilidade)
+            candle["h"] = max(candle["h"], preco)
+            candle["l"] = min(candle["l"], preco)
+            agora_ms = int(time.time() * 1000)
+            fechou = agora_ms >= abertura + duracao_ms
+
+            for nome in streams:
+                simbolo, _, tipo = nome.partition("@")
+                if tipo.startswith("kline_"):
+                    dados = {
+                        "e": "kline", "E": agora_ms, "s": simbolo.upper(),
+                        "k": {
+                            "t": abertura, "T": abertura + duracao_ms - 1, "s": simbolo.upper(),
+                            "i": tipo[len("kline_"):], "o": f"{candle['o']:.4f}", "c": f"{preco:.4f}",
+                            "h": f"{candle['h']:.4f}", "l": f"{candle['l']:.4f}", "v": "0", "x": fechou,
+                        },
+                    }
+                elif tipo.startswith("markPrice"):
+                    dados = {"e": "markPriceUpdate", "E": agora_ms, "s": simbolo.upper(), "p": f"{preco:.4f}"}
+                else:
+                    continue
+                if ws.closed:
+                    break
+                await ws.send_json({"stream": nome, "data": dados})
+
+            if fechou:
+                abertura += duracao_ms
+                candle = {"o": preco, "h": preco, "l": preco}
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe um servidor websocket local que imita os streams de kline/markPrice da Binance. "
+        "Aponte BINANCE_WS_URL=ws://<host>:<porta> para testar o modo streaming sem a Binance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--porta", type=int, default=8765)
+        parser.add_argument("--candle-segundos", type=float, default=5.0, help="Duração acelerada de cada candle.")
+        parser.add_argument("--preco", type=float, default=100.0, help="Preço inicial do passeio aleatório.")
+        parser.add_argument("--volatilidade", type=float, default=0.002, help="Desvio padrão por tick (fração).")
+        parser.add_argument("--derrubar-apos", type=float, default=0.0,
+                            help="Fecha cada conexão após N segundos para testar o fallback (0 = nunca).")
+
+    def handle(self, *args, **options):
+        standin = KlineStandIn(
+            candle_segundos=options["candle_segundos"], preco=options["preco"],
+            volatilidade=options["volatilidade"], derrubar_apos=options["derrubar_apos"],
+        )
+        self.stdout.write(f"Stand-in de websocket em ws://{options['host']}:{options['porta']}/stream")
+        web.run_app(standin.app(), host=options["host"], port=options["porta"], print=None)
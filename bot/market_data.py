@@ -0,0 +1,387 @@
+import json
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+from .weight_governor import PesoEsgotado
+
+# Série de candles compartilhada entre os bots. Os campos são tuplas, então
+# nenhum bot consegue alterar a série que os outros estão lendo.
+CandleSeries = namedtuple(
+    "CandleSeries", ["symbol", "timeframe", "open_times", "closes", "highs", "lows", "limit", "fetched_at"]
+)
+
+CHAVE_SERIE = "md:klines:{symbol}:{timeframe}"
+CHAVE_LOCK = "md:lock:{symbol}:{timeframe}"
+CHAVE_STATS = "md:stats"
+TIPOS_CONTADOR = ("hits", "misses", "fetches", "candles", "gaps")
+
+# Duração de cada timeframe da Binance em milissegundos. Intervalos de tamanho
+# variável (1M) não entram aqui e sempre são buscados por completo.
+INTERVALOS_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000, "3d": 259_200_000,
+    "1w": 604_800_000,
+}
+
+# Libera o lock apenas se ele ainda pertence a quem o adquiriu.
+_LUA_LIBERAR_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class MarketDataHub:
+    """
+    Hub de candles por (symbol, timeframe) compartilhado por todos os bots.
+
+    A série fica em memória no processo e no Redis para os outros workers. Um lock
+    no Redis garante uma única chamada a `futures_klines` por chave a cada
+    `MARKET_DATA_TTL_SECONDS`; os demais bots reaproveitam o resultado.
+
+    Quando já existe uma série (local ou no Redis, mesmo vencida), a busca é
+    incremental: só os candles a partir do último em formação são pedidos, o
+    candle em formação é substituído no lugar e buracos são preenchidos por
+    páginas com `startTime`. Sem base utilizável, a janela inteira é baixada.
+
+    Com OHLCV_STORE_ENABLED, os candles fechados baixados vão para o histórico em
+    disco (ohlcv_store) e, sem série local nem no Redis, ele serve de base do delta.
+    """
+    LOCK_TIMEOUT = 10      # segundos que um worker pode segurar o lock de busca
+    ESPERA_LOCK = 3.0      # segundos esperando outro worker publicar a série
+    RETENCAO_FATOR = 10    # a série fica no Redis por TTL * fator
+    PAGINA_DELTA = 99      # limit < 100 mantém o peso da chamada em 1
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else settings.MARKET_DATA_TTL_SECONDS
+        self._local = {}
+        self._contadores = {}
+        self._mutex = threading.Lock()
+
+    def obter_candles(self, client, symbol, timeframe, limit):
+        """
+        Retorna a série de candles mais recente para (symbol, timeframe).
+
+        Args:
+            client: Cliente da Binance usado caso seja preciso buscar os candles.
+            symbol (str): Par negociado, ex: "BTCUSDT".
+            timeframe (str): Intervalo dos candles, ex: "15m".
+            limit (int): Quantidade mínima de candles que o chamador precisa.
+
+        Returns:
+            CandleSeries: Série somente leitura compartilhada entre os bots.
+        """
+        chave = (symbol, timeframe)
+
+        serie = self._local.get(chave)
+        if self._serie_valida(serie, limit):
+            self._registrar(chave, "hits")
+            return serie
+
+        serie = self._ler_redis(symbol, timeframe)
+        if self._serie_valida(serie, limit):
+            self._local[chave] = serie
+            self._registrar(chave, "hits")
+            return serie
+
+        self._registrar(chave, "misses")
+        return self._buscar_coordenado(client, symbol, timeframe, limit)
+
+    def estatisticas(self):
+        """
+        Contadores de hits, misses e fetches por chave, somados entre todos os workers.
+
+        Returns:
+            dict: {"BTCUSDT:15m": {"hits": 10, "misses": 1, "fetches": 1, "candles": 200, "gaps": 0}, ...}
+        """
+        try:
+            brutos = get_redis().hgetall(CHAVE_STATS)
+            contadores = {}
+            for campo, valor in brutos.items():
+                chave, tipo = campo.decode().rsplit(":", 1)
+                contadores.setdefault(chave, dict.fromkeys(TIPOS_CONTADOR, 0))[tipo] = int(valor)
+            return contadores
+        except RedisError as e:
+            print(f"[MarketData] Redis indisponível, retornando apenas estatísticas locais: {e}")
+            with self._mutex:
+                return {k: dict(v) for k, v in self._contadores.items()}
+
+    # --- Internos ---
+
+    def _serie_valida(self, serie, limit):
+        if serie is None or serie.limit < limit:
+            return False
+        agora = time.time()
+        # Se o candle que estava em formação já fechou, a série está velha mesmo
+        # dentro do TTL: quem avalia no fechamento precisa do candle final.
+        intervalo_ms = INTERVALOS_MS.get(serie.timeframe)
+        if intervalo_ms and serie.open_times and agora * 1000 >= serie.open_times[-1] + intervalo_ms:
+            return False
+        return (agora - serie.fetched_at) < self.ttl
+
+    def _buscar_coordenado(self, client, symbol, timeframe, limit):
+        chave_lock = CHAVE_LOCK.format(symbol=symbol, timeframe=timeframe)
+        token = uuid.uuid4().hex
+        try:
+            adquiriu = bool(get_redis().set(chave_lock, token, nx=True, ex=self.LOCK_TIMEOUT))
+        except RedisError as e:
+            print(f"[MarketData] Redis indisponível, buscando {symbol} {timeframe} sem coordenação: {e}")
+            adquiriu = None
+
+        if adquiriu is False:
+            # Outro worker já está buscando essa chave: espera ele publicar.
+            prazo = time.monotonic() + self.ESPERA_LOCK
+            while time.monotonic() < prazo:
+                time.sleep(0.1)
+                serie = self._ler_redis(symbol, timeframe)
+                if self._serie_valida(serie, limit):
+                    self._local[(symbol, timeframe)] = serie
+                    return serie
+
+        try:
+            try:
+                serie = self._buscar_binance(client, symbol, timeframe, limit)
+            except PesoEsgotado as e:
+                # Peso da Binance apertado: todos os bots da chave ficam com a última
+                # série publicada (mesmo vencida) até a janela abrir.
+                serie = self._local.get((symbol, timeframe)) or self._ler_redis(symbol, timeframe)
+                if serie is None or serie.limit < limit:
+                    raise
+                print(f"[MarketData] {symbol} {timeframe}: usando a série anterior ({e}).")
+                return serie
+            self._local[(symbol, timeframe)] = serie
+            self._publicar(serie)
+            return serie
+        finally:
+            if adquiriu:
+                try:
+                    get_redis().eval(_LUA_LIBERAR_LOCK, 1, chave_lock, token)
+                except RedisError:
+                    pass
+
+    def _buscar_binance(self, client, symbol, timeframe, limit):
+        chave = (symbol, timeframe)
+        # Base para a busca incremental: a série local ou, após um restart, a
+        # última publicada no Redis (mesmo vencida) ou o histórico em disco.
+        base = self._local.get(chave) or self._ler_redis(symbol, timeframe)
+        if base is None and settings.OHLCV_STORE_ENABLED:
+            base = self._ler_store(symbol, timeframe, limit)
+        if base is not None:
+            if base.limit < limit:
+                # Alguém pediu mais histórico do que a base tem: baixa a janela maior.
+                base = None
+            else:
+                # Mantém o maior limite já visto para a chave, assim bots com EMAs
+                # longas e curtas no mesmo par não disputam a série entre si.
+                limit = base.limit
+
+        intervalo_ms = INTERVALOS_MS.get(timeframe)
+        if base is not None and intervalo_ms and len(base.open_times) >= 2:
+            serie = self._buscar_delta(client, base, intervalo_ms, limit)
+            if serie is not None:
+                return serie
+
+        candles = client.futures_klines(symbol=symbol, interval=timeframe, limit=limit)
+        self._registrar(chave, "fetches")
+        self._registrar(chave, "candles", len(candles))
+        self._persistir(symbol, timeframe, candles)
+        return CandleSeries(
+            symbol=symbol,
+            timeframe=timeframe,
+            open_times=tuple(int(c[0]) for c in candles),
+            closes=tuple(float(c[4]) for c in candles),
+            highs=tuple(float(c[2]) for c in candles),
+            lows=tuple(float(c[3]) for c in candles),
+            limit=limit,
+            fetched_at=time.time(),
+        )
+
+    def _buscar_delta(self, client, base, intervalo_ms, limit):
+        """
+        Completa `base` com os candles a partir do último (que estava em formação).
+
+        Returns:
+            CandleSeries | None: Série atualizada, ou None quando o buraco é maior que a
+            janela ou a série resultante não é contínua (o chamador baixa tudo de novo).
+        """
+        chave = (base.symbol, base.timeframe)
+        inicio = base.open_times[-1]
+        agora_ms = int(time.time() * 1000)
+        faltando = (agora_ms - inicio) // intervalo_ms + 1
+        if faltando >= limit:
+            # Ficamos parados mais tempo que a janela inteira: não há o que aproveitar.
+            return None
+        if faltando > 2:
+            # Buraco na série (worker reiniciado, Redis vencido, etc): preenche por páginas.
+            self._registrar(chave, "gaps")
+
+        novos = []
+        while True:
+            pagina = client.futures_klines(
+                symbol=base.symbol, interval=base.timeframe, startTime=inicio, limit=self.PAGINA_DELTA
+            )
+            self._registrar(chave, "fetches")
+            self._registrar(chave, "candles", len(pagina))
+            novos.extend(pagina)
+            if len(pagina) < self.PAGINA_DELTA or len(novos) >= limit:
+                break
+            inicio = int(pagina[-1][0]) + intervalo_ms
+        self._persistir(base.symbol, base.timeframe, novos)
+
+        open_times = list(base.open_times)
+        closes = list(base.closes)
+        highs = list(base.highs)
+        lows = list(base.lows)
+        for candle in novos:
+            open_time, close = int(candle[0]), float(candle[4])
+            high, low = float(candle[2]), float(candle[3])
+            if open_time > open_times[-1]:
+                open_times.append(open_time)
+                closes.append(close)
+                highs.append(high)
+                lows.append(low)
+                continue
+            # Candle já conhecido (o que estava em formação): substitui no lugar.
+            i = len(open_times) - 1
+            while i >= 0 and open_times[i] > open_time:
+                i -= 1
+            if i >= 0 and open_times[i] == open_time:
+                closes[i] = close
+                highs[i] = high
+                lows[i] = low
+
+        excesso = len(open_times) - limit
+        if excesso > 0:
+            for coluna in (open_times, closes, highs, lows):
+                del coluna[:excesso]
+
+        # Só o trecho novo pode ter buracos; a base já era contínua.
+        for i in range(max(1, len(open_times) - len(novos) - 1), len(open_times)):
+            if open_times[i] - open_times[i - 1] != intervalo_ms:
+                print(f"[MarketData] Série {base.symbol} {base.timeframe} descontínua após o delta; baixando a janela inteira.")
+                self._registrar(chave, "gaps")
+                return None
+
+        return CandleSeries(
+            symbol=base.symbol,
+            timeframe=base.timeframe,
+            open_times=tuple(open_times),
+            closes=tuple(closes),
+            highs=tuple(highs),
+            lows=tuple(lows),
+            limit=limit,
+            fetched_at=time.time(),
+        )
+
+    def _ler_store(self, symbol, timeframe, limit):
+        """
+        Os últimos `limit` candles fechados do histórico em disco, como base do delta.
+
+        Returns:
+            CandleSeries | None: Série vencida (fetched_at=0), ou None se o histórico é
+            curto, tem buracos ou não pode ser lido.
+        """
+        from .ohlcv_store import get_ohlcv_store
+
+        intervalo_ms = INTERVALOS_MS.get(timeframe)
+        if not intervalo_ms:
+            return None
+        try:
+            dados = get_ohlcv_store().serie(symbol, timeframe).ler(ultimos=limit)
+        except (OSError, ValueError) as e:
+            print(f"[MarketData] Falha ao ler o histórico de {symbol} {timeframe} em disco: {e}")
+            return None
+        open_times = dados["open_time"].tolist()
+        if len(open_times) < limit or any(b - a != intervalo_ms for a, b in zip(open_times, open_times[1:])):
+            return None
+        # O último candle fechado faz o papel do "em formação": o delta começa nele.
+        return CandleSeries(
+            symbol=symbol,
+            timeframe=timeframe,
+            open_times=tuple(open_times),
+            closes=tuple(dados["close"].tolist()),
+            highs=tuple(dados["high"].tolist()),
+            lows=tuple(dados["low"].tolist()),
+            limit=limit,
+            fetched_at=0.0,
+        )
+
+    def _persistir(self, symbol, timeframe, candles):
+        """Grava no histórico em disco os candles fechados recebidos da Binance."""
+        if not settings.OHLCV_STORE_ENABLED or not candles or timeframe not in INTERVALOS_MS:
+            return
+        from .ohlcv_store import get_ohlcv_store
+
+        try:
+            get_ohlcv_store().acrescentar_klines(symbol, timeframe, candles)
+        except (OSError, ValueError) as e:
+            print(f"[MarketData] Falha ao gravar {symbol} {timeframe} no histórico em disco: {e}")
+
+    def _ler_redis(self, symbol, timeframe):
+        try:
+            bruto = get_redis().get(CHAVE_SERIE.format(symbol=symbol, timeframe=timeframe))
+        except RedisError:
+            return None
+        if not bruto:
+            return None
+        dados = json.loads(bruto)
+        if "highs" not in dados:
+            # Publicada por uma versão sem máximas/mínimas: baixa de novo.
+            return None
+        return CandleSeries(
+            symbol=symbol,
+            timeframe=timeframe,
+            open_times=tuple(dados["open_times"]),
+            closes=tuple(dados["closes"]),
+            highs=tuple(dados["highs"]),
+            lows=tuple(dados["lows"]),
+            limit=dados["limit"],
+            fetched_at=dados["fetched_at"],
+        )
+
+    def _publicar(self, serie):
+        dados = {
+            "open_times": serie.open_times,
+            "closes": serie.closes,
+            "highs": serie.highs,
+            "lows": serie.lows,
+            "limit": serie.limit,
+            "fetched_at": serie.fetched_at,
+        }
+        try:
+            get_redis().set(
+                CHAVE_SERIE.format(symbol=serie.symbol, timeframe=serie.timeframe),
+                json.dumps(dados),
+                ex=max(1, int(self.ttl * self.RETENCAO_FATOR)),
+            )
+        except RedisError as e:
+            print(f"[MarketData] Falha ao publicar {serie.symbol} {serie.timeframe} no Redis: {e}")
+
+    def _registrar(self, chave, tipo, quantidade=1):
+        nome = f"{chave[0]}:{chave[1]}"
+        with self._mutex:
+            contadores = self._contadores.setdefault(nome, dict.fromkeys(TIPOS_CONTADOR, 0))
+            contadores[tipo] += quantidade
+        try:
+            get_redis().hincrby(CHAVE_STATS, f"{nome}:{tipo}", quantidade)
+        except RedisError:
+            pass
+
+
+_hub = None
+
+
+def get_market_data_hub():
+    """Retorna o hub de candles do processo, criando-o na primeira chamada."""
+    global _hub
+    if _hub is None:
+        _hub = MarketDataHub()
+    return _hub
@@ -0,0 +1,254 @@
+import atexit
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+# ===================================================================
+# Métricas (contadores, histogramas e gauges) somadas entre processos
+# ===================================================================
+
+CHAVE_VALORES = "metricas:valores"   # séries acumuladas (HINCRBYFLOAT)
+CHAVE_GAUGES = "metricas:gauges"     # último valor gravado (HSET)
+CHAVE_TIPOS = "metricas:tipos"       # nome -> counter | histogram | gauge
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_QUERIES = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Entrega de notificações: inclui o intervalo por chat, digests e os backoffs das retentativas.
+BUCKETS_ENTREGA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _rotulos_texto(rotulos, extra=None):
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in pares) + "}"
+
+
+def _formatar_numero(valor):
+    valor = float(valor)
+    if valor == float("inf"):
+        return "+Inf"
+    return str(int(valor)) if valor.is_integer() else repr(valor)
+
+
+class MetricsRegistry:
+    """
+    Coleta métricas no processo e envia os deltas ao Redis de tempos em tempos.
+
+    Registrar uma observação só mexe em dicionários locais (alguns microssegundos);
+    uma thread em segundo plano manda tudo num pipeline a cada METRICS_FLUSH_SECONDS.
+    No Redis os contadores são somados (HINCRBYFLOAT), então o endpoint mostra o
+    total de todos os workers do Celery e runners. Os gauges guardam o último valor.
+    """
+
+    def __init__(self, intervalo_envio=None):
+        self.intervalo_envio = intervalo_envio or settings.METRICS_FLUSH_SECONDS
+        self._mutex = threading.Lock()
+        self._contadores = {}   # (nome, rotulos) -> valor
+        self._histogramas = {}  # (nome, rotulos) -> [contagem por bucket..., +Inf, soma]
+        self._buckets = {}      # nome -> buckets
+        self._gauges = {}       # (nome, rotulos) -> valor
+        self._tipos = {}
+        self._pid = None
+
+    # --- Registro ---
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._mutex:
+            self._tipos[nome] = "counter"
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+        self._garantir_envio()
+
+    def observar(self, nome, valor, buckets=BUCKETS_SEGUNDOS, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        indice = bisect.bisect_left(buckets, valor)
+        with self._mutex:
+            contagens = self._histogramas.get(chave)
+            if contagens is None:
+                self._tipos[nome] = "histogram"
+                self._buckets[nome] = buckets
+                contagens = self._histogramas[chave] = [0] * (len(buckets) + 2)
+            contagens[indice] += 1
+            contagens[-1] += valor
+        self._garantir_envio()
+
+    def definir(self, nome, valor, **rotulos):
+        with self._mutex:
+            self._tipos[nome] = "gauge"
+            self._gauges[(nome, tuple(sorted(rotulos.items())))] = valor
+        self._garantir_envio()
+
+    @contextmanager
+    def cronometrar(self, nome, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def remover_series(self, **rotulos):
+        """
+        Apaga deste processo e do Redis as séries que têm todos os `rotulos` (ex:
+        bot="42" de um bot parado), para os hashes não crescerem com bots que não voltam.
+        """
+        if not rotulos:
+            return
+        pares = set(rotulos.items())
+        with self._mutex:
+            for series in (self._contadores, self._histogramas, self._gauges):
+                for chave in [c for c in series if pares <= set(c[1])]:
+                    del series[chave]
+        trechos = [f'{k}="{str(v).replace(chr(34), "")}"' for k, v in sorted(rotulos.items())]
+        try:
+            r = get_redis()
+            for chave_redis in (CHAVE_VALORES, CHAVE_GAUGES):
+                # O MATCH só filtra pelo primeiro rótulo; o resto é conferido aqui.
+                campos = [
+                    campo for campo in r.hscan_iter(chave_redis, match=f"*{trechos[0]}*", count=1000)
+                    if self._tem_rotulos(campo[0].decode(), trechos)
+                ]
+                if campos:
+                    r.hdel(chave_redis, *(campo for campo, _ in campos))
+        except RedisError as e:
+            print(f"[Metricas] Falha ao remover séries {rotulos} do Redis: {e}")
+
+    # --- Envio e exportação ---
+
+    def enviar(self):
+        """Manda os deltas acumulados ao Redis. Se falhar, eles voltam para a próxima tentativa."""
+        with self._mutex:
+            contadores, histogramas, gauges = self._contadores, self._histogramas, self._gauges
+            self._contadores, self._histogramas, self._gauges = {}, {}, {}
+            tipos, buckets = dict(self._tipos), dict(self._buckets)
+        if not (contadores or histogramas or gauges):
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for campo, valor in self._series(contadores, histogramas, buckets):
+                pipe.hincrbyfloat(CHAVE_VALORES, campo, valor)
+            if gauges:
+                pipe.hset(CHAVE_GAUGES, mapping={
+                    f"{nome}{_rotulos_texto(rotulos)}": valor for (nome, rotulos), valor in gauges.items()
+                })
+            pipe.hset(CHAVE_TIPOS, mapping=tipos)
+            pipe.execute()
+        except RedisError as e:
+            print(f"[Metricas] Falha ao enviar métricas ao Redis: {e}")
+            self._devolver(contadores, histogramas, gauges)
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus com os totais de todos os processos."""
+        self.enviar()
+        try:
+            r = get_redis()
+            valores, gauges, tipos = r.hgetall(CHAVE_VALORES), r.hgetall(CHAVE_GAUGES), r.hgetall(CHAVE_TIPOS)
+            series = {k.decode(): float(v) for k, v in valores.items()}
+            series.update({k.decode(): float(v) for k, v in gauges.items()})
+            tipos = {k.decode(): v.decode() for k, v in tipos.items()}
+        except RedisError as e:
+            print(f"[Metricas] Redis indisponível, exportando só este processo: {e}")
+            with self._mutex:
+                series = dict(self._series(self._contadores, self._histogramas, self._buckets))
+                series.update({f"{n}{_rotulos_texto(r)}": v for (n, r), v in self._gauges.items()})
+                tipos = dict(self._tipos)
+
+        por_nome = {}
+        for serie, valor in series.items():
+            base = serie.split("{", 1)[0]
+            for sufixo in ("_bucket", "_sum", "_count"):
+                if base.endswith(sufixo) and tipos.get(base[:-len(sufixo)]) == "histogram":
+                    base = base[:-len(sufixo)]
+                    break
+            por_nome.setdefault(base, []).append((serie, valor))
+
+        linhas = []
+        for nome in sorted(por_nome):
+            linhas.append(f"# TYPE {nome} {tipos.get(nome, 'untyped')}")
+            linhas.extend(f"{serie} {_formatar_numero(valor)}" for serie, valor in sorted(por_nome[nome]))
+        return "\n".join(linhas) + "\n"
+
+    # --- Internos ---
+
+    @staticmethod
+    def _series(contadores, histogramas, buckets):
+        for (nome, rotulos), valor in contadores.items():
+            yield f"{nome}{_rotulos_texto(rotulos)}", valor
+        for (nome, rotulos), contagens in histogramas.items():
+            acumulado = 0
+            for limite, contagem in zip(buckets[nome] + (float("inf"),), contagens):
+                acumulado += contagem
+                yield f"{nome}_bucket{_rotulos_texto(rotulos, ('le', _formatar_numero(limite)))}", acumulado
+            yield f"{nome}_sum{_rotulos_texto(rotulos)}", contagens[-1]
+            yield f"{nome}_count{_rotulos_texto(rotulos)}", acumulado
+
+    @staticmethod
+    def _tem_rotulos(serie, trechos):
+        if "{" not in serie:
+            return False
+        presentes = serie[serie.index("{") + 1:-1].split(",")
+        return all(trecho in presentes for trecho in trechos)
+
+    def _devolver(self, contadores, histogramas, gauges):
+        with self._mutex:
+            for chave, valor in contadores.items():
+                self._contadores[chave] = self._contadores.get(chave, 0) + valor
+            for chave, contagens in histogramas.items():
+                atuais = self._histogramas.setdefault(chave, [0] * len(contagens))
+                for i, valor in enumerate(contagens):
+                    atuais[i] += valor
+            for chave, valor in gauges.items():
+                self._gauges.setdefault(chave, valor)
+
+    def _garantir_envio(self):
+        # A thread não sobrevive ao fork dos workers do Celery: cada processo inicia a sua.
+        if self._pid == os.getpid():
+            return
+        with self._mutex:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Processo filho: o que veio do pai será enviado pelo próprio pai.
+                self._contadores, self._histogramas, self._gauges = {}, {}, {}
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop_envio, daemon=True, name="metricas").start()
+        atexit.register(self.enviar)
+
+    def _loop_envio(self):
+        while True:
+            time.sleep(self.intervalo_envio)
+            try:
+                self.enviar()
+            except Exception as e:
+                print(f"[Metricas] Erro inesperado no envio: {e}")
+
+
+class ContadorQueries:
+    """`execute_wrapper` do Django que conta as queries feitas dentro do bloco."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+_metricas = None
+_metricas_mutex = threading.Lock()
+
+
+def get_metrics():
+    """Retorna o registro de métricas do processo, criando-o na primeira chamada."""
+    global _metricas
+    with _metricas_mutex:
+        if _metricas is None:
+            _metricas = MetricsRegistry()
+    return _metricas
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0002_trade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptimizationResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('execucao', models.CharField(db_index=True, max_length=32)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('symbol', models.CharField(max_length=20)),
+                ('timeframe', models.CharField(max_length=10)),
+                ('ema_fast', models.IntegerField()),
+                ('ema_slow', models.IntegerField()),
+                ('leverage', models.IntegerField()),
+                ('pnl_total', models.FloatField()),
+                ('pnl_fora_amostra', models.FloatField(blank=True, null=True)),
+                ('trades', models.IntegerField()),
+                ('win_rate', models.FloatField()),
+                ('max_drawdown_percent', models.FloatField()),
+                ('ranking', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['execucao', 'ranking'],
+            },
+        ),
+    ]
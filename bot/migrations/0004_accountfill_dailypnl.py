@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0003_optimizationresult'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountFill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trade_id', models.BigIntegerField()),
+                ('order_id', models.BigIntegerField()),
+                ('symbol', models.CharField(max_length=20)),
+                ('side', models.CharField(max_length=5)),
+                ('price', models.FloatField()),
+                ('qty', models.FloatField()),
+                ('realized_pnl', models.FloatField()),
+                ('commission', models.FloatField()),
+                ('commission_asset', models.CharField(max_length=10)),
+                ('time', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'time'], name='fill_user_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'symbol', 'trade_id'), name='fill_unico_por_usuario')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPnl',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('trades', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+                ('pnl', models.FloatField(default=0.0)),
+                ('comissao', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['dia'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'dia'), name='dailypnl_unico_por_dia')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_accountfill_dailypnl'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradeArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trade_id', models.BigIntegerField(unique=True)),
+                ('symbol', models.CharField(max_length=20)),
+                ('side', models.CharField(max_length=5)),
+                ('entry_price', models.FloatField()),
+                ('exit_price', models.FloatField(blank=True, null=True)),
+                ('quantity', models.FloatField()),
+                ('pnl', models.FloatField(blank=True, null=True)),
+                ('pnl_percent', models.FloatField(blank=True, null=True)),
+                ('entry_timestamp', models.DateTimeField()),
+                ('exit_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('mes', models.DateField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['user', 'symbol'], name='trade_aberto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', 'symbol', 'entry_timestamp'], name='trade_user_symbol_entry_idx'),
+        ),
+        migrations.AddField(
+            model_name='tradearchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tradearchive',
+            index=models.Index(fields=['user', 'mes'], name='tradearchive_user_mes_idx'),
+        ),
+    ]
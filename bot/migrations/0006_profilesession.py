@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_trade_indexes_tradearchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('escopo', models.CharField(choices=[('bot', 'Bot de um usuário'), ('worker', 'Todos os bots de um worker'), ('dashboard', 'Requisições do dashboard')], default='bot', max_length=10)),
+                ('worker_id', models.CharField(blank=True, help_text="host:pid do runner (--worker-id) ou só o host, no escopo 'worker'.", max_length=100)),
+                ('iteracoes', models.PositiveIntegerField(default=20, help_text='Checagens ou requisições perfiladas.')),
+                ('intervalo_ms', models.FloatField(default=5.0, help_text='Intervalo entre amostras das pilhas.')),
+                ('status', models.CharField(choices=[('ativo', 'Ativo'), ('concluido', 'Concluído'), ('cancelado', 'Cancelado')], default='ativo', max_length=10)),
+                ('iteracoes_feitas', models.IntegerField(default=0)),
+                ('amostras', models.IntegerField(default=0)),
+                ('stacks', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('bot', models.ForeignKey(blank=True, help_text="Obrigatório no escopo 'bot'; no 'dashboard', limita às requisições desse usuário.", null=True, on_delete=django.db.models.deletion.CASCADE, to='bot.botcontrol')),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_profilesession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botcontrol',
+            name='strategy',
+            field=models.CharField(default='ema_pullback', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='botcontrol',
+            name='strategy_params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('bot', '0007_botcontrol_strategy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotCheckpoint',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('versao', models.PositiveSmallIntegerField()),
+                ('dados', models.JSONField()),
+                ('atualizado_em', models.DateTimeField()),
+            ],
+        ),
+    ]
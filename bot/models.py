@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 
 # Modelo para guardar as informações extras do usuário
 class UserProfile(models.Model):
@@ -23,11 +24,25 @@ class BotControl(models.Model):
     ema_slow = models.IntegerField(default=12)
     quantidade_usdt = models.FloatField(default=20.0)
     leverage = models.IntegerField(default=5)
+    # Nome registrado em bot.strategies; parâmetros além de ema_fast/ema_slow ficam em strategy_params.
+    strategy = models.CharField(max_length=30, default="ema_pullback")
+    strategy_params = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"{self.user.username}'s Bot ({self.symbol}) - Running: {self.is_running}"
     
 
+# Último estado de cada bot, para retomar após um restart sem perder o sinal pendente nem repetir o setup da conta
+class BotCheckpoint(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    versao = models.PositiveSmallIntegerField()  # formato de `dados` (bot.checkpoint.VERSAO)
+    dados = models.JSONField()
+    atualizado_em = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user.username} | v{self.versao} | {self.dados.get('estado')} | {self.atualizado_em:%Y-%m-%d %H:%M:%S}"
+
+
 class Trade(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     symbol = models.CharField(max_length=20)
@@ -45,6 +60,148 @@ class Trade(models.Model):
     
     is_open = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Índice parcial: só as posições abertas, que é o que o bot consulta a cada fechamento.
+            models.Index(fields=["user", "symbol"], condition=models.Q(is_open=True), name="trade_aberto_idx"),
+            models.Index(fields=["user", "symbol", "entry_timestamp"], name="trade_user_symbol_entry_idx"),
+        ]
+
     def __str__(self):
         status = "OPEN" if self.is_open else "CLOSED"
-        return f"{self.user.username} | {self.symbol} | {self.side.upper()} | {status}"
\ No newline at end of file
+        return f"{self.user.username} | {self.symbol} | {self.side.upper()} | {status}"
+
+
+# Trades fechados movidos da tabela principal pelo comando `archive_trades`, por mês
+class TradeArchive(models.Model):
+    trade_id = models.BigIntegerField(unique=True)  # id original na tabela Trade
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    symbol = models.CharField(max_length=20)
+    side = models.CharField(max_length=5)
+
+    entry_price = models.FloatField()
+    exit_price = models.FloatField(null=True, blank=True)
+    quantity = models.FloatField()
+
+    pnl = models.FloatField(null=True, blank=True)
+    pnl_percent = models.FloatField(null=True, blank=True)
+
+    entry_timestamp = models.DateTimeField()
+    exit_timestamp = models.DateTimeField(null=True, blank=True)
+    mes = models.DateField()  # primeiro dia do mês de saída
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "mes"], name="tradearchive_user_mes_idx")]
+
+    def __str__(self):
+        return f"{self.user.username} | {self.symbol} | {self.side.upper()} | {self.mes:%Y-%m}"
+
+# Resultado de uma combinação avaliada pelo comando `optimize`
+class OptimizationResult(models.Model):
+    execucao = models.CharField(max_length=32, db_index=True)  # identifica a rodada do otimizador
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    symbol = models.CharField(max_length=20)
+    timeframe = models.CharField(max_length=10)
+    ema_fast = models.IntegerField()
+    ema_slow = models.IntegerField()
+    leverage = models.IntegerField()
+
+    pnl_total = models.FloatField()
+    pnl_fora_amostra = models.FloatField(null=True, blank=True)  # soma dos trechos de teste do walk-forward
+    trades = models.IntegerField()
+    win_rate = models.FloatField()
+    max_drawdown_percent = models.FloatField()
+    ranking = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["execucao", "ranking"]
+
+    def __str__(self):
+        return f"{self.execucao} | {self.symbol} {self.timeframe} EMA {self.ema_fast}/{self.ema_slow} x{self.leverage}"
+
+
+# Execuções (fills) da conta de futuros, sincronizadas incrementalmente da Binance
+class AccountFill(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    trade_id = models.BigIntegerField()  # id da Binance, único por símbolo
+    order_id = models.BigIntegerField()
+    symbol = models.CharField(max_length=20)
+    side = models.CharField(max_length=5)  # 'BUY' ou 'SELL'
+
+    price = models.FloatField()
+    qty = models.FloatField()
+    realized_pnl = models.FloatField()
+    commission = models.FloatField()
+    commission_asset = models.CharField(max_length=10)
+    time = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "symbol", "trade_id"], name="fill_unico_por_usuario"),
+        ]
+        indexes = [models.Index(fields=["user", "time"], name="fill_user_time_idx")]
+
+    def __str__(self):
+        return f"{self.user.username} | {self.symbol} | {self.side} {self.qty} @ {self.price}"
+
+
+# Resumo diário dos fills com PnL realizado, mantido pela sincronização
+class DailyPnl(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    dia = models.DateField()
+    trades = models.IntegerField(default=0)  # fills que fecharam posição (PnL realizado != 0)
+    wins = models.IntegerField(default=0)
+    pnl = models.FloatField(default=0.0)
+    comissao = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "dia"], name="dailypnl_unico_por_dia")]
+        ordering = ["dia"]
+
+    def __str__(self):
+        return f"{self.user.username} | {self.dia} | PnL {self.pnl:.2f}"
+
+
+# Sessões do profiler por amostragem, ligadas pelo admin e executadas nos workers
+class ProfileSession(models.Model):
+    ESCOPO_CHOICES = [
+        ("bot", "Bot de um usuário"),
+        ("worker", "Todos os bots de um worker"),
+        ("dashboard", "Requisições do dashboard"),
+    ]
+    STATUS_CHOICES = [
+        ("ativo", "Ativo"),
+        ("concluido", "Concluído"),
+        ("cancelado", "Cancelado"),
+    ]
+
+    escopo = models.CharField(max_length=10, choices=ESCOPO_CHOICES, default="bot")
+    bot = models.ForeignKey(
+        BotControl, on_delete=models.CASCADE, null=True, blank=True,
+        help_text="Obrigatório no escopo 'bot'; no 'dashboard', limita às requisições desse usuário.",
+    )
+    worker_id = models.CharField(
+        max_length=100, blank=True, help_text="host:pid do runner (--worker-id) ou só o host, no escopo 'worker'."
+    )
+    iteracoes = models.PositiveIntegerField(default=20, help_text="Checagens ou requisições perfiladas.")
+    intervalo_ms = models.FloatField(default=5.0, help_text="Intervalo entre amostras das pilhas.")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="ativo")
+
+    iteracoes_feitas = models.IntegerField(default=0)
+    amostras = models.IntegerField(default=0)
+    stacks = models.TextField(blank=True)  # formato "collapsed" (flamegraph.pl / speedscope)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-criado_em"]
+
+    def clean(self):
+        if self.escopo == "bot" and not self.bot_id:
+            raise ValidationError({"bot": "Escolha o bot a perfilar."})
+        if self.escopo == "worker" and not self.worker_id:
+            raise ValidationError({"worker_id": "Informe o worker (host:pid ou host)."})
+
+    def __str__(self):
+        return f"Perfil #{self.pk} | {self.escopo} | {self.status}"
@@ -0,0 +1,211 @@
+import fcntl
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .market_data import INTERVALOS_MS
+
+# ===================================================================
+# Armazenamento colunar de candles em disco (um diretório por symbol/timeframe)
+# ===================================================================
+
+# Uma coluna por arquivo, valores crus em sequência (little-endian). O open_time é
+# estritamente crescente e serve de índice: busca por intervalo é um searchsorted.
+COLUNAS = (
+    ("open_time", np.dtype("<i8")),
+    ("open", np.dtype("<f8")),
+    ("high", np.dtype("<f8")),
+    ("low", np.dtype("<f8")),
+    ("close", np.dtype("<f8")),
+    ("volume", np.dtype("<f8")),
+)
+TAMANHO_LINHA = {nome: dtype.itemsize for nome, dtype in COLUNAS}
+
+# Fonte "SYMBOL:timeframe" (ex: "BTCUSDT:1m") em vez de um arquivo, nos comandos de análise.
+_FONTE_STORE = re.compile(r"^([A-Z0-9]+):(\w+)$")
+
+
+def colunas_de_klines(candles):
+    """
+    Converte klines da Binance (listas [open_time, open, high, low, close, volume, ...]) em colunas.
+
+    Returns:
+        dict: {"open_time": int64[], "open": float64[], ...}
+    """
+    if not candles:
+        return {nome: np.empty(0, dtype=dtype) for nome, dtype in COLUNAS}
+    matriz = np.array([c[:6] for c in candles], dtype=np.float64)
+    colunas = {nome: matriz[:, i].astype(dtype) for i, (nome, dtype) in enumerate(COLUNAS)}
+    colunas["open_time"] = np.array([int(c[0]) for c in candles], dtype=np.int64)
+    return colunas
+
+
+class SerieOhlcv:
+    """
+    Candles fechados de um (symbol, timeframe), só com acréscimos no fim.
+
+    Leitores recebem fatias de `np.memmap` somente leitura: nada é copiado e o kernel
+    compartilha as páginas entre processos. Escritores (de qualquer processo) se
+    serializam com `flock` num arquivo de lock do diretório. As colunas são gravadas
+    uma a uma; se um processo morrer no meio, o tamanho válido é o da menor coluna e a
+    próxima escrita corta o excesso das outras.
+    """
+
+    def __init__(self, diretorio, symbol, timeframe):
+        self.diretorio = diretorio
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self._mapas = {}  # coluna -> memmap (refeito quando o arquivo cresce)
+        self._mutex = threading.Lock()
+
+    def __len__(self):
+        return min(
+            (self._tamanho_arquivo(nome) // TAMANHO_LINHA[nome] for nome, _ in COLUNAS),
+            default=0,
+        )
+
+    def ler(self, inicio_ms=None, fim_ms=None, ultimos=None):
+        """
+        Candles com open_time em [inicio_ms, fim_ms], ou os `ultimos` N.
+
+        Returns:
+            dict: {"open_time": int64[], "open": ..., "volume": float64[]}, views somente leitura
+            sobre o arquivo (sem cópia).
+        """
+        n = len(self)
+        colunas = self._mapear(n)
+        if n == 0:
+            return colunas
+        tempos = colunas["open_time"]
+        # O open_time é ordenado: as duas pontas saem por busca binária.
+        ini = 0 if inicio_ms is None else int(np.searchsorted(tempos, inicio_ms, side="left"))
+        fim = n if fim_ms is None else int(np.searchsorted(tempos, fim_ms, side="right"))
+        if ultimos is not None:
+            ini = max(ini, fim - ultimos)
+        return {nome: coluna[ini:fim] for nome, coluna in colunas.items()}
+
+    def ultimo_open_time(self):
+        n = len(self)
+        return int(self._mapear(n)["open_time"][n - 1]) if n else None
+
+    def acrescentar(self, colunas):
+        """
+        Grava no fim os candles com open_time maior que o último guardado.
+
+        Args:
+            colunas (dict): Colunas de COLUNAS (ex: saída de `colunas_de_klines`), em ordem
+                crescente de open_time e só com candles já fechados.
+
+        Returns:
+            int: Quantos candles foram gravados.
+        """
+        os.makedirs(self.diretorio, exist_ok=True)
+        with open(os.path.join(self.diretorio, ".lock"), "w") as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            n = self._reparar()
+            ultimo = self.ultimo_open_time() if n else None
+            tempos = np.asarray(colunas["open_time"], dtype=np.int64)
+            novos = slice(int(np.searchsorted(tempos, ultimo, side="right")) if ultimo is not None else 0, None)
+            if len(tempos[novos]) == 0:
+                return 0
+            if np.any(np.diff(tempos[novos]) <= 0):
+                raise ValueError(f"{self.symbol} {self.timeframe}: open_time fora de ordem na gravação.")
+            # open_time por último: leitores só enxergam a linha quando ela está completa.
+            for nome, dtype in COLUNAS[1:] + COLUNAS[:1]:
+                with open(self._arquivo(nome), "ab") as arquivo:
+                    arquivo.write(np.asarray(colunas[nome], dtype=dtype)[novos].tobytes())
+            return len(tempos[novos])
+
+    # --- Internos ---
+
+    def _arquivo(self, nome):
+        return os.path.join(self.diretorio, f"{nome}.bin")
+
+    def _tamanho_arquivo(self, nome):
+        try:
+            return os.path.getsize(self._arquivo(nome))
+        except FileNotFoundError:
+            return 0
+
+    def _reparar(self):
+        """Corta colunas com linhas a mais (gravação interrompida). Precisa do lock."""
+        n = len(self)
+        for nome, _ in COLUNAS:
+            tamanho = n * TAMANHO_LINHA[nome]
+            if self._tamanho_arquivo(nome) > tamanho:
+                os.truncate(self._arquivo(nome), tamanho)
+        return n
+
+    def _mapear(self, n):
+        with self._mutex:
+            colunas = {}
+            for nome, dtype in COLUNAS:
+                mapa = self._mapas.get(nome)
+                if n == 0:
+                    mapa = np.empty(0, dtype=dtype)
+                elif mapa is None or len(mapa) < n:
+                    # O arquivo cresceu desde o último mapeamento: mapeia de novo.
+                    mapa = self._mapas[nome] = np.memmap(self._arquivo(nome), dtype=dtype, mode="r", shape=(n,))
+                colunas[nome] = mapa[:n]
+            return colunas
+
+
+class OhlcvStore:
+    """Raiz do armazenamento: `<OHLCV_STORE_PATH>/<SYMBOL>/<timeframe>/<coluna>.bin`."""
+
+    def __init__(self, raiz=None):
+        self.raiz = str(raiz or settings.OHLCV_STORE_PATH)
+        self._series = {}
+        self._mutex = threading.Lock()
+
+    def serie(self, symbol, timeframe):
+        """
+        Retorna a série de (symbol, timeframe), criada vazia se ainda não existe.
+
+        Raises:
+            ValueError: Se o timeframe não tem duração fixa (ex: 1M).
+        """
+        if timeframe not in INTERVALOS_MS:
+            raise ValueError(f"Timeframe sem duração fixa não pode ser armazenado: {timeframe}")
+        chave = (symbol.upper(), timeframe)
+        with self._mutex:
+            serie = self._series.get(chave)
+            if serie is None:
+                diretorio = os.path.join(self.raiz, chave[0], timeframe)
+                serie = self._series[chave] = SerieOhlcv(diretorio, *chave)
+            return serie
+
+    def acrescentar_klines(self, symbol, timeframe, candles, agora_ms=None):
+        """
+        Grava os candles fechados de uma resposta de `futures_klines`; o candle em formação fica de fora.
+
+        Returns:
+            int: Quantos candles foram gravados.
+        """
+        agora_ms = agora_ms or int(time.time() * 1000)
+        intervalo = INTERVALOS_MS[timeframe]
+        fechados = [c for c in candles if int(c[0]) + intervalo <= agora_ms]
+        return self.serie(symbol, timeframe).acrescentar(colunas_de_klines(fechados))
+
+
+def fonte_store(caminho):
+    """Returns: (symbol, timeframe) se `caminho` é uma fonte "SYMBOL:timeframe" do store, senão None."""
+    casou = _FONTE_STORE.match(str(caminho))
+    return casou.groups() if casou and not os.path.exists(caminho) else None
+
+
+_store = None
+_store_mutex = threading.Lock()
+
+
+def get_ohlcv_store():
+    """Retorna o store de candles do processo, criando-o na primeira chamada."""
+    global _store
+    with _store_mutex:
+        if _store is None:
+            _store = OhlcvStore()
+    return _store
@@ -0,0 +1,181 @@
+import itertools
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory, util
+
+import numpy as np
+
+from .backtest import executar_backtest, reamostrar_closes
+
+# ===================================================================
+# Otimizador de parâmetros (grid/random search + validação walk-forward)
+# ===================================================================
+
+
+def gerar_combinacoes(ema_fast, ema_slow, timeframes, leverages, modo="grid", amostras=100, seed=None):
+    """
+    Combinações (timeframe, ema_fast, ema_slow, leverage) a avaliar, sempre com fast < slow.
+
+    Args:
+        ema_fast, ema_slow, timeframes, leverages (list): Valores de cada campo do BotControl.
+        modo (str): "grid" avalia todas; "random" sorteia `amostras` delas sem repetição.
+
+    Returns:
+        list: Tuplas (timeframe, ema_fast, ema_slow, leverage).
+    """
+    todas = [
+        (tf, f, s, lev)
+        for tf, f, s, lev in itertools.product(timeframes, ema_fast, ema_slow, leverages)
+        if f < s
+    ]
+    if modo == "random" and amostras < len(todas):
+        return random.Random(seed).sample(todas, amostras)
+    return todas
+
+
+def janelas_walk_forward(n, dobras, fracao_treino=0.7):
+    """
+    Divide `n` candles em janelas deslizantes de treino seguidas de teste.
+
+    Os trechos de teste são consecutivos e não se sobrepõem; cada treino é o trecho
+    imediatamente anterior ao seu teste.
+
+    Returns:
+        list: Tuplas (inicio_treino, inicio_teste, fim_teste). Com dobras=0, uma única
+        janela cobrindo a série inteira sem teste.
+    """
+    if dobras <= 0:
+        return [(0, n, n)]
+    teste = int(n / (dobras + fracao_treino / (1 - fracao_treino)))
+    treino = n - dobras * teste
+    return [(d * teste, d * teste + treino, d * teste + treino + teste) for d in range(dobras)]
+
+
+class SeriesCompartilhadas:
+    """
+    Guarda os fechamentos de cada (symbol, timeframe) em blocos de memória
+    compartilhada, para que os processos do pool leiam os arrays sem cópia nem pickle.
+    Use como context manager: os blocos são liberados na saída.
+    """
+
+    def __init__(self):
+        self.descritores = {}  # (symbol, timeframe) -> (nome do bloco, tamanho)
+        self._blocos = []
+
+    def adicionar(self, symbol, timeframe, closes):
+        closes = np.ascontiguousarray(closes, dtype=np.float64)
+        bloco = shared_memory.SharedMemory(create=True, size=max(1, closes.nbytes))
+        np.ndarray(closes.shape, dtype=np.float64, buffer=bloco.buf)[:] = closes
+        self._blocos.append(bloco)
+        self.descritores[(symbol, timeframe)] = (bloco.name, len(closes))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for bloco in self._blocos:
+            bloco.close()
+            bloco.unlink()
+        self._blocos = []
+
+
+# --- Lado do worker ---
+
+_descritores = {}
+_anexados = {}
+
+
+def _inicializar_worker(descritores):
+    global _descritores
+    _descritores = descritores
+    # O worker do pool sai sem rodar o atexit; os finalizadores do multiprocessing rodam.
+    util.Finalize(None, _fechar_anexados, exitpriority=10)
+
+
+def _fechar_anexados():
+    """Solta os blocos anexados por este processo. Só o processo que os criou faz o unlink."""
+    for bloco, _ in _anexados.values():
+        bloco.close()
+    _anexados.clear()
+
+
+def _obter_serie(symbol, timeframe):
+    chave = (symbol, timeframe)
+    if chave not in _anexados:
+        nome, tamanho = _descritores[chave]
+        bloco = shared_memory.SharedMemory(name=nome)
+        _anexados[chave] = (bloco, np.ndarray((tamanho,), dtype=np.float64, buffer=bloco.buf))
+    return _anexados[chave][1]
+
+
+def avaliar_combinacao(symbol, timeframe, ema_fast, ema_slow, leverage, dobras, fracao_treino, parametros):
+    """
+    Avalia uma combinação na série inteira e, com dobras > 0, nos trechos fora da amostra.
+
+    `trades`, `pnl_total`, `win_rate` e o drawdown vêm de uma única passada pela série
+    inteira, então nenhum trade é contado duas vezes. O walk-forward aqui não escolhe
+    parâmetros por dobra: a combinação é fixa e cada janela roda do início do treino
+    ao fim do teste (o treino só aquece as EMAs e a posição, que continua no teste).
+    Os trechos de teste são consecutivos e não se sobrepõem; `pnl_fora_amostra` soma
+    os trades que fecham neles e é o critério de ranking do comando `optimize`. O
+    fechamento forçado no fim de cada janela (posição ainda aberta) não entra: é um
+    artefato do corte, não uma saída da estratégia.
+
+    Returns:
+        dict: Parâmetros e métricas; `pnl_fora_amostra` é None sem walk-forward.
+    """
+    closes = _obter_serie(symbol, timeframe)
+    metricas = executar_backtest(closes, ema_fast, ema_slow, leverage=leverage, **parametros)
+
+    fora_amostra = []
+    if dobras > 0:
+        for inicio, inicio_teste, fim in janelas_walk_forward(len(closes), dobras, fracao_treino):
+            resultado = executar_backtest(closes[inicio:fim], ema_fast, ema_slow, leverage=leverage, **parametros)
+            fora_amostra.extend(
+                t for t in resultado["lista_trades"] if t["saida_i"] >= inicio_teste - inicio and not t["forcado"]
+            )
+
+    return {
+        "symbol": symbol, "timeframe": timeframe, "ema_fast": ema_fast, "ema_slow": ema_slow,
+        "leverage": leverage,
+        "pnl_total": metricas["pnl_total"],
+        "pnl_fora_amostra": round(sum(t["pnl"] for t in fora_amostra), 4) if dobras > 0 else None,
+        "trades": metricas["trades"],
+        "win_rate": metricas["win_rate"],
+        "max_drawdown_percent": metricas["max_drawdown_percent"],
+    }
+
+
+def otimizar(series, combinacoes, dobras=0, fracao_treino=0.7, workers=None, parametros=None):
+    """
+    Avalia cada combinação em cada símbolo num pool de processos.
+
+    Args:
+        series (dict): symbol -> (open_times, closes) no timeframe base dos arquivos.
+        combinacoes (list): Saída de `gerar_combinacoes`.
+        parametros (dict): Repassados ao `executar_backtest` (quantidade_usdt, taxa, slippage...).
+
+    Yields:
+        dict: Resultado de cada combinação, na ordem em que terminam.
+    """
+    parametros = parametros or {}
+    timeframes = sorted({tf for tf, _, _, _ in combinacoes})
+    with SeriesCompartilhadas() as compartilhadas:
+        for symbol, (open_times, closes) in series.items():
+            for tf in timeframes:
+                compartilhadas.adicionar(symbol, tf, reamostrar_closes(open_times, closes, tf))
+
+        # Séries mais longas primeiro, para os últimos jobs serem os mais curtos.
+        jobs = sorted(
+            ((symbol, tf, f, s, lev) for symbol in series for tf, f, s, lev in combinacoes),
+            key=lambda job: -compartilhadas.descritores[(job[0], job[1])][1],
+        )
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=contexto,
+            initializer=_inicializar_worker, initargs=(compartilhadas.descritores,),
+        ) as executor:
+            futuros = [executor.submit(avaliar_combinacao, *job, dobras, fracao_treino, parametros) for job in jobs]
+            for futuro in as_completed(futuros):
+                yield futuro.result()
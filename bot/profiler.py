@@ -0,0 +1,245 @@
+import functools
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from django.db import connection
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .control_channel import EVENTO_PROFILE, EVENTO_RESYNC, get_control_channel, publicar_evento
+from .models import ProfileSession
+from .redis_client import get_redis
+
+# ===================================================================
+# Profiler por amostragem ligado pelo admin (ProfileSession)
+# ===================================================================
+
+# Contadores compartilhados entre processos: cada sessão perfila N iterações no total,
+# não N por worker, e as pilhas de todos os processos são somadas aqui.
+CHAVE_RESERVADAS = "perfil:{id}:reservadas"
+CHAVE_CONCLUIDAS = "perfil:{id}:concluidas"
+CHAVE_STACKS = "perfil:{id}:stacks"
+TTL_CHAVES = 24 * 60 * 60
+
+_Sessao = namedtuple("_Sessao", ["id", "escopo", "user_id", "worker_id", "iteracoes", "intervalo"])
+
+
+_rotulos = {}
+
+
+def _rotulo(code):
+    rotulo = _rotulos.get(code)
+    if rotulo is None:
+        modulo = os.path.splitext(os.path.basename(code.co_filename))[0]
+        rotulo = _rotulos[code] = f"{modulo}.{code.co_qualname}"
+    return rotulo
+
+
+def _pilha(frame):
+    """Pilha da raiz até o frame atual no formato "collapsed" (a;b;c)."""
+    rotulos = []
+    while frame is not None:
+        rotulos.append(_rotulo(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(rotulos))
+
+
+def finalizar_sessao(sessao_id, status="concluido"):
+    """
+    Grava no ProfileSession as pilhas acumuladas no Redis e avisa os processos para largarem a sessão.
+
+    Returns:
+        bool: True se a sessão ainda estava ativa e foi finalizada aqui.
+    """
+    r = get_redis()
+    brutos = r.hgetall(CHAVE_STACKS.format(id=sessao_id))
+    concluidas = int(r.get(CHAVE_CONCLUIDAS.format(id=sessao_id)) or 0)
+    stacks = Counter({k.decode(): int(v) for k, v in brutos.items()})
+    atualizadas = ProfileSession.objects.filter(id=sessao_id, status="ativo").update(
+        status=status,
+        stacks="\n".join(f"{pilha} {n}" for pilha, n in stacks.most_common()),
+        amostras=sum(stacks.values()),
+        iteracoes_feitas=concluidas,
+        concluido_em=timezone.now(),
+    )
+    r.delete(*(chave.format(id=sessao_id) for chave in (CHAVE_RESERVADAS, CHAVE_CONCLUIDAS, CHAVE_STACKS)))
+    publicar_evento(None, EVENTO_PROFILE)
+    return bool(atualizadas)
+
+
+class SamplingProfiler:
+    """
+    Amostra as pilhas das threads que estão dentro de `perfilar()`.
+
+    Sem sessão ativa, `perfilar()` custa uma checagem de dicionário. Com sessão, a
+    thread perfilada só se registra; uma thread à parte lê `sys._current_frames()`
+    a cada `intervalo_ms` e conta as pilhas. As sessões são lidas do banco ao iniciar
+    e de novo a cada EVENTO_PROFILE do canal de controle, então ligar e desligar
+    não exige reiniciar workers.
+    """
+
+    def __init__(self, worker_id=None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._sessoes = {}   # id -> _Sessao
+        self._threads = {}   # ident da thread -> Counter de pilhas da iteração em curso
+        self._mutex = threading.Lock()
+        self._amostrador = None
+        self._iniciado = False
+
+    @contextmanager
+    def perfilar(self, tipo, user_id=None):
+        """
+        Perfila o bloco se houver sessão ativa para ele.
+
+        Args:
+            tipo (str): "bot" (run_single_check) ou "dashboard".
+            user_id (int): Dono do bot ou da requisição.
+        """
+        if not self._iniciado:
+            self._iniciar()
+        sessao = self._escolher(tipo, user_id) if self._sessoes else None
+        if sessao is None or not self._reservar(sessao):
+            yield
+            return
+
+        amostras = Counter()
+        ident = threading.get_ident()
+        with self._mutex:
+            self._threads[ident] = amostras
+        self._garantir_amostrador()
+        try:
+            yield
+        finally:
+            with self._mutex:
+                self._threads.pop(ident, None)
+            self._concluir_iteracao(sessao, amostras)
+
+    def recarregar(self):
+        """Relê do banco as sessões ativas."""
+        try:
+            sessoes = {
+                s.id: _Sessao(s.id, s.escopo, s.bot.user_id if s.bot_id else None, s.worker_id,
+                              s.iteracoes, s.intervalo_ms / 1000)
+                for s in ProfileSession.objects.filter(status="ativo").select_related("bot")
+            }
+        except Exception as e:
+            print(f"[Profiler] Não foi possível ler as sessões ativas: {e}")
+            return
+        with self._mutex:
+            self._sessoes = sessoes
+
+    # --- Internos ---
+
+    def _iniciar(self):
+        with self._mutex:
+            if self._iniciado:
+                return
+            self._iniciado = True
+        get_control_channel().assinar(self._ao_receber_evento)
+        self.recarregar()
+
+    def _ao_receber_evento(self, evento):
+        if evento["tipo"] in (EVENTO_PROFILE, EVENTO_RESYNC):
+            self.recarregar()
+            # Thread do canal de controle: não deixa conexão com o banco aberta.
+            connection.close()
+
+    def _escolher(self, tipo, user_id):
+        for sessao in list(self._sessoes.values()):
+            if tipo == "dashboard":
+                if sessao.escopo == "dashboard" and sessao.user_id in (None, user_id):
+                    return sessao
+            elif sessao.escopo == "bot" and sessao.user_id == user_id:
+                return sessao
+            elif sessao.escopo == "worker" and sessao.worker_id in (self.worker_id, socket.gethostname()):
+                return sessao
+        return None
+
+    def _reservar(self, sessao):
+        try:
+            r = get_redis()
+            chave = CHAVE_RESERVADAS.format(id=sessao.id)
+            reservadas = r.incr(chave)
+            if reservadas == 1:
+                r.expire(chave, TTL_CHAVES)
+        except RedisError as e:
+            print(f"[Profiler] Redis indisponível, sessão {sessao.id} ignorada: {e}")
+            return False
+        if reservadas > sessao.iteracoes:
+            # Outras iterações já esgotaram a sessão; quem concluir a última a finaliza.
+            with self._mutex:
+                self._sessoes.pop(sessao.id, None)
+            return False
+        return True
+
+    def _concluir_iteracao(self, sessao, amostras):
+        try:
+            r = get_redis()
+            pipe = r.pipeline(transaction=False)
+            chave_stacks = CHAVE_STACKS.format(id=sessao.id)
+            for pilha, quantidade in amostras.items():
+                pipe.hincrby(chave_stacks, pilha, quantidade)
+            pipe.expire(chave_stacks, TTL_CHAVES)
+            pipe.incr(CHAVE_CONCLUIDAS.format(id=sessao.id))
+            pipe.expire(CHAVE_CONCLUIDAS.format(id=sessao.id), TTL_CHAVES)
+            concluidas = pipe.execute()[-2]
+            if concluidas == sessao.iteracoes:
+                finalizar_sessao(sessao.id)
+                print(f"[Profiler] Sessão {sessao.id} concluída ({concluidas} iterações).")
+        except Exception as e:
+            print(f"[Profiler] Erro ao gravar amostras da sessão {sessao.id}: {e}")
+
+    def _garantir_amostrador(self):
+        with self._mutex:
+            if self._amostrador is not None:
+                return
+            amostrador = self._amostrador = threading.Thread(target=self._amostrar, name="profiler", daemon=True)
+        amostrador.start()
+
+    def _amostrar(self):
+        meu_ident = threading.get_ident()
+        while True:
+            with self._mutex:
+                if not self._threads:
+                    # Nada sendo perfilado: a próxima iteração perfilada inicia outra thread.
+                    self._amostrador = None
+                    return
+                intervalo = min((s.intervalo for s in self._sessoes.values()), default=0.005)
+                alvos = list(self._threads.items())
+            if alvos:
+                frames = sys._current_frames()
+                for ident, amostras in alvos:
+                    frame = frames.get(ident)
+                    if frame is not None and ident != meu_ident:
+                        amostras[_pilha(frame)] += 1
+                del frames
+            time.sleep(intervalo)
+
+
+_profiler = None
+_profiler_mutex = threading.Lock()
+
+
+def get_profiler():
+    """Retorna o profiler do processo, criando-o na primeira chamada."""
+    global _profiler
+    with _profiler_mutex:
+        if _profiler is None:
+            _profiler = SamplingProfiler()
+    return _profiler
+
+
+def perfilado(tipo):
+    """Decorator para views: perfila a requisição quando há sessão `tipo` ativa para o usuário."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with get_profiler().perfilar(tipo, request.user.id):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
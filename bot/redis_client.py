@@ -0,0 +1,21 @@
+import redis
+from django.conf import settings
+
+# Conexão única por processo. O redis-py já mantém um pool interno e é thread-safe,
+# então todos os bots de um mesmo worker compartilham as mesmas conexões.
+_conexao = None
+
+
+def get_redis():
+    """
+    Retorna o cliente Redis compartilhado do processo, criando-o sob demanda.
+
+    Returns:
+        redis.Redis: Cliente apontando para settings.REDIS_URL.
+    """
+    global _conexao
+    if _conexao is None:
+        _conexao = redis.Redis.from_url(
+            settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2
+        )
+    return _conexao
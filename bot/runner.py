@@ -0,0 +1,500 @@
+import bisect
+import hashlib
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from redis.exceptions import RedisError
+
+from .binance_pool import get_binance_pool
+from .bot_logic import TradingBot
+from .control_channel import (
+    EVENTO_RECONFIGURE, EVENTO_RESYNC, EVENTO_START, EVENTO_STOP, get_control_channel, publicar_evento,
+)
+from .market_data import INTERVALOS_MS
+from .metrics import get_metrics
+from .profiler import get_profiler
+from .models import BotControl
+from .redis_client import get_redis
+from .streaming import KlineStream
+from .tasks import carregar_contexto_bot
+from .telegram import enviar_notificacao_async
+
+CHAVE_WORKERS = "runner:workers"
+CHAVE_LEASE = "runner:lease:{user_id}"
+CHAVE_ATIVO = "runner:ativo:{user_id}"
+
+# Renova/libera o lease apenas se ele ainda pertence a este worker.
+_LUA_RENOVAR_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_LUA_LIBERAR_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _hash(valor):
+    return int.from_bytes(hashlib.md5(valor.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Anel de hashing consistente com nós virtuais.
+
+    Quando um worker entra ou sai, só os bots do trecho do anel que ele ocupa
+    mudam de dono; os demais continuam onde estão.
+    """
+
+    def __init__(self, nos, replicas=100):
+        self._anel = sorted((_hash(f"{no}#{i}"), no) for no in nos for i in range(replicas))
+        self._chaves = [h for h, _ in self._anel]
+
+    def no_para(self, chave):
+        if not self._anel:
+            return None
+        i = bisect.bisect(self._chaves, _hash(str(chave))) % len(self._anel)
+        return self._anel[i][1]
+
+
+class TimerWheel:
+    """
+    Roda de timers com granularidade de `resolucao` segundos.
+
+    Agendar e disparar custam O(1) por timer, independente de quantos bots o
+    worker tem. Timers além de uma volta da roda ficam no slot até a volta certa.
+    """
+
+    def __init__(self, slots=3600, resolucao=1.0):
+        self.resolucao = resolucao
+        self._slots = [[] for _ in range(slots)]
+        self._tick = math.floor(time.time() / resolucao)
+        self._mutex = threading.Lock()
+
+    def agendar(self, quando, item):
+        with self._mutex:
+            tick = max(math.ceil(quando / self.resolucao), self._tick + 1)
+            self._slots[tick % len(self._slots)].append((tick, item))
+
+    def avancar(self, agora):
+        """Avança a roda até `agora` e retorna os itens vencidos."""
+        vencidos = []
+        alvo = math.floor(agora / self.resolucao)
+        with self._mutex:
+            while self._tick < alvo:
+                self._tick += 1
+                indice = self._tick % len(self._slots)
+                pendentes = []
+                for tick, item in self._slots[indice]:
+                    (vencidos if tick <= self._tick else pendentes).append((tick, item))
+                self._slots[indice] = pendentes
+        return [item for _, item in vencidos]
+
+
+class _BotSlot:
+    __slots__ = (
+        "user_id", "bot", "username", "user_profile", "intervalo", "geracao", "em_execucao",
+        "reconfigurar_pendente", "iniciado", "stream_chave",
+    )
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.bot = None
+        self.username = None
+        self.user_profile = None
+        self.intervalo = settings.BOT_CHECK_INTERVAL_SECONDS
+        self.geracao = 0
+        self.em_execucao = True  # fica ocupado até o TradingBot terminar de iniciar
+        self.reconfigurar_pendente = False
+        self.iniciado = False      # aceito pelo loop depois que o TradingBot subiu
+        self.stream_chave = None   # (symbol, timeframe) do KlineStream assinado
+
+
+class BotRunner:
+    """
+    Serviço que executa milhares de bots em um processo, no lugar de uma tarefa
+    bloqueante do Celery por usuário.
+
+    Os workers se registram no Redis com heartbeat e dividem os BotControl com
+    `is_running=True` por hashing consistente. Cada bot tem um lease no Redis para
+    nunca rodar em dois workers durante um rebalanceamento. As checagens ficam numa
+    roda de timers alinhada às viradas de candle (todos os bots de um mesmo
+    timeframe disparam juntos e aproveitam a mesma busca do hub de candles) e rodam
+    num pool de threads. Bots ligados voltam sozinhos quando o serviço sobe.
+
+    Start/stop/reconfigure chegam pelo canal de controle (pub/sub do Redis) e
+    são aplicados no próximo tick; o banco só é varrido por completo a cada
+    `BOT_RUNNER_RECONCILE_SECONDS` ou após uma reconexão do canal.
+
+    Bots adotados entram numa fila e iniciam no máximo `BOT_RUNNER_STARTS_PER_SECOND`
+    por tick: após um deploy a frota volta em segundos (o checkpoint dispensa o setup
+    da conta) sem estourar o peso da Binance nem o pool de conexões do banco.
+
+    `self.slots` só muda na thread do loop: as threads do pool devolvem o resultado do
+    início (ou de uma reconfiguração) por `_retornos` e o loop aplica no tick seguinte.
+
+    Com BOT_STREAMING_ENABLED, cada (símbolo, timeframe) do worker tem um KlineStream
+    compartilhado pelos seus bots, que são checados no fechamento do candle ou quando o
+    preço passa do limiar (com até um tick de atraso). Enquanto o stream está conectado
+    os timers só se reagendam; desconectado, eles voltam a ser o polling REST.
+    """
+
+    def __init__(self, worker_id=None, threads=None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        # Sessões de profiling com escopo "worker" usam o mesmo identificador.
+        get_profiler().worker_id = self.worker_id
+        threads = threads or settings.BOT_RUNNER_THREADS
+        conexoes = get_binance_pool().conexoes
+        if threads > conexoes:
+            # O pool HTTP bloqueia sem timeout: as threads a mais ficariam esperando conexão.
+            print(f"[Runner] AVISO: {threads} threads e só {conexoes} conexões com a Binance; "
+                  f"aumente BINANCE_POOL_CONNECTIONS.")
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="bot")
+        self.wheel = TimerWheel()
+        self.slots = {}
+        self.overruns = 0
+        self._parar = threading.Event()
+        self._rodando = set()
+        self._eventos = deque()
+        self._fila_inicio = deque()
+        self._retornos = deque()  # (tipo, slot) vindos das threads do pool
+        self._streams = {}        # (symbol, timeframe) -> (KlineStream, user_ids inscritos)
+        self._proxima_reconciliacao = 0.0
+        self._leases_renovados_em = time.time()  # última renovação confirmada pelo Redis
+
+    def rodar(self):
+        print(f"--- Runner {self.worker_id} iniciado ---")
+        canal = get_control_channel()
+        canal.assinar(self._eventos.append)
+        proximo_rebalance = 0.0
+        try:
+            while not self._parar.is_set():
+                agora = time.time()
+                self._aplicar_retornos()
+                if self._aplicar_eventos() or agora >= proximo_rebalance:
+                    self._rebalancear()
+                    proximo_rebalance = agora + settings.BOT_RUNNER_REBALANCE_SECONDS
+                self._iniciar_da_fila()
+                self._disparar_streams()
+                for user_id, geracao in self.wheel.avancar(agora):
+                    self._disparar(user_id, geracao)
+                self._parar.wait(self.wheel.resolucao - time.time() % self.wheel.resolucao)
+        finally:
+            canal.cancelar(self._eventos.append)
+            self._encerrar()
+
+    def parar(self):
+        self._parar.set()
+
+    # --- Distribuição dos bots entre workers ---
+
+    def _rebalancear(self):
+        r = get_redis()
+        agora = time.time()
+        try:
+            r.zadd(CHAVE_WORKERS, {self.worker_id: agora})
+            r.zremrangebyscore(CHAVE_WORKERS, 0, agora - settings.BOT_RUNNER_WORKER_TIMEOUT)
+            workers = [w.decode() for w in r.zrange(CHAVE_WORKERS, 0, -1)]
+        except RedisError as e:
+            print(f"[Runner] Redis indisponível, mantendo a distribuição atual: {e}")
+            self._parar_sem_lease(agora)
+            return
+
+        if agora >= self._proxima_reconciliacao:
+            close_old_connections()
+            # Uma única query para todos os bots, no lugar de um refresh_from_db por bot.
+            self._rodando = set(BotControl.objects.filter(is_running=True).values_list("user_id", flat=True))
+            self._proxima_reconciliacao = agora + settings.BOT_RUNNER_RECONCILE_SECONDS
+        rodando = self._rodando
+        anel = HashRing(workers)
+        meus = {user_id for user_id in rodando if anel.no_para(user_id) == self.worker_id}
+
+        for user_id in list(self.slots):
+            if user_id not in rodando:
+                self._remover(user_id, parado_pelo_usuario=True)
+            elif user_id not in meus:
+                print(f"[Runner] Bot do usuário {user_id} passou para outro worker.")
+                self._remover(user_id, parado_pelo_usuario=False)
+
+        ttl = settings.BOT_RUNNER_WORKER_TIMEOUT
+        try:
+            renovar = list(self.slots)
+            pipe = r.pipeline(transaction=False)
+            for user_id in renovar:
+                pipe.eval(_LUA_RENOVAR_LEASE, 1, CHAVE_LEASE.format(user_id=user_id), self.worker_id, ttl)
+            renovados = pipe.execute()
+            self._leases_renovados_em = agora
+            for user_id, renovado in zip(renovar, renovados):
+                if not renovado:
+                    # O lease expirou (loop travado por mais que o TTL) e outro worker pode já
+                    # ter assumido o bot: seguir rodando aqui mandaria ordens em dobro.
+                    print(f"[Runner] Lease do usuário {user_id} perdido; parando o bot neste worker.")
+                    self._remover(user_id, parado_pelo_usuario=False)
+
+            for user_id in meus - set(self.slots):
+                # O dono anterior ainda pode estar terminando; se o lease não sair agora, sai no próximo ciclo.
+                if r.set(CHAVE_LEASE.format(user_id=user_id), self.worker_id, nx=True, ex=ttl):
+                    self._adicionar(user_id)
+        except RedisError as e:
+            print(f"[Runner] Erro ao renovar leases: {e}")
+            self._parar_sem_lease(agora)
+
+    def _parar_sem_lease(self, agora):
+        """
+        Sem renovar os leases por mais que o TTL, eles já expiraram no Redis e outro
+        worker pode ter adotado os bots: para todos os slots deste worker.
+        """
+        if not self.slots or agora - self._leases_renovados_em <= settings.BOT_RUNNER_WORKER_TIMEOUT:
+            return
+        print(f"[Runner] Leases sem renovação há mais de {settings.BOT_RUNNER_WORKER_TIMEOUT}s; parando {len(self.slots)} bots.")
+        for user_id in list(self.slots):
+            self._remover(user_id, parado_pelo_usuario=False)
+
+    def _aplicar_eventos(self):
+        """
+        Consome os eventos do canal de controle recebidos desde o último tick.
+
+        Returns:
+            bool: True se algum evento exige rebalancear agora.
+        """
+        rebalancear = False
+        while self._eventos:
+            evento = self._eventos.popleft()
+            tipo, user_id = evento["tipo"], evento.get("user_id")
+            if tipo == EVENTO_START:
+                self._rodando.add(user_id)
+                rebalancear = True
+            elif tipo == EVENTO_STOP:
+                self._rodando.discard(user_id)
+                rebalancear = True
+            elif tipo == EVENTO_RECONFIGURE:
+                slot = self.slots.get(user_id)
+                if slot is not None:
+                    slot.reconfigurar_pendente = True
+            elif tipo == EVENTO_RESYNC:
+                # Podemos ter perdido eventos enquanto o canal estava fora: relê o banco.
+                self._proxima_reconciliacao = 0.0
+                rebalancear = True
+        return rebalancear
+
+    def _adicionar(self, user_id):
+        slot = _BotSlot(user_id)
+        self.slots[user_id] = slot
+        self._fila_inicio.append(slot)
+
+    def _iniciar_da_fila(self):
+        """Inicia até BOT_RUNNER_STARTS_PER_SECOND bots da fila (o loop roda um tick por segundo)."""
+        iniciados = 0
+        while self._fila_inicio and iniciados < settings.BOT_RUNNER_STARTS_PER_SECOND:
+            slot = self._fila_inicio.popleft()
+            if self.slots.get(slot.user_id) is not slot:
+                continue  # removido enquanto esperava
+            self.executor.submit(self._iniciar, slot)
+            iniciados += 1
+        if self._fila_inicio:
+            print(f"[Runner] {iniciados} bots iniciados neste tick; {len(self._fila_inicio)} na fila.")
+
+    def _remover(self, user_id, parado_pelo_usuario):
+        slot = self.slots.pop(user_id, None)
+        if slot is None:
+            return
+        slot.geracao += 1  # invalida os timers já agendados
+        self._cancelar_stream(slot)
+        if slot.iniciado:
+            # Ainda iniciando: quem encerra o bot é o `_aplicar_retornos`, ao ver o slot removido.
+            slot.bot.encerrar()
+        try:
+            r = get_redis()
+            r.eval(_LUA_LIBERAR_LEASE, 1, CHAVE_LEASE.format(user_id=user_id), self.worker_id)
+            if parado_pelo_usuario:
+                r.delete(CHAVE_ATIVO.format(user_id=user_id))
+        except RedisError:
+            pass
+
+        if parado_pelo_usuario and slot.iniciado:
+            # Parado pelo usuário não volta em outro worker: as séries bot=<id> saem do Redis.
+            get_metrics().remover_series(**getattr(slot.bot, "rotulos", {}))
+            print(f"--- Loop do bot para {slot.username} no símbolo {slot.bot.symbol} finalizado. ---")
+            enviar_notificacao_async(
+                f"🛑 [{slot.bot.symbol}] *Bot PARADO*\nMonitoramento encerrado pelo usuário.",
+                slot.user_profile.telegram_bot_token,
+                slot.user_profile.telegram_chat_id
+            )
+
+    def _encerrar(self):
+        # Desligamento do worker: os bots continuam ligados e serão adotados por outro worker.
+        for user_id in list(self.slots):
+            self._remover(user_id, parado_pelo_usuario=False)
+        try:
+            get_redis().zrem(CHAVE_WORKERS, self.worker_id)
+        except RedisError:
+            pass
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        # Bots que terminaram de iniciar durante o desligamento.
+        self._aplicar_retornos()
+        print(f"--- Runner {self.worker_id} finalizado ---")
+
+    # --- Ciclo de vida de cada bot ---
+
+    def _iniciar(self, slot):
+        """Roda no pool: carrega o contexto e cria o TradingBot. O loop aplica o resultado."""
+        try:
+            close_old_connections()
+            contexto = carregar_contexto_bot(slot.user_id)
+            if contexto is not None:
+                user, control, user_profile = contexto
+                slot.username = user.username
+                slot.user_profile = user_profile
+                slot.intervalo = self._intervalo_checagem(control.timeframe)
+                slot.bot = TradingBot(control, user_profile)
+        except Exception as e:
+            print(f"[Runner] Erro ao iniciar o bot do usuário {slot.user_id}: {e}")
+        finally:
+            self._retornos.append(("iniciado", slot))
+
+    def _aplicar_retornos(self):
+        while self._retornos:
+            tipo, slot = self._retornos.popleft()
+            atual = self.slots.get(slot.user_id) is slot
+            if tipo == "reconfigurado":
+                if atual and slot.iniciado:
+                    self._assinar_stream(slot)
+                continue
+
+            if not atual:
+                # Removido enquanto iniciava: solta o que o bot abriu.
+                if slot.bot is not None:
+                    slot.bot.encerrar()
+                continue
+            if slot.bot is None:
+                # Sem chaves de API, sem cadastro ou erro no início: solta o slot e o lease,
+                # e o próximo rebalanceamento tenta de novo se o bot continuar ligado.
+                self._remover(slot.user_id, parado_pelo_usuario=False)
+                continue
+
+            slot.iniciado = True
+            # Só avisa o início uma vez: adoções após rebalanceamento ou restart não notificam.
+            try:
+                primeiro_inicio = get_redis().set(CHAVE_ATIVO.format(user_id=slot.user_id), self.worker_id, nx=True)
+            except RedisError:
+                primeiro_inicio = False
+            if primeiro_inicio:
+                enviar_notificacao_async(
+                    f"🤖 [{slot.bot.symbol}] *Bot INICIADO*\nIniciando monitoramento...",
+                    slot.user_profile.telegram_bot_token,
+                    slot.user_profile.telegram_chat_id
+                )
+            print(f"--- Iniciando bot do usuário {slot.username} no símbolo {slot.bot.symbol} ---")
+            self._assinar_stream(slot)
+            slot.em_execucao = False
+            self._agendar(slot)
+
+    def _disparar(self, user_id, geracao):
+        slot = self.slots.get(user_id)
+        if slot is None or slot.geracao != geracao:
+            return
+        self._agendar(slot)
+        stream = self._stream_do_slot(slot)
+        if stream is not None and stream.conectado:
+            return  # o stream dispara a checagem; o timer só vale enquanto ele estiver fora
+        self._executar(slot)
+
+    def _executar(self, slot):
+        if slot.em_execucao:
+            self.overruns += 1
+            get_metrics().incrementar("bot_cycle_overruns_total", **getattr(slot.bot, "rotulos", {}))
+            print(f"[Runner] Checagem anterior do usuário {slot.user_id} ainda em andamento; pulando esta.")
+            return
+        slot.em_execucao = True
+        self.executor.submit(self._checar, slot)
+
+    def _checar(self, slot):
+        try:
+            close_old_connections()
+            if slot.reconfigurar_pendente:
+                slot.reconfigurar_pendente = False
+                control = BotControl.objects.get(user_id=slot.user_id)
+                slot.bot.reconfigurar(control)
+                slot.intervalo = self._intervalo_checagem(control.timeframe)
+                # Símbolo ou timeframe podem ter mudado: o loop troca o stream assinado.
+                self._retornos.append(("reconfigurado", slot))
+            slot.bot.run_single_check()
+        except Exception as e:
+            print(f"ERRO CRÍTICO NO LOOP PRINCIPAL DO RUNNER para {slot.username}: {e}")
+            enviar_notificacao_async(
+                f"🔥 *Erro Crítico no Bot* 🔥\nSímbolo: `{slot.bot.symbol}`\nErro: `{e}`\nO bot foi parado por segurança.",
+                slot.user_profile.telegram_bot_token,
+                slot.user_profile.telegram_chat_id
+            )
+            # Em caso de erro grave, desliga o bot; o evento de stop faz o runner removê-lo.
+            BotControl.objects.filter(user_id=slot.user_id).update(is_running=False)
+            publicar_evento(slot.user_id, EVENTO_STOP)
+        finally:
+            slot.em_execucao = False
+
+    # --- Streams de kline (BOT_STREAMING_ENABLED) ---
+
+    def _assinar_stream(self, slot):
+        if not settings.BOT_STREAMING_ENABLED:
+            return
+        chave = (slot.bot.symbol, slot.bot.timeframe)
+        if slot.stream_chave == chave:
+            return
+        self._cancelar_stream(slot)
+        entrada = self._streams.get(chave)
+        if entrada is None:
+            stream = KlineStream(*chave)
+            stream.iniciar()
+            entrada = self._streams[chave] = (stream, set())
+        entrada[1].add(slot.user_id)
+        slot.stream_chave = chave
+
+    def _cancelar_stream(self, slot):
+        chave, slot.stream_chave = slot.stream_chave, None
+        entrada = self._streams.get(chave)
+        if entrada is None:
+            return
+        stream, inscritos = entrada
+        inscritos.discard(slot.user_id)
+        if not inscritos:
+            del self._streams[chave]
+            stream.parar(timeout=0)  # não segura o loop esperando a thread do stream
+
+    def _stream_do_slot(self, slot):
+        entrada = self._streams.get(slot.stream_chave)
+        return entrada[0] if entrada is not None else None
+
+    def _disparar_streams(self):
+        for stream, inscritos in list(self._streams.values()):
+            if stream.aguardar(0):
+                for user_id in list(inscritos):
+                    slot = self.slots.get(user_id)
+                    if slot is not None:
+                        self._executar(slot)
+
+    def _agendar(self, slot):
+        self.wheel.agendar(self._proximo_horario(slot.intervalo), (slot.user_id, slot.geracao))
+
+    @staticmethod
+    def _intervalo_checagem(timeframe):
+        candle = INTERVALOS_MS.get(timeframe, 60_000) / 1000
+        return min(candle, settings.BOT_CHECK_INTERVAL_SECONDS)
+
+    @staticmethod
+    def _proximo_horario(intervalo):
+        # Próxima virada alinhada ao epoch (as viradas de candle da Binance também são),
+        # mais um pequeno atraso para o candle fechado estar disponível na API.
+        atraso = settings.BOT_RUNNER_CLOSE_DELAY_SECONDS
+        base = time.time() - atraso
+        return (math.floor(base / intervalo) + 1) * intervalo + atraso
@@ -0,0 +1,679 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit
+
+import numpy as np
+from aiohttp import web
+from binance.exceptions import BinanceAPIException
+from django.conf import settings
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from . import redis_client
+from .binance_pool import get_binance_pool
+from .market_data import INTERVALOS_MS
+
+# ===================================================================
+# Simulador local da API de futuros da Binance
+# ===================================================================
+
+MINUTO_MS = 60_000
+DIA_MS = 86_400_000
+
+
+class _RespostaSimulada:
+    """O suficiente de um `requests.Response` para montar um BinanceAPIException."""
+
+    def __init__(self, status_code, codigo, mensagem):
+        self.status_code = status_code
+        self.text = json.dumps({"code": codigo, "msg": mensagem})
+        self.headers = {}
+        self.request = None
+
+
+def _erro(status_code, codigo, mensagem):
+    return BinanceAPIException(_RespostaSimulada(status_code, codigo, mensagem), status_code,
+                               json.dumps({"code": codigo, "msg": mensagem}))
+
+
+class PricePath:
+    """
+    Caminho de preço em candles de 1m, sintético (passeio aleatório com semente por
+    símbolo) ou gravado (fechamentos de um arquivo de klines). Cresce sob demanda;
+    um caminho gravado fica parado no último preço depois do fim do arquivo.
+    """
+    BLOCO = 100_000  # minutos gerados por vez
+
+    def __init__(self, inicio_ms, closes=None, preco_inicial=100.0, volatilidade=0.001, seed=0):
+        self.inicio_ms = inicio_ms
+        self.gravado = closes is not None
+        self._closes = np.asarray(closes, dtype=np.float64) if closes is not None else np.array([preco_inicial])
+        self._volatilidade = volatilidade
+        self._rng = np.random.default_rng(seed)
+        self._mutex = threading.Lock()
+
+    def closes_ate(self, indice):
+        """Fechamentos de 1m do minuto 0 até `indice` (inclusive)."""
+        if indice >= len(self._closes) and not self.gravado:
+            with self._mutex:
+                while indice >= len(self._closes):
+                    passos = self._rng.normal(0, self._volatilidade, self.BLOCO)
+                    novos = self._closes[-1] * np.exp(np.cumsum(passos))
+                    self._closes = np.concatenate((self._closes, novos))
+        if indice >= len(self._closes):
+            return np.concatenate((self._closes, np.full(indice + 1 - len(self._closes), self._closes[-1])))
+        return self._closes[:indice + 1]
+
+
+class SimulatedExchange:
+    """
+    Estado compartilhado de uma "Binance" local: relógio acelerado, caminhos de preço
+    por símbolo e contas por api_key (saldo, posições em modo one-way e fills).
+
+    O relógio simulado começa `dias_historico` dias depois do início dos caminhos e
+    anda `aceleracao` vezes mais rápido que o real. Cada chamada pode sofrer uma
+    latência (com variação de ±50%) e falhar com probabilidade `taxa_erro`.
+    """
+
+    def __init__(self, simbolos=("BTCUSDT", "ETHUSDT"), aceleracao=60.0, latencia_ms=0.0, taxa_erro=0.0,
+                 dias_historico=60, caminhos=None, saldo_inicial=10_000.0, taxa=0.0004, slippage=0.0, seed=None):
+        """
+        Args:
+            caminhos (dict): symbol -> (open_times, closes) de 1m gravados; os demais
+                símbolos usam caminhos sintéticos.
+        """
+        self.aceleracao = aceleracao
+        self.latencia_ms = latencia_ms
+        self.taxa_erro = taxa_erro
+        self.saldo_inicial = saldo_inicial
+        self.taxa = taxa
+        self.slippage = slippage
+        self._rng = random.Random(seed)
+        self._mutex = threading.Lock()
+        self._contas = {}
+        self._proximo_id = 1
+        self._listen_keys = {}  # listenKey -> api_key
+        self._ouvintes = {}     # listenKey -> [callback(evento)]
+        self.chamadas = 0
+        self.erros_injetados = 0
+
+        historico_ms = dias_historico * DIA_MS
+        inicio_sintetico = (int(time.time() * 1000) - historico_ms) // DIA_MS * DIA_MS
+        self.caminhos = {}
+        for symbol in simbolos:
+            if caminhos and symbol in caminhos:
+                open_times, closes = caminhos[symbol]
+                self.caminhos[symbol] = PricePath(int(open_times[0]) // MINUTO_MS * MINUTO_MS, closes=closes)
+            else:
+                semente = int.from_bytes(hashlib.md5(symbol.encode()).digest()[:4], "big")
+                preco = 10 ** (1 + semente % 4)
+                self.caminhos[symbol] = PricePath(inicio_sintetico, preco_inicial=preco, seed=semente)
+        self._inicio_relogio = {s: c.inicio_ms + historico_ms for s, c in self.caminhos.items()}
+        self._t0 = time.monotonic()
+
+    def cliente(self, api_key=None, api_secret=None, testnet=True):
+        """Fábrica no formato do BinanceClientPool."""
+        return SimulatedClient(self, api_key, api_secret, testnet)
+
+    # --- Relógio e preços ---
+
+    def agora_ms(self, symbol=None):
+        decorrido = (time.monotonic() - self._t0) * self.aceleracao * 1000
+        base = self._inicio_relogio[symbol] if symbol else min(self._inicio_relogio.values())
+        return int(base + decorrido)
+
+    def _caminho(self, symbol):
+        caminho = self.caminhos.get(symbol)
+        if caminho is None:
+            raise _erro(400, -1121, "Invalid symbol.")
+        return caminho
+
+    def preco(self, symbol):
+        caminho = self._caminho(symbol)
+        indice = (self.agora_ms(symbol) - caminho.inicio_ms) // MINUTO_MS
+        return float(caminho.closes_ate(indice)[-1])
+
+    def klines(self, symbol, interval, limit=500, startTime=None, endTime=None):
+        caminho = self._caminho(symbol)
+        intervalo_ms = INTERVALOS_MS.get(interval)
+        if intervalo_ms is None:
+            raise _erro(400, -1120, "Invalid interval.")
+        limit = min(int(limit), 1500)
+        agora = self.agora_ms(symbol)
+        atual = agora // intervalo_ms * intervalo_ms
+        if startTime is not None:
+            primeiro = -(-max(int(startTime), caminho.inicio_ms) // intervalo_ms) * intervalo_ms
+            ultimo = min(atual, primeiro + (limit - 1) * intervalo_ms)
+        else:
+            ultimo = atual
+            primeiro = max(ultimo - (limit - 1) * intervalo_ms, -(-caminho.inicio_ms // intervalo_ms) * intervalo_ms)
+        if endTime is not None:
+            ultimo = min(ultimo, int(endTime) // intervalo_ms * intervalo_ms)
+        if ultimo < primeiro:
+            return []
+
+        por_candle = intervalo_ms // MINUTO_MS
+        indice_atual = (agora - caminho.inicio_ms) // MINUTO_MS
+        ini = (primeiro - caminho.inicio_ms) // MINUTO_MS
+        fim = min((ultimo - caminho.inicio_ms) // MINUTO_MS + por_candle - 1, indice_atual)
+        trecho = caminho.closes_ate(fim)[ini:]
+        quantidade = (ultimo - primeiro) // intervalo_ms + 1
+        # O candle em formação é completado com o preço atual (não altera high/low).
+        trecho = np.concatenate((trecho, np.full(quantidade * por_candle - len(trecho), trecho[-1])))
+        blocos = trecho.reshape(quantidade, por_candle)
+        abertos = blocos[:, 0]
+        maximas = blocos.max(axis=1)
+        minimas = blocos.min(axis=1)
+        fechamentos = blocos[:, -1]
+        return [
+            [t, f"{o:.8f}", f"{h:.8f}", f"{lo:.8f}", f"{c:.8f}", "0", t + intervalo_ms - 1, "0", 0, "0", "0", "0"]
+            for t, o, h, lo, c in zip(
+                range(primeiro, ultimo + 1, intervalo_ms), abertos.tolist(), maximas.tolist(),
+                minimas.tolist(), fechamentos.tolist(),
+            )
+        ]
+
+    # --- Contas ---
+
+    def _conta(self, api_key):
+        if not api_key:
+            raise _erro(401, -2015, "Invalid API-key, IP, or permissions for action.")
+        conta = self._contas.get(api_key)
+        if conta is None:
+            conta = {"saldo": self.saldo_inicial, "posicoes": {}, "fills": []}
+            self._contas[api_key] = conta
+        return conta
+
+    def _posicao(self, conta, symbol):
+        return conta["posicoes"].setdefault(
+            symbol, {"amt": 0.0, "entrada": 0.0, "leverage": 20, "margem": "CROSSED"}
+        )
+
+    def executar_ordem(self, api_key, symbol, side, quantity, reduce_only=False):
+        quantidade = float(quantity)
+        if quantidade < 0.001:
+            raise _erro(400, -4003, "Quantity less than or equal to zero.")
+        preco_mercado = self.preco(symbol)
+        sinal = 1 if side == "BUY" else -1
+        preco = preco_mercado * (1 + sinal * self.slippage)
+
+        with self._mutex:
+            conta = self._conta(api_key)
+            pos = self._posicao(conta, symbol)
+            if reduce_only and (pos["amt"] * sinal >= 0 or quantidade > abs(pos["amt"]) + 1e-12):
+                raise _erro(400, -2022, "ReduceOnly Order is rejected.")
+
+            realizado = 0.0
+            if pos["amt"] * sinal >= 0:
+                # Aumenta (ou abre) a posição: entrada vira a média ponderada.
+                total = abs(pos["amt"]) + quantidade
+                pos["entrada"] = (pos["entrada"] * abs(pos["amt"]) + preco * quantidade) / total
+                pos["amt"] += sinal * quantidade
+            else:
+                fechada = min(quantidade, abs(pos["amt"]))
+                direcao = 1 if pos["amt"] > 0 else -1
+                realizado = (preco - pos["entrada"]) * fechada * direcao
+                pos["amt"] += sinal * quantidade
+                if abs(pos["amt"]) < 1e-12:
+                    pos["amt"], pos["entrada"] = 0.0, 0.0
+                elif pos["amt"] * direcao < 0:
+                    # Virou a mão: o que sobrou abre ao preço da execução.
+                    pos["entrada"] = preco
+
+            comissao = preco * quantidade * self.taxa
+            conta["saldo"] += realizado - comissao
+            ordem_id = self._proximo_id
+            self._proximo_id += 1
+            agora = self.agora_ms(symbol)
+            conta["fills"].append({
+                "symbol": symbol, "id": ordem_id, "orderId": ordem_id, "side": side,
+                "price": f"{preco:.8f}", "qty": f"{quantidade}", "realizedPnl": f"{realizado:.8f}",
+                "marginAsset": "USDT", "quoteQty": f"{preco * quantidade:.8f}",
+                "commission": f"{comissao:.8f}", "commissionAsset": "USDT", "time": agora,
+                "positionSide": "BOTH", "buyer": side == "BUY", "maker": False,
+            })
+            eventos = self._eventos_execucao(conta, symbol, ordem_id, side, quantidade, preco, realizado,
+                                             reduce_only, agora)
+
+        self._publicar(api_key, eventos)
+        return {
+            "orderId": ordem_id, "symbol": symbol, "status": "FILLED", "clientOrderId": f"sim{ordem_id}",
+            "price": "0", "avgPrice": f"{preco:.8f}", "origQty": f"{quantidade}", "executedQty": f"{quantidade}",
+            "cumQuote": f"{preco * quantidade:.8f}", "reduceOnly": reduce_only, "side": side,
+            "positionSide": "BOTH", "type": "MARKET", "updateTime": agora,
+        }
+
+    def liquidar(self, api_key, symbol):
+        """Zera a posição ao preço atual como uma liquidação (mudança feita fora do bot)."""
+        with self._mutex:
+            conta = self._conta(api_key)
+            pos = self._posicao(conta, symbol)
+            if pos["amt"] == 0:
+                return
+            preco = self.preco(symbol)
+            quantidade = abs(pos["amt"])
+            side = "SELL" if pos["amt"] > 0 else "BUY"
+            realizado = (preco - pos["entrada"]) * pos["amt"]
+            conta["saldo"] += realizado
+            pos["amt"], pos["entrada"] = 0.0, 0.0
+            ordem_id = self._proximo_id
+            self._proximo_id += 1
+            eventos = self._eventos_execucao(conta, symbol, ordem_id, side, quantidade, preco, realizado,
+                                             True, self.agora_ms(symbol), tipo="LIQUIDATION")
+        self._publicar(api_key, eventos)
+
+    def posicoes(self, api_key, symbol=None):
+        with self._mutex:
+            conta = self._conta(api_key)
+            simbolos = [symbol] if symbol else list(self.caminhos)
+            linhas = []
+            for s in simbolos:
+                self._caminho(s)
+                pos = self._posicao(conta, s)
+                marca = self.preco(s)
+                linhas.append({
+                    "symbol": s, "positionAmt": f"{pos['amt']}", "entryPrice": f"{pos['entrada']:.8f}",
+                    "markPrice": f"{marca:.8f}", "unRealizedProfit": f"{(marca - pos['entrada']) * pos['amt']:.8f}",
+                    "leverage": str(pos["leverage"]), "marginType": pos["margem"].lower(), "positionSide": "BOTH",
+                })
+            return linhas
+
+    def alterar_alavancagem(self, api_key, symbol, leverage):
+        self._caminho(symbol)
+        with self._mutex:
+            self._posicao(self._conta(api_key), symbol)["leverage"] = int(leverage)
+        return {"symbol": symbol, "leverage": int(leverage), "maxNotionalValue": "1000000"}
+
+    def alterar_margem(self, api_key, symbol, margin_type):
+        self._caminho(symbol)
+        with self._mutex:
+            pos = self._posicao(self._conta(api_key), symbol)
+            if pos["margem"] == margin_type.upper():
+                raise _erro(400, -4046, "No need to change margin type.")
+            pos["margem"] = margin_type.upper()
+        return {"code": 200, "msg": "success"}
+
+    def conta(self, api_key):
+        posicoes = [
+            {"symbol": p["symbol"], "positionAmt": p["positionAmt"], "entryPrice": p["entryPrice"],
+             "unrealizedProfit": p["unRealizedProfit"], "leverage": p["leverage"]}
+            for p in self.posicoes(api_key)
+        ]
+        saldo = self._conta(api_key)["saldo"]
+        nao_realizado = sum(float(p["unrealizedProfit"]) for p in posicoes)
+        return {
+            "totalWalletBalance": f"{saldo:.8f}", "totalUnrealizedProfit": f"{nao_realizado:.8f}",
+            "availableBalance": f"{saldo:.8f}",
+            "assets": [{"asset": "USDT", "walletBalance": f"{saldo:.8f}"}],
+            "positions": posicoes,
+        }
+
+    def saldos(self, api_key):
+        saldo = self._conta(api_key)["saldo"]
+        return [{"accountAlias": "sim", "asset": "USDT", "balance": f"{saldo:.8f}",
+                 "availableBalance": f"{saldo:.8f}", "crossWalletBalance": f"{saldo:.8f}"}]
+
+    def fills(self, api_key, startTime=None, endTime=None, limit=500):
+        with self._mutex:
+            fills = [
+                f for f in self._conta(api_key)["fills"]
+                if (startTime is None or f["time"] >= startTime) and (endTime is None or f["time"] <= endTime)
+            ]
+        return fills[:min(int(limit), 1000)]
+
+    # --- User data stream ---
+
+    def criar_listen_key(self, api_key):
+        with self._mutex:
+            self._conta(api_key)
+            # Como na Binance, a conta com listenKey ativo recebe o mesmo de volta.
+            for chave, dono in self._listen_keys.items():
+                if dono == api_key:
+                    return chave
+            chave = secrets.token_hex(32)
+            self._listen_keys[chave] = api_key
+            return chave
+
+    def renovar_listen_key(self, api_key, listen_key):
+        with self._mutex:
+            if self._listen_keys.get(listen_key) != api_key:
+                raise _erro(400, -1125, "This listenKey does not exist.")
+        return {}
+
+    def fechar_listen_key(self, api_key, listen_key):
+        with self._mutex:
+            if self._listen_keys.get(listen_key) == api_key:
+                del self._listen_keys[listen_key]
+        return {}
+
+    def expirar_listen_key(self, listen_key):
+        """Simula a expiração (60 min sem keepalive): avisa quem está conectado e invalida a chave."""
+        with self._mutex:
+            self._listen_keys.pop(listen_key, None)
+            ouvintes = list(self._ouvintes.get(listen_key, []))
+        evento = {"e": "listenKeyExpired", "E": self.agora_ms(), "listenKey": listen_key}
+        for callback in ouvintes:
+            callback(evento)
+
+    def assinar_eventos(self, listen_key, callback):
+        """
+        Registra `callback(evento)` para os eventos da conta dona do listenKey.
+
+        Returns:
+            function: Cancela a assinatura.
+        """
+        with self._mutex:
+            if listen_key not in self._listen_keys:
+                raise _erro(400, -1125, "This listenKey does not exist.")
+            self._ouvintes.setdefault(listen_key, []).append(callback)
+
+        def cancelar():
+            with self._mutex:
+                lista = self._ouvintes.get(listen_key, [])
+                if callback in lista:
+                    lista.remove(callback)
+        return cancelar
+
+    def _eventos_execucao(self, conta, symbol, ordem_id, side, quantidade, preco, realizado, reduce_only, agora,
+                          tipo="MARKET"):
+        pos = conta["posicoes"][symbol]
+        return [
+            {
+                "e": "ORDER_TRADE_UPDATE", "E": agora, "T": agora,
+                "o": {
+                    "s": symbol, "c": f"sim{ordem_id}", "S": side, "o": "MARKET", "ot": tipo,
+                    "q": f"{quantidade}", "ap": f"{preco:.8f}", "L": f"{preco:.8f}", "l": f"{quantidade}",
+                    "z": f"{quantidade}", "X": "FILLED", "x": "TRADE", "i": ordem_id, "T": agora,
+                    "R": reduce_only, "ps": "BOTH", "rp": f"{realizado:.8f}",
+                },
+            },
+            {
+                "e": "ACCOUNT_UPDATE", "E": agora, "T": agora,
+                "a": {
+                    "m": "ORDER" if tipo == "MARKET" else "LIQUIDATION",
+                    "B": [{"a": "USDT", "wb": f"{conta['saldo']:.8f}", "cw": f"{conta['saldo']:.8f}"}],
+                    "P": [{
+                        "s": symbol, "pa": f"{pos['amt']}", "ep": f"{pos['entrada']:.8f}", "cr": "0",
+                        "up": "0", "mt": pos["margem"].lower(), "iw": "0", "ps": "BOTH",
+                    }],
+                },
+            },
+        ]
+
+    def _publicar(self, api_key, eventos):
+        with self._mutex:
+            ouvintes = [
+                c for chave, dono in self._listen_keys.items() if dono == api_key
+                for c in self._ouvintes.get(chave, [])
+            ]
+        for callback in ouvintes:
+            for evento in eventos:
+                callback(evento)
+
+    def info_simbolos(self):
+        return {
+            "timezone": "UTC",
+            "serverTime": self.agora_ms(),
+            "symbols": [
+                {
+                    "symbol": s, "status": "TRADING", "quantityPrecision": 3, "pricePrecision": 2,
+                    "filters": [
+                        {"filterType": "PRICE_FILTER", "tickSize": "0.01"},
+                        {"filterType": "LOT_SIZE", "stepSize": "0.001", "minQty": "0.001"},
+                        {"filterType": "MIN_NOTIONAL", "notional": "5"},
+                    ],
+                }
+                for s in self.caminhos
+            ],
+        }
+
+    # --- Latência e erros ---
+
+    def _antes_da_chamada(self):
+        with self._mutex:
+            self.chamadas += 1
+            falhar = self.taxa_erro and self._rng.random() < self.taxa_erro
+            if falhar:
+                self.erros_injetados += 1
+            atraso = self.latencia_ms * self._rng.uniform(0.5, 1.5) / 1000 if self.latencia_ms else 0
+        if atraso:
+            time.sleep(atraso)
+        if falhar:
+            raise _erro(503, -1001, "Internal error; unable to process your request. Please try again.")
+
+
+class SimulatedClient:
+    """
+    Substituto do `binance.client.Client` com os métodos que o projeto usa, todos
+    respondendo a partir de um SimulatedExchange.
+    """
+
+    def __init__(self, exchange, api_key=None, api_secret=None, testnet=True):
+        self.exchange = exchange
+        self.API_KEY = api_key
+        self.API_SECRET = api_secret
+        self.testnet = testnet
+        self.timestamp_offset = 0
+        self.response = None
+
+    def _chamar(self, funcao, *args, **kwargs):
+        self.exchange._antes_da_chamada()
+        return funcao(*args, **kwargs)
+
+    def ping(self):
+        return self._chamar(dict)
+
+    def futures_time(self):
+        return self._chamar(lambda: {"serverTime": self.exchange.agora_ms()})
+
+    def futures_exchange_info(self):
+        return self._chamar(self.exchange.info_simbolos)
+
+    def futures_klines(self, symbol, interval, limit=500, startTime=None, endTime=None, **kwargs):
+        return self._chamar(self.exchange.klines, symbol, interval, limit, startTime, endTime)
+
+    def futures_ticker(self, symbol):
+        def ticker():
+            preco = self.exchange.preco(symbol)
+            return {"symbol": symbol, "lastPrice": f"{preco:.8f}", "priceChangePercent": "0"}
+        return self._chamar(ticker)
+
+    def futures_position_information(self, symbol=None, **kwargs):
+        return self._chamar(self.exchange.posicoes, self.API_KEY, symbol)
+
+    def futures_create_order(self, symbol, side, type="MARKET", quantity=None, reduceOnly=False, **kwargs):
+        if type != "MARKET":
+            raise _erro(400, -1116, "Invalid orderType.")
+        reduce_only = reduceOnly in (True, "true", "True")
+        return self._chamar(self.exchange.executar_ordem, self.API_KEY, symbol, side, quantity, reduce_only)
+
+    def futures_create_test_order(self, **kwargs):
+        return self._chamar(dict)
+
+    def futures_change_leverage(self, symbol, leverage, **kwargs):
+        return self._chamar(self.exchange.alterar_alavancagem, self.API_KEY, symbol, leverage)
+
+    def futures_change_margin_type(self, symbol, marginType, **kwargs):
+        return self._chamar(self.exchange.alterar_margem, self.API_KEY, symbol, marginType)
+
+    def futures_account(self, **kwargs):
+        return self._chamar(self.exchange.conta, self.API_KEY)
+
+    def futures_account_balance(self, **kwargs):
+        return self._chamar(self.exchange.saldos, self.API_KEY)
+
+    def futures_account_trades(self, startTime=None, endTime=None, limit=500, **kwargs):
+        return self._chamar(self.exchange.fills, self.API_KEY, startTime, endTime, limit)
+
+    def futures_get_open_orders(self, **kwargs):
+        # Só ordens a mercado existem aqui: nada fica aberto no livro.
+        return self._chamar(list)
+
+    def futures_stream_get_listen_key(self):
+        return self._chamar(self.exchange.criar_listen_key, self.API_KEY)
+
+    def futures_stream_keepalive(self, listenKey):
+        return self._chamar(self.exchange.renovar_listen_key, self.API_KEY, listenKey)
+
+    def futures_stream_close(self, listenKey):
+        return self._chamar(self.exchange.fechar_listen_key, self.API_KEY, listenKey)
+
+
+class UserStreamStandIn:
+    """
+    Servidor websocket local no formato do user data stream de futuros
+    (`/ws/<listenKey>`), entregando os eventos gerados pelo SimulatedExchange.
+    """
+
+    def __init__(self, exchange, host="127.0.0.1", porta=0):
+        self.exchange = exchange
+        self.host = host
+        self.porta = porta
+        self._loop = None
+        self._runner = None
+        self._conexoes = set()
+        self._pronto = threading.Event()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.porta}"
+
+    def iniciar(self):
+        threading.Thread(target=self._rodar, name="user-stream-standin", daemon=True).start()
+        self._pronto.wait(5)
+        return self
+
+    def parar(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._desligar(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def derrubar_conexoes(self):
+        """Fecha todas as conexões abertas (para testar a reconexão do consumidor)."""
+        for ws in list(self._conexoes):
+            asyncio.run_coroutine_threadsafe(ws.close(), self._loop)
+
+    # --- Internos ---
+
+    def _rodar(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get("/ws/{listen_key}", self._stream)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.porta)
+        self._loop.run_until_complete(site.start())
+        self.porta = site._server.sockets[0].getsockname()[1]
+        self._pronto.set()
+        self._loop.run_forever()
+
+    async def _desligar(self):
+        for ws in list(self._conexoes):
+            await ws.close()
+        await self._runner.cleanup()
+
+    async def _stream(self, request):
+        fila = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        try:
+            cancelar = self.exchange.assinar_eventos(
+                request.match_info["listen_key"], lambda evento: loop.call_soon_threadsafe(fila.put_nowait, evento)
+            )
+        except BinanceAPIException:
+            return web.Response(status=400, text="Invalid listenKey")
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._conexoes.add(ws)
+
+        async def encaminhar():
+            while True:
+                evento = await fila.get()
+                await ws.send_json(evento)
+                if evento.get("e") == "listenKeyExpired":
+                    await ws.close()
+                    return
+
+        tarefa = asyncio.create_task(encaminhar())
+        try:
+            # Lê o socket para responder ao close/ping do cliente.
+            async for _ in ws:
+                pass
+        finally:
+            tarefa.cancel()
+            cancelar()
+            self._conexoes.discard(ws)
+        return ws
+
+
+# ===================================================================
+# Ambiente isolado para loadtest e benchmarks
+# ===================================================================
+
+class _TelegramFalso(BaseHTTPRequestHandler):
+    """Responde ok a qualquer sendMessage, para os bots simulados notificarem sem sair da máquina."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        corpo = b'{"ok": true, "result": {}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def ambiente_isolado(exchange, redis_url=None, criar_banco=True):
+    """
+    Roda o código real do bot contra o `exchange` sem tocar em nada de produção.
+
+    Cria um banco de teste (a menos que `criar_banco` seja False, como dentro do
+    `manage.py test`, que já criou o seu), troca o Redis para `redis_url` (padrão: o REDIS_URL
+    configurado, banco 15), sobe um Telegram falso e o user data stream local e faz
+    o pool da Binance entregar clientes do simulador. Tudo é desfeito na saída.
+
+    Yields:
+        str: URL do Telegram falso.
+    """
+    originais = (settings.REDIS_URL, settings.TELEGRAM_API_URL, settings.BINANCE_USER_WS_URL)
+    pool = get_binance_pool()
+    fabrica_original, clientes_originais = pool.fabrica, pool._clientes
+
+    settings.REDIS_URL = redis_url or urlunsplit(urlsplit(settings.REDIS_URL)._replace(path="/15"))
+    redis_client._conexao = None
+    nome_original = connection.settings_dict["NAME"]
+    if criar_banco:
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+
+    telegram = ThreadingHTTPServer(("127.0.0.1", 0), _TelegramFalso)
+    threading.Thread(target=telegram.serve_forever, daemon=True).start()
+    settings.TELEGRAM_API_URL = f"http://127.0.0.1:{telegram.server_address[1]}"
+    stream = UserStreamStandIn(exchange).iniciar()
+    settings.BINANCE_USER_WS_URL = stream.url
+    # Clientes já no pool apontam para a Binance (ou outro simulador): começa sem nenhum.
+    pool.fabrica, pool._clientes = exchange.cliente, OrderedDict()
+    try:
+        yield settings.TELEGRAM_API_URL
+    finally:
+        pool.fabrica, pool._clientes = fabrica_original, clientes_originais
+        stream.parar()
+        telegram.shutdown()
+        if criar_banco:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+        settings.REDIS_URL, settings.TELEGRAM_API_URL, settings.BINANCE_USER_WS_URL = originais
+        redis_client._conexao = None
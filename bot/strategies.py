@@ -0,0 +1,153 @@
+from collections import namedtuple
+
+# ===================================================================
+# Estratégias plugáveis do TradingBot
+# ===================================================================
+
+# Ações que uma estratégia pode pedir ao bot. O bot executa as ordens e mantém o
+# estado (IDLE / AWAITING_PULLBACK / IN_POSITION); a estratégia só decide.
+ABRIR = "abrir"          # abre posição no `lado`
+AGUARDAR = "aguardar"    # guarda o sinal do `lado` e espera (AWAITING_PULLBACK)
+CANCELAR = "cancelar"    # descarta o sinal pendente
+REVERTER = "reverter"    # inverte a posição para o `lado`
+FECHAR = "fechar"        # fecha a posição atual
+
+Decisao = namedtuple("Decisao", ["acao", "lado", "motivo"])
+
+# O que a estratégia enxerga a cada checagem. `serie` é a CandleSeries do hub (o último
+# candle está em formação) e `indicadores` é o IndicatorCache compartilhado do processo.
+Contexto = namedtuple("Contexto", [
+    "serie", "preco_atual", "estado", "posicao_tipo", "sinal_pendente", "indicadores",
+])
+
+ESTRATEGIA_PADRAO = "ema_pullback"
+
+_estrategias = {}
+
+
+def registrar_estrategia(nome):
+    """Decorator que disponibiliza a classe no campo `BotControl.strategy` com o `nome` dado."""
+    def decorator(classe):
+        classe.nome = nome
+        _estrategias[nome] = classe
+        return classe
+    return decorator
+
+
+def estrategias_disponiveis():
+    """Nomes das estratégias registradas, em ordem alfabética."""
+    return sorted(_estrategias)
+
+
+def criar_estrategia(control):
+    """
+    Instancia a estratégia configurada no BotControl.
+
+    Raises:
+        ValueError: Se `control.strategy` não é uma estratégia registrada ou os parâmetros são inválidos.
+    """
+    nome = control.strategy or ESTRATEGIA_PADRAO
+    classe = _estrategias.get(nome)
+    if classe is None:
+        raise ValueError(f"Estratégia desconhecida: {nome}. Disponíveis: {', '.join(estrategias_disponiveis())}")
+    return classe(control)
+
+
+class Estrategia:
+    """
+    Base das estratégias.
+
+    Recebe o BotControl no construtor (os parâmetros extras vêm de `strategy_params`) e, a
+    cada checagem, `decidir()` devolve uma Decisao ou None. Indicadores devem vir de
+    `contexto.indicadores.obter(...)`, para serem calculados uma vez por candle para
+    toda a frota.
+    """
+    nome = None
+
+    def __init__(self, control):
+        self.params = dict(control.strategy_params or {})
+
+    def candles_necessarios(self):
+        """Quantos candles fechados a estratégia precisa para decidir."""
+        raise NotImplementedError
+
+    def decidir(self, contexto):
+        raise NotImplementedError
+
+    def parametros_indicadores(self):
+        """Tupla comparável dos parâmetros; o bot recria a estratégia quando ela muda."""
+        return tuple(sorted(self.params.items()))
+
+    def descricao(self):
+        return self.nome
+
+
+@registrar_estrategia("ema_pullback")
+class EmaPullback(Estrategia):
+    """
+    Cruzamento das EMAs rápida e lenta com entrada no pullback.
+
+    Cruzou e o preço está perto da EMA lenta: abre. Cruzou longe dela: espera o preço
+    voltar enquanto o cruzamento continuar valendo. Com posição, o cruzamento contrário
+    inverte a posição. Os períodos vêm de `ema_fast`/`ema_slow` do BotControl e a
+    distância máxima de `strategy_params["max_distancia_percent"]` (padrão 3%).
+    """
+
+    def __init__(self, control):
+        super().__init__(control)
+        self.fast = control.ema_fast
+        self.slow = control.ema_slow
+        self.max_distancia = float(self.params.get("max_distancia_percent", 3.0))
+
+    def candles_necessarios(self):
+        return self.slow
+
+    def parametros_indicadores(self):
+        return (self.fast, self.slow) + super().parametros_indicadores()
+
+    def descricao(self):
+        return f"EMA {self.fast}/{self.slow}"
+
+    def decidir(self, contexto):
+        # EMAs incrementais: atualizadas uma vez por candle fechado para todos os bots do par.
+        fast_p = contexto.indicadores.ema_atual(contexto.serie, self.fast)
+        slow_p = contexto.indicadores.ema_atual(contexto.serie, self.slow)
+        if fast_p is None or slow_p is None:
+            return None
+
+        # EMA consolidada no último candle fechado e a mesma EMA com o candle em formação.
+        preco = contexto.preco_atual
+        fast_a = fast_p + 2.0 / (self.fast + 1) * (preco - fast_p)
+        slow_a = slow_p + 2.0 / (self.slow + 1) * (preco - slow_p)
+        print(f"[{contexto.serie.symbol}] Preço: {preco:.4f} | EMA Rápida: {fast_a:.4f} | EMA Lenta: {slow_a:.4f}")
+
+        if contexto.estado == "IDLE":
+            cruzou_para_cima = fast_p < slow_p and fast_a > slow_a
+            cruzou_para_baixo = fast_p > slow_p and fast_a < slow_a
+            lado = "long" if cruzou_para_cima else "short" if cruzou_para_baixo else None
+            if lado is None:
+                return None
+            if self._perto(preco, slow_a):
+                return Decisao(ABRIR, lado, f"SINAL DE {lado.upper()} e preço próximo da EMA. Abrindo posição.")
+            return Decisao(AGUARDAR, lado, f"Sinal de {lado.upper()} detectado, mas preço distante. Aguardando pullback.")
+
+        if contexto.estado == "AWAITING_PULLBACK":
+            lado = contexto.sinal_pendente
+            ainda_valido = (lado == "long" and fast_a > slow_a) or (lado == "short" and fast_a < slow_a)
+            if not ainda_valido:
+                return Decisao(CANCELAR, lado, f"Sinal de {str(lado).upper()} invalidado. Cancelando espera.")
+            if self._perto(preco, slow_a):
+                return Decisao(ABRIR, lado, f"Pullback para {lado.upper()} confirmado! Abrindo posição.")
+            return None
+
+        if contexto.estado == "IN_POSITION":
+            if contexto.posicao_tipo == "long" and fast_a < slow_a:
+                return Decisao(REVERTER, "short", "Reversão Long->Short")
+            if contexto.posicao_tipo == "short" and fast_a > slow_a:
+                return Decisao(REVERTER, "long", "Reversão Short->Long")
+        return None
+
+    def _perto(self, preco, ema):
+        if ema == 0:
+            return False
+        return abs(preco - ema) / ema * 100 <= self.max_distancia
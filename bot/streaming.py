@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+
+import aiohttp
+from django.conf import settings
+
+
+class KlineStream:
+    """
+    Consome os eventos de kline e markPrice de um símbolo por websocket.
+
+    Roda em uma thread própria com seu event loop e sinaliza `evento` quando a
+    estratégia deve ser avaliada: no fechamento de um candle ou quando o preço
+    anda mais que `limiar_percent` desde a última avaliação. Reconecta sozinho;
+    enquanto estiver desconectado, `conectado` fica False e o chamador deve
+    voltar ao polling REST.
+    """
+    RECONEXAO_MIN = 1    # segundos
+    RECONEXAO_MAX = 60   # segundos
+    HEARTBEAT = 30       # segundos entre pings do aiohttp
+
+    def __init__(self, symbol, timeframe, limiar_percent=None, url_base=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.limiar_percent = (
+            limiar_percent if limiar_percent is not None else settings.BOT_STREAM_PRICE_THRESHOLD_PERCENT
+        )
+        self.url_base = (url_base or settings.BINANCE_WS_URL).rstrip("/")
+        self.evento = threading.Event()
+        self.conectado = False
+        self.preco_referencia = None
+        self.ultimo_preco = None
+        self._parar = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._tarefa = None
+        self._ws = None
+
+    @property
+    def url(self):
+        nome = self.symbol.lower()
+        return f"{self.url_base}/stream?streams={nome}@kline_{self.timeframe}/{nome}@markPrice@1s"
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._rodar, name=f"kline-stream-{self.symbol}", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout=5):
+        """Para o stream, esperando até `timeout` segundos pela thread (0 = não espera)."""
+        self._parar.set()
+        # Cancela a tarefa em vez de só fechar o socket: o stop pode chegar no meio do
+        # connect ou do sleep de reconexão, quando ainda não há socket para fechar.
+        if self._loop is not None and self._tarefa is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._tarefa.cancel)
+            except RuntimeError:
+                pass  # o loop já terminou
+        if self._thread is not None and timeout:
+            self._thread.join(timeout=timeout)
+
+    def aguardar(self, timeout):
+        """
+        Espera até `timeout` segundos por um disparo e o consome.
+
+        Returns:
+            bool: True se a estratégia deve ser avaliada agora.
+        """
+        if self.evento.wait(timeout):
+            self.evento.clear()
+            return True
+        return False
+
+    def marcar_avaliado(self, preco):
+        """Atualiza o preço de referência do limiar após uma avaliação."""
+        self.preco_referencia = preco
+
+    # --- Internos ---
+
+    def _rodar(self):
+        self._loop = asyncio.new_event_loop()
+        self._tarefa = self._loop.create_task(self._conectar_sempre())
+        try:
+            self._loop.run_until_complete(self._tarefa)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _conectar_sempre(self):
+        espera = self.RECONEXAO_MIN
+        async with aiohttp.ClientSession() as session:
+            while not self._parar.is_set():
+                try:
+                    async with session.ws_connect(self.url, heartbeat=self.HEARTBEAT) as ws:
+                        self._ws = ws
+                        self.conectado = True
+                        espera = self.RECONEXAO_MIN
+                        print(f"[{self.symbol}] Stream conectado em {self.url_base}.")
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._processar(json.loads(msg.data))
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    print(f"[{self.symbol}] Erro no stream: {e}")
+                except Exception as e:
+                    # Evento fora do formato esperado (KeyError, TypeError...): a thread não
+                    # pode morrer calada, senão o bot fica no polling REST para sempre.
+                    print(f"[{self.symbol}] Erro inesperado no stream ({type(e).__name__}: {e}); reconectando.")
+                finally:
+                    self._ws = None
+                    if self.conectado:
+                        print(f"[{self.symbol}] Stream desconectado. Voltando ao polling REST.")
+                    self.conectado = False
+
+                if not self._parar.is_set():
+                    await asyncio.sleep(espera)
+                    espera = min(espera * 2, self.RECONEXAO_MAX)
+
+    def _processar(self, mensagem):
+        dados = mensagem.get("data", mensagem)
+        tipo = dados.get("e")
+        if tipo == "kline":
+            kline = dados["k"]
+            self.ultimo_preco = float(kline["c"])
+            if kline["x"]:
+                # Candle fechado: é aqui que os cruzamentos de EMA se confirmam.
+                self._disparar(self.ultimo_preco)
+                return
+        elif tipo == "markPriceUpdate":
+            self.ultimo_preco = float(dados["p"])
+        else:
+            return
+
+        if self.preco_referencia is None:
+            self.preco_referencia = self.ultimo_preco
+        elif self.limiar_percent > 0:
+            variacao = abs(self.ultimo_preco - self.preco_referencia) / self.preco_referencia * 100
+            if variacao >= self.limiar_percent:
+                self._disparar(self.ultimo_preco)
+
+    def _disparar(self, preco):
+        self.preco_referencia = preco
+        self.evento.set()
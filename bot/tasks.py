@@ -1,15 +1,23 @@
 import time
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth.models import User
 from .models import BotControl
 from .bot_logic import TradingBot
-from .telegram import enviar_notificacao
+from .control_channel import (
+    EVENTO_RECONFIGURE, EVENTO_RESYNC, EVENTO_STOP, get_control_channel, ler_flag_rodando, publicar_evento,
+)
+from .metrics import get_metrics
+from .streaming import KlineStream
+from .telegram import enviar_notificacao_async
 
-@shared_task
-def trading_bot_task(user_id):
+def carregar_contexto_bot(user_id):
     """
-    Esta é a tarefa que o Celery executa em segundo plano para um usuário específico.
-    Ela gerencia o ciclo de vida do bot daquele usuário.
+    Busca o usuário, o BotControl e o perfil, validando as chaves de API.
+    Usada tanto pela tarefa do Celery quanto pelo runner dedicado (bot/runner.py).
+
+    Returns:
+        tuple | None: (user, control, user_profile), ou None se o bot não pode rodar.
     """
     # 1. Busca o usuário e suas configurações no banco de dados.
     try:
@@ -19,15 +27,15 @@ def trading_bot_task(user_id):
         # Busca o perfil com as chaves de API e credenciais do Telegram
         user_profile = user.userprofile 
     except (User.DoesNotExist, BotControl.DoesNotExist, User.userprofile.RelatedObjectDoesNotExist):
-        print(f"Usuário com ID {user_id} ou seu Perfil/BotControl não foi encontrado. A tarefa não pode continuar.")
-        return
+        print(f"Usuário com ID {user_id} ou seu Perfil/BotControl não foi encontrado. O bot não pode continuar.")
+        return None
 
     # 2. Validação: Verifica se as credenciais necessárias existem antes de começar.
     if not user_profile.api_key or not user_profile.api_secret:
-        print(f"Usuário {user.username} não tem chaves de API. Encerrando tarefa.")
+        print(f"Usuário {user.username} não tem chaves de API. Encerrando bot.")
         # Opcional: Enviar notificação de erro se as credenciais do Telegram existirem
         if user_profile.telegram_chat_id:
-             enviar_notificacao(
+             enviar_notificacao_async(
                 "⚠️ *Falha ao Iniciar o Bot*\n\nVocê precisa configurar suas chaves de API no painel de Admin para iniciar o bot.",
                 user_profile.telegram_bot_token, # Assumindo que você adicionou telegram_bot_token ao UserProfile
                 user_profile.telegram_chat_id
@@ -35,27 +43,81 @@ def trading_bot_task(user_id):
         # Marca o bot como parado no banco de dados por segurança
         control.is_running = False
         control.save()
+        publicar_evento(user.id, EVENTO_STOP)
+        return None
+
+    return user, control, user_profile
+
+@shared_task
+def trading_bot_task(user_id):
+    """
+    Esta é a tarefa que o Celery executa em segundo plano para um usuário específico.
+    Ela gerencia o ciclo de vida do bot daquele usuário.
+    """
+    # 1 e 2. Busca o usuário, suas configurações e valida as credenciais.
+    contexto = carregar_contexto_bot(user_id)
+    if contexto is None:
         return
+    user, control, user_profile = contexto
 
     # 3. Cria uma instância da sua lógica de bot, passando as configurações.
     bot_instance = TradingBot(control, user_profile)
     
     # Envia notificação de início usando as credenciais do usuário
-    enviar_notificacao(
+    enviar_notificacao_async(
         f"🤖 [{bot_instance.symbol}] *Bot INICIADO*\nIniciando monitoramento...",
         user_profile.telegram_bot_token,
         user_profile.telegram_chat_id
     )
     print(f"--- Iniciando loop do bot para o usuário {user.username} no símbolo {control.symbol} ---")
 
+    # Com streaming ligado, a avaliação acontece no fechamento do candle (ou no
+    # limiar de preço) e o polling REST fica só como fallback de desconexão.
+    stream = None
+    if settings.BOT_STREAMING_ENABLED:
+        stream = KlineStream(bot_instance.symbol, bot_instance.timeframe)
+        stream.iniciar()
+
+    # Stop/reconfigure chegam por pub/sub do Redis: enquanto espera, o loop não
+    # consulta o banco. O callback roda na thread do canal e só marca flags.
+    sinais = {"parar": False, "reconfigurar": False, "resync": False}
+
+    def _ao_receber_evento(evento):
+        if evento["tipo"] == EVENTO_STOP:
+            sinais["parar"] = True
+        elif evento["tipo"] == EVENTO_RECONFIGURE:
+            sinais["reconfigurar"] = True
+        elif evento["tipo"] == EVENTO_RESYNC:
+            sinais["resync"] = True
+
+    canal = get_control_channel()
+    canal.assinar(_ao_receber_evento, user_id=user.id)
+
     # 4. O loop principal do bot.
     while control.is_running:
+        if sinais["reconfigurar"]:
+            sinais["reconfigurar"] = False
+            control.refresh_from_db()
+            bot_instance.reconfigurar(control)
+            if stream is not None and (stream.symbol, stream.timeframe) != (bot_instance.symbol, bot_instance.timeframe):
+                stream.parar()
+                stream = KlineStream(bot_instance.symbol, bot_instance.timeframe)
+                stream.iniciar()
+
+        # 5. Pausa antes da próxima verificação.
+        sleep_time = 60 # segundos
         try:
             # Executa uma única verificação da estratégia.
+            inicio_checagem = time.monotonic()
             bot_instance.run_single_check()
+            if time.monotonic() - inicio_checagem > sleep_time:
+                # A checagem passou do intervalo: a próxima já sai atrasada.
+                get_metrics().incrementar("bot_cycle_overruns_total", **bot_instance.rotulos)
+            if stream is not None and bot_instance.prices:
+                stream.marcar_avaliado(bot_instance.prices[-1])
         except Exception as e:
             print(f"ERRO CRÍTICO NO LOOP PRINCIPAL DA TAREFA para {user.username}: {e}")
-            enviar_notificacao(
+            enviar_notificacao_async(
                 f"🔥 *Erro Crítico no Bot* 🔥\nSímbolo: `{bot_instance.symbol}`\nErro: `{e}`\nO bot foi parado por segurança.",
                 user_profile.telegram_bot_token,
                 user_profile.telegram_chat_id
@@ -63,25 +125,57 @@ def trading_bot_task(user_id):
             # Em caso de erro grave, desliga o bot
             control.is_running = False
             control.save()
+            publicar_evento(user.id, EVENTO_STOP)
+            break
+
+        if stream is not None and stream.conectado:
+            print("Aguardando fechamento do candle ou movimento de preço no stream...")
+        else:
+            print(f"Aguardando {sleep_time} segundos para a próxima checagem...")
 
-        # 5. Pausa antes da próxima verificação.
-        sleep_time = 60 # segundos
-        print(f"Aguardando {sleep_time} segundos para a próxima checagem...")
-        
         # Este loop interno permite um desligamento mais rápido (verifica a cada segundo)
-        for _ in range(sleep_time):
-            time.sleep(1)
-            control.refresh_from_db() # Recarrega o estado do banco de dados.
-            if not control.is_running:
+        inicio_espera = time.monotonic()
+        ultima_consulta_db = inicio_espera
+        while True:
+            if stream is not None:
+                disparou = stream.aguardar(1)
+            else:
+                time.sleep(1)
+                disparou = False
+
+            if sinais["resync"]:
+                # Reconectamos ao canal e podemos ter perdido um stop: confere a flag no Redis.
+                sinais["resync"] = False
+                rodando = ler_flag_rodando(user.id)
+                if rodando is None:
+                    control.refresh_from_db()
+                    rodando = control.is_running
+                sinais["parar"] = sinais["parar"] or not rodando
+            elif not canal.conectado and time.monotonic() - ultima_consulta_db >= 5:
+                # Redis fora do ar: volta a consultar o banco, mas com menos frequência.
+                ultima_consulta_db = time.monotonic()
+                control.refresh_from_db()
+                sinais["parar"] = sinais["parar"] or not control.is_running
+
+            if sinais["parar"]:
                 print(f"Comando de parada recebido para o bot do usuário {user.username}. Encerrando loop...")
+                control.is_running = False
                 break
-        
-        # Garante que o estado seja recarregado caso o loop de sleep termine normalmente.
-        control.refresh_from_db()
+            if disparou or sinais["reconfigurar"]:
+                break
+            # Sem stream conectado, volta ao polling REST a cada sleep_time.
+            if (stream is None or not stream.conectado) and time.monotonic() - inicio_espera >= sleep_time:
+                break
+
+    canal.cancelar(_ao_receber_evento, user_id=user.id)
+    if stream is not None:
+        stream.parar()
+    bot_instance.encerrar()
+    get_metrics().remover_series(**bot_instance.rotulos)
 
     # 6. Fim do loop (quando control.is_running se torna False).
     print(f"--- Loop do bot para {user.username} no símbolo {control.symbol} finalizado. ---")
-    enviar_notificacao(
+    enviar_notificacao_async(
         f"🛑 [{bot_instance.symbol}] *Bot PARADO*\nMonitoramento encerrado pelo usuário.",
         user_profile.telegram_bot_token,
         user_profile.telegram_chat_id
@@ -1,5 +1,65 @@
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import BUCKETS_ENTREGA, get_metrics
+
+# Sessão com keep-alive compartilhada por todos os envios do processo.
+_session = None
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def _post_telegram(mensagem, token, chat_id, timeout=10, markdown=True):
+    """
+    Faz o POST no sendMessage.
+
+    Returns:
+        tuple: (ok, retry_after, permanente, erro). `retry_after` vem do 429 do Telegram
+        (segundos) ou None; `permanente` indica um 4xx que não adianta repetir (ex: 400 de
+        Markdown inválido, 403 de bot bloqueado pelo usuário).
+    """
+    url = f"{settings.TELEGRAM_API_URL}/bot{token}/sendMessage"
+    payload = {
+        'chat_id': chat_id,
+        'text': mensagem,
+    }
+    if markdown:
+        payload['parse_mode'] = 'Markdown'
+    inicio = time.perf_counter()
+    try:
+        response = _get_session().post(url, json=payload, timeout=timeout)
+        get_metrics().observar("telegram_send_seconds", time.perf_counter() - inicio)
+        if response.status_code == 200 and response.json().get("ok"):
+            return True, None, False, None
+        get_metrics().incrementar("bot_errors_total", etapa="telegram", tipo=f"http_{response.status_code}")
+        retry_after = None
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                pass
+        permanente = 400 <= response.status_code < 500 and response.status_code != 429
+        return False, retry_after, permanente, response.text
+    except requests.exceptions.RequestException as e:
+        get_metrics().incrementar("bot_errors_total", etapa="telegram", tipo=type(e).__name__)
+        return False, None, False, f"Erro de conexão: {e}"
+
 
 def enviar_notificacao(mensagem: str, token: str, chat_id: str) -> bool:
     """
@@ -18,23 +78,259 @@ def enviar_notificacao(mensagem: str, token: str, chat_id: str) -> bool:
         print("ERRO DE NOTIFICAÇÃO: Token ou Chat ID do Telegram não foram fornecidos.")
         return False
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {
-        'chat_id': chat_id,
-        'text': mensagem,
-        'parse_mode': 'Markdown'
-    }
+    ok, _, _, erro = _post_telegram(mensagem, token, chat_id)
+    if ok:
+        print("Mensagem enviada para o Telegram.")
+    else:
+        print(f"Erro ao enviar para Telegram: {erro}")
+    return ok
 
-    try:
-        response = requests.post(url, json=payload, timeout=10)
-        
-        if response.status_code == 200 and response.json().get("ok"):
-            print("Mensagem enviada para o Telegram.")
-            return True
-        else:
-            print(f"Erro ao enviar para Telegram: {response.text}")
+
+def enviar_notificacao_async(mensagem: str, token: str, chat_id: str) -> bool:
+    """
+    Enfileira uma notificação no dispatcher do processo e retorna na hora.
+    Use no caminho de trading, onde um Telegram lento não pode atrasar ordens.
+
+    Returns:
+        bool: True se a mensagem entrou na fila.
+    """
+    return get_dispatcher().enfileirar(mensagem, token, chat_id)
+
+
+class NotificationDispatcher:
+    """
+    Entrega assíncrona de notificações do Telegram.
+
+    Quem chama só paga o custo de colocar a mensagem numa fila limitada. Uma thread
+    agenda os envios respeitando um intervalo mínimo por chat e um limite global de
+    mensagens por segundo; mensagens que se acumulam para o mesmo chat enquanto ele
+    está limitado saem juntas num único digest. Falhas são repetidas com backoff
+    exponencial (ou o retry_after do Telegram); um 4xx é permanente e não se repete,
+    e um 400 de Markdown que o Telegram não entendeu é reenviado uma vez como texto
+    puro. A latência entre enfileirar e entregar e os contadores ficam em
+    `metricas()` e no `get_metrics()` (telegram_delivery_seconds,
+    telegram_notifications_total, telegram_queue_size).
+    """
+    MAX_TENTATIVAS = 5
+    BACKOFF_INICIAL = 1.0  # segundos
+    INTERVALO_LIMPEZA = 60.0  # segundos entre as limpezas de `_liberado_em`
+    SEPARADOR_DIGEST = "\n\n———\n\n"
+    # O Telegram recusa (400) textos acima de 4096 caracteres; a folga cobre o cabeçalho
+    # do digest e emojis, que contam em dobro na contagem do Telegram (UTF-16).
+    LIMITE_TEXTO = 3900
+
+    def __init__(self, tamanho_fila=None, taxa_global=None, intervalo_chat=None, envios_paralelos=4):
+        self.fila = queue.Queue(maxsize=tamanho_fila or settings.TELEGRAM_QUEUE_SIZE)
+        self.taxa_global = taxa_global or settings.TELEGRAM_GLOBAL_RATE
+        self.intervalo_chat = intervalo_chat if intervalo_chat is not None else settings.TELEGRAM_CHAT_INTERVAL_SECONDS
+        self._executor = ThreadPoolExecutor(max_workers=envios_paralelos, thread_name_prefix="telegram")
+        self._pendentes = {}      # (token, chat_id) -> lista de (mensagem, enfileirada_em)
+        self._liberado_em = {}    # (token, chat_id) -> instante a partir do qual pode enviar
+        self._tentativas = {}     # (token, chat_id) -> falhas seguidas
+        self._em_voo = set()
+        self._tokens_globais = float(self.taxa_global)
+        self._ultimo_reabastecimento = time.monotonic()
+        self._ultima_limpeza = time.monotonic()
+        self._mutex = threading.Lock()
+        self._latencias = deque(maxlen=1000)
+        self._contadores = {"enfileiradas": 0, "entregues": 0, "digests": 0, "descartadas": 0, "falhas": 0}
+        self._thread = threading.Thread(target=self._agendar, name="telegram-dispatcher", daemon=True)
+        self._thread.start()
+
+    def enfileirar(self, mensagem, token, chat_id):
+        if not token or not chat_id:
+            print("ERRO DE NOTIFICAÇÃO: Token ou Chat ID do Telegram não foram fornecidos.")
             return False
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Erro de conexão ao enviar para o Telegram: {e}")
+        try:
+            self.fila.put_nowait((mensagem, token, chat_id, time.monotonic()))
+        except queue.Full:
+            self._contar("descartadas")
+            print("ERRO DE NOTIFICAÇÃO: fila do Telegram cheia, mensagem descartada.")
+            return False
+        self._contar("enfileiradas")
+        return True
+
+    def esvaziar(self, timeout=5.0):
+        """Espera até `timeout` segundos para entregar o que está na fila (usado no desligamento)."""
+        prazo = time.monotonic() + timeout
+        while time.monotonic() < prazo:
+            with self._mutex:
+                vazio = self.fila.unfinished_tasks == 0 and not self._pendentes and not self._em_voo
+            if vazio:
+                return True
+            time.sleep(0.05)
         return False
+
+    def metricas(self):
+        with self._mutex:
+            latencias = sorted(self._latencias)
+            dados = dict(self._contadores)
+        dados["na_fila"] = self.fila.qsize()
+        if latencias:
+            dados["latencia_p50"] = latencias[len(latencias) // 2]
+            dados["latencia_p95"] = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+            dados["latencia_max"] = latencias[-1]
+        return dados
+
+    # --- Internos ---
+
+    def _agendar(self):
+        while True:
+            with self._mutex:
+                ocioso = not self._pendentes
+            try:
+                item = self.fila.get(timeout=0.5 if ocioso else 0.05)
+                self._acumular(item)
+                # Drena o que mais chegou junto, para que rajadas virem digest.
+                while True:
+                    self._acumular(self.fila.get_nowait())
+            except queue.Empty:
+                pass
+            self._despachar_prontos()
+
+    def _acumular(self, item):
+        mensagem, token, chat_id, enfileirada_em = item
+        with self._mutex:
+            self._pendentes.setdefault((token, chat_id), []).append((mensagem, enfileirada_em))
+        self.fila.task_done()
+
+    def _despachar_prontos(self):
+        agora = time.monotonic()
+        with self._mutex:
+            self._reabastecer(agora)
+            if agora - self._ultima_limpeza >= self.INTERVALO_LIMPEZA:
+                self._limpar_liberacoes(agora)
+            aguardando = sum(len(p) for p in self._pendentes.values())
+            for chave in list(self._pendentes):
+                if self._tokens_globais < 1:
+                    break
+                if chave in self._em_voo or self._liberado_em.get(chave, 0) > agora:
+                    continue
+                lote = self._retirar_lote(chave)
+                self._em_voo.add(chave)
+                self._tokens_globais -= 1
+                self._liberado_em[chave] = agora + self.intervalo_chat
+                self._executor.submit(self._enviar_lote, chave, lote)
+        get_metrics().definir("telegram_queue_size", self.fila.qsize() + aguardando)
+
+    def _limpar_liberacoes(self, agora):
+        """Esquece os chats cujo intervalo já passou: sem isso, um por chat para sempre. Precisa do mutex."""
+        for chave in [c for c, liberado in self._liberado_em.items() if liberado <= agora]:
+            del self._liberado_em[chave]
+        self._ultima_limpeza = agora
+
+    def _retirar_lote(self, chave):
+        """Tira de `_pendentes` as mensagens mais antigas do chat que cabem num único envio. Precisa do mutex."""
+        pendentes = self._pendentes[chave]
+        tamanho = 0
+        corte = len(pendentes)
+        for i, (mensagem, _) in enumerate(pendentes):
+            tamanho += len(mensagem) + len(self.SEPARADOR_DIGEST)
+            if i > 0 and tamanho > self.LIMITE_TEXTO:
+                corte = i
+                break
+        lote = pendentes[:corte]
+        if corte < len(pendentes):
+            # O resto sai no próximo envio do chat, respeitando o intervalo por chat.
+            self._pendentes[chave] = pendentes[corte:]
+        else:
+            del self._pendentes[chave]
+        return lote
+
+    def _montar_texto(self, lote):
+        if len(lote) == 1:
+            texto = lote[0][0]
+        else:
+            texto = f"📬 *{len(lote)} notificações*" + self.SEPARADOR_DIGEST + self.SEPARADOR_DIGEST.join(m for m, _ in lote)
+        if len(texto) > self.LIMITE_TEXTO:
+            # Só acontece com uma mensagem sozinha maior que o limite. Corta numa quebra de
+            # linha quando dá, para não partir uma entidade do Markdown no meio; se ainda
+            # assim ficar inválido, o 400 faz o reenvio como texto puro.
+            corte = texto.rfind("\n", 0, self.LIMITE_TEXTO - 1)
+            if corte < self.LIMITE_TEXTO // 2:
+                corte = self.LIMITE_TEXTO - 1
+            texto = texto[:corte] + "…"
+        return texto
+
+    def _reabastecer(self, agora):
+        decorrido = agora - self._ultimo_reabastecimento
+        self._tokens_globais = min(float(self.taxa_global), self._tokens_globais + decorrido * self.taxa_global)
+        self._ultimo_reabastecimento = agora
+
+    def _enviar_lote(self, chave, lote):
+        token, chat_id = chave
+        try:
+            try:
+                texto = self._montar_texto(lote)
+                ok, retry_after, permanente, erro = _post_telegram(texto, token, chat_id)
+                if not ok and permanente and "can't parse entities" in (erro or ""):
+                    self._exportar("texto_puro")
+                    ok, retry_after, permanente, erro = _post_telegram(texto, token, chat_id, markdown=False)
+            except Exception as e:
+                # Qualquer erro fora dos tratados no POST vira uma tentativa falha, com backoff.
+                ok, retry_after, permanente, erro = False, None, False, f"Erro inesperado: {type(e).__name__}: {e}"
+            self._registrar_resultado(chave, lote, ok, retry_after, permanente, erro)
+        finally:
+            # Sem isso, uma exceção deixaria o chat "em voo" e ele nunca mais enviaria.
+            with self._mutex:
+                self._em_voo.discard(chave)
+
+    def _registrar_resultado(self, chave, lote, ok, retry_after, permanente, erro):
+        agora = time.monotonic()
+        if ok:
+            latencias = [agora - enfileirada_em for _, enfileirada_em in lote]
+            with self._mutex:
+                self._tentativas.pop(chave, None)
+                self._contadores["entregues"] += len(lote)
+                if len(lote) > 1:
+                    self._contadores["digests"] += 1
+                self._latencias.extend(latencias)
+            metricas = get_metrics()
+            for latencia in latencias:
+                metricas.observar("telegram_delivery_seconds", latencia, buckets=BUCKETS_ENTREGA)
+            self._exportar("entregues", len(lote))
+            if len(lote) > 1:
+                self._exportar("digests")
+            return
+
+        with self._mutex:
+            tentativas = self._tentativas.get(chave, 0) + 1
+            desistiu = permanente or tentativas >= self.MAX_TENTATIVAS
+            if desistiu:
+                self._tentativas.pop(chave, None)
+                self._contadores["falhas"] += len(lote)
+            else:
+                # Devolve o lote na frente do que chegou depois, mantendo a ordem.
+                self._tentativas[chave] = tentativas
+                self._pendentes[chave] = lote + self._pendentes.get(chave, [])
+                espera = retry_after if retry_after else self.BACKOFF_INICIAL * 2 ** (tentativas - 1)
+                self._liberado_em[chave] = agora + espera
+        if desistiu:
+            self._exportar("falhas", len(lote))
+            print(f"Erro ao enviar para Telegram após {tentativas} tentativa(s), descartando {len(lote)} mensagem(ns): {erro}")
+        else:
+            self._exportar("retentativas")
+            print(f"Erro ao enviar para Telegram (tentativa {tentativas}), nova tentativa em {espera}s: {erro}")
+
+    def _contar(self, nome):
+        with self._mutex:
+            self._contadores[nome] += 1
+        self._exportar(nome)
+
+    @staticmethod
+    def _exportar(resultado, quantidade=1):
+        get_metrics().incrementar("telegram_notifications_total", quantidade, resultado=resultado)
+
+
+_dispatcher = None
+_dispatcher_mutex = threading.Lock()
+
+
+def get_dispatcher():
+    """Retorna o dispatcher de notificações do processo, criando-o na primeira chamada."""
+    global _dispatcher
+    with _dispatcher_mutex:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher()
+            atexit.register(_dispatcher.esvaziar)
+    return _dispatcher
@@ -1,3 +1,1363 @@
-from django.test import TestCase
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from urllib3.exceptions import EmptyPoolError
+
+from . import redis_client
+from .account_cache import AccountSnapshotCache
+from .backtest import executar_backtest
+from .binance_pool import BinanceClientPool
+from .bot_logic import TradingBot
+from .checkpoint import VERSAO as VERSAO_CHECKPOINT, CheckpointBot, normalizar
+from .control_channel import (
+    EVENTO_RECONFIGURE, EVENTO_RESYNC, EVENTO_START, EVENTO_STOP, ControlChannel, ler_flag_rodando, publicar_evento,
+)
+from .exchange_info import CHAVE_LOCK as CHAVE_LOCK_EXINFO, SymbolRegistry
+from .indicators import IncrementalEma, IndicatorCache, ema_vetorizada
+from .ledger import indicadores_periodo, sincronizar_fills
+from .market_data import CHAVE_LOCK as CHAVE_LOCK_MD, CandleSeries, MarketDataHub
+from .metrics import CHAVE_GAUGES, CHAVE_VALORES, MetricsRegistry
+from .management.commands.ws_standin import KlineStandIn
+from .models import AccountFill, BotCheckpoint, BotControl, Trade, TradeArchive, UserProfile
+from .ohlcv_store import OhlcvStore, colunas_de_klines, fonte_store
+from .optimizer import (
+    SeriesCompartilhadas, _fechar_anexados, _inicializar_worker, avaliar_combinacao, gerar_combinacoes,
+    janelas_walk_forward, otimizar,
+)
+from .runner import CHAVE_ATIVO, CHAVE_LEASE, CHAVE_WORKERS, BotRunner, _BotSlot
+from .simulator import SimulatedExchange, UserStreamStandIn, ambiente_isolado
+from .strategies import ABRIR, REVERTER, Decisao
+from .streaming import KlineStream
+from .telegram import NotificationDispatcher, get_dispatcher
+from .trade_store import TradeBatch, arquivar_trades, buscar_trade_aberto
+from .user_stream import UserDataStream
+from .weight_governor import (
+    CHAVE_JANELA, ClienteGovernado, PesoEsgotado, WeightGovernor, get_weight_governor, prioridade_binance,
+    prioridade_endpoint,
+)
+
+
+def esperar(condicao, timeout=5.0):
+    """Espera `condicao()` ficar verdadeira. Returns: o último valor de `condicao()`."""
+    prazo = time.monotonic() + timeout
+    while time.monotonic() < prazo:
+        if condicao():
+            return True
+        time.sleep(0.05)
+    return condicao()
+
+
+def usar_redis_falso(caso):
+    """
+    Troca o Redis do processo por um fakeredis vazio até o fim do teste.
+
+    Returns:
+        fakeredis.FakeServer: O servidor, para simular queda (`connected = False`).
+    """
+    servidor = fakeredis.FakeServer()
+    anterior = redis_client._conexao
+    redis_client._conexao = fakeredis.FakeRedis(server=servidor)
+    caso.addCleanup(setattr, redis_client, "_conexao", anterior)
+    return servidor
+
+
+# ===================================================================
+# Indicadores vetorizados
+# ===================================================================
+
+class EmaVetorizadaTests(SimpleTestCase):
+
+    def test_igual_a_recorrencia_com_semente_sma(self):
+        # Série longa o bastante para atravessar vários blocos da soma acumulada.
+        rng = random.Random(7)
+        closes = [100.0]
+        for _ in range(4999):
+            closes.append(closes[-1] * (1 + rng.gauss(0, 0.002)))
+
+        for period in (6, 12, 200):
+            alpha = 2.0 / (period + 1)
+            esperado = sum(closes[:period]) / period
+            obtido = ema_vetorizada(closes, period)
+            self.assertAlmostEqual(obtido[period - 1], esperado, places=9)
+            for i in range(period, len(closes)):
+                esperado += alpha * (closes[i] - esperado)
+                self.assertLess(abs(obtido[i] - esperado) / esperado, 1e-9)
+
+
+class EmaIncrementalTests(SimpleTestCase):
+
+    JANELA = 200
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.closes = [100.0]
+        for _ in range(799):
+            self.closes.append(self.closes[-1] * (1 + rng.gauss(0, 0.002)))
+        self.cache = IndicatorCache(capacidade=8)
+
+    def serie(self, t):
+        """Janela que o hub entregaria no tick `t`: JANELA candles, o último em formação."""
+        fim = t + self.JANELA
+        return CandleSeries(
+            "BTCUSDT", "1m", tuple(range(t * 60_000, fim * 60_000, 60_000)), tuple(self.closes[t:fim]),
+            (), (), self.JANELA, 0,
+        )
+
+    def test_igual_a_ema_da_serie_completa_desde_a_semente(self):
+        referencia = {p: ema_vetorizada(self.closes, p) for p in (6, 12)}
+        for t in range(300):
+            for period in (6, 12):
+                obtido = self.cache.ema_atual(self.serie(t), period)
+                esperado = referencia[period][t + self.JANELA - 2]
+                self.assertLess(abs(obtido - esperado) / esperado, 1e-12)
+        self.assertEqual(self.cache.sementes_ema, 2)  # uma semente por período, o resto é O(1)
+
+    def test_bots_do_mesmo_par_compartilham_o_estado(self):
+        serie = self.serie(0)
+        valores = {self.cache.ema_atual(serie, 12) for _ in range(50)}
+        self.assertEqual(len(valores), 1)
+        self.assertEqual(self.cache.sementes_ema, 1)
+
+    def test_buraco_na_serie_semeia_de_novo(self):
+        self.cache.ema_atual(self.serie(0), 12)
+        serie = self.serie(500)  # nenhum candle em comum com o consolidado
+        obtido = self.cache.ema_atual(serie, 12)
+        self.assertEqual(obtido, IncrementalEma(12).semear(serie.closes[:-1]))
+        self.assertEqual(self.cache.sementes_ema, 2)
+
+    def test_serie_atrasada_nao_volta_o_estado(self):
+        atual = self.cache.ema_atual(self.serie(10), 12)
+        atrasada = self.serie(5)
+        self.assertEqual(self.cache.ema_atual(atrasada, 12), IncrementalEma(12).semear(atrasada.closes[:-1]))
+        self.assertEqual(self.cache.ema_atual(self.serie(10), 12), atual)
+        self.assertEqual(self.cache.sementes_ema, 1)
+
+    def test_sem_candles_suficientes(self):
+        self.JANELA = 5
+        self.assertIsNone(self.cache.ema_atual(self.serie(0), 12))
+
+
+# ===================================================================
+# Hub de candles (MarketDataHub)
+# ===================================================================
+
+class ClienteKlines:
+    """`futures_klines` de 1m até o minuto atual; `versao` muda o fechamento do candle em formação."""
+
+    def __init__(self):
+        self.chamadas = []
+        self.versao = 0
+        self.pular = set()  # open_times que a "Binance" não devolve
+
+    def futures_klines(self, symbol, interval, limit, startTime=None):
+        self.chamadas.append({"limit": limit, "startTime": startTime})
+        atual = int(time.time() * 1000) // 60_000 * 60_000
+        inicio = startTime if startTime is not None else atual - (limit - 1) * 60_000
+        candles = []
+        for open_time in range(inicio, atual + 1, 60_000):
+            if open_time in self.pular:
+                continue
+            close = open_time / 60_000 + (self.versao if open_time == atual else 0)
+            candles.append([open_time, "0", str(close + 1), str(close - 1), str(close), "0"])
+        return candles[:limit]
+
+
+class MarketDataHubTests(SimpleTestCase):
+
+    def setUp(self):
+        usar_redis_falso(self)
+        self.cliente = ClienteKlines()
+        # Os testes comparam janelas montadas em chamadas diferentes: não podem cruzar a virada do minuto.
+        segundos = time.time() % 60
+        if segundos > 58:
+            time.sleep(60.1 - segundos)
+
+    def test_segundo_worker_usa_a_serie_publicada_pelo_primeiro(self):
+        serie = MarketDataHub(ttl=60).obter_candles(self.cliente, "BTCUSDT", "1m", 50)
+        outra = MarketDataHub(ttl=60).obter_candles(self.cliente, "BTCUSDT", "1m", 50)
+        self.assertEqual(len(self.cliente.chamadas), 1)
+        self.assertEqual(outra, serie)
+        self.assertEqual(len(serie.open_times), 50)
+
+    def test_espera_o_worker_que_tem_o_lock_em_vez_de_buscar(self):
+        redis_client.get_redis().set(CHAVE_LOCK_MD.format(symbol="BTCUSDT", timeframe="1m"), "outro")
+        publicada = MarketDataHub(ttl=60)._buscar_binance(ClienteKlines(), "BTCUSDT", "1m", 50)
+        threading.Timer(0.3, MarketDataHub(ttl=60)._publicar, args=(publicada,)).start()
+
+        serie = MarketDataHub(ttl=60).obter_candles(self.cliente, "BTCUSDT", "1m", 50)
+        self.assertEqual(serie, publicada)
+        self.assertEqual(self.cliente.chamadas, [])
+
+    def test_lock_de_outro_worker_nao_e_liberado_por_quem_nao_e_dono(self):
+        hub = MarketDataHub(ttl=60)
+        chave = CHAVE_LOCK_MD.format(symbol="BTCUSDT", timeframe="1m")
+        r = redis_client.get_redis()
+        buscar = self.cliente.futures_klines
+
+        def buscar_e_perder_o_lock(**kwargs):
+            # O lock venceu durante a busca e outro worker o pegou.
+            r.set(chave, "outro")
+            return buscar(**kwargs)
+
+        self.cliente.futures_klines = buscar_e_perder_o_lock
+        hub.obter_candles(self.cliente, "BTCUSDT", "1m", 50)
+        self.assertEqual(r.get(chave), b"outro")
+
+    def test_delta_substitui_o_candle_em_formacao_e_acrescenta_os_novos(self):
+        hub = MarketDataHub(ttl=60)
+        completa = hub._buscar_binance(self.cliente, "BTCUSDT", "1m", 50)
+        # A base ficou 3 minutos para trás, com o último candle ainda em formação.
+        base = completa._replace(
+            open_times=tuple(t - 180_000 for t in completa.open_times),
+            closes=completa.closes[:-1] + (-1.0,), fetched_at=0.0,
+        )
+        hub._local[("BTCUSDT", "1m")] = base
+        self.cliente.chamadas.clear()
+        self.cliente.versao = 0.5
+
+        serie = hub.obter_candles(self.cliente, "BTCUSDT", "1m", 50)
+        self.assertEqual(self.cliente.chamadas, [{"limit": MarketDataHub.PAGINA_DELTA, "startTime": base.open_times[-1]}])
+        self.assertEqual(len(serie.open_times), 50)
+        self.assertEqual(serie.open_times[-1], completa.open_times[-1])
+        self.assertEqual(serie.closes[-4], base.open_times[-1] / 60_000)  # em formação, substituído no lugar
+        self.assertEqual(serie.closes[-1], serie.open_times[-1] / 60_000 + 0.5)
+        self.assertEqual(hub.estatisticas()["BTCUSDT:1m"]["gaps"], 1)
+
+    def test_delta_com_buraco_baixa_a_janela_inteira(self):
+        hub = MarketDataHub(ttl=60)
+        completa = hub._buscar_binance(self.cliente, "BTCUSDT", "1m", 50)
+        hub._local[("BTCUSDT", "1m")] = completa._replace(
+            open_times=tuple(t - 120_000 for t in completa.open_times), fetched_at=0.0,
+        )
+        self.cliente.chamadas.clear()
+        self.cliente.pular = {completa.open_times[-2]}
+
+        serie = hub.obter_candles(self.cliente, "BTCUSDT", "1m", 50)
+        self.assertEqual([c["startTime"] is None for c in self.cliente.chamadas], [False, True])
+        self.assertEqual(len(serie.open_times), 49)  # a janela inteira, ainda sem o candle que faltou
+
+
+# ===================================================================
+# KlineStream contra o stand-in local de websocket (ws_standin)
+# ===================================================================
+
+class KlineStreamTests(SimpleTestCase):
+
+    def iniciar(self, standin, limiar_percent=1.0):
+        standin.intervalo = 0.1
+        standin.iniciar()
+        self.addCleanup(standin.parar)
+        stream = KlineStream("BTCUSDT", "1m", limiar_percent=limiar_percent, url_base=standin.url)
+        stream.RECONEXAO_MIN = 0.2
+        stream.iniciar()
+        self.addCleanup(stream.parar)
+        self.assertTrue(esperar(lambda: stream.conectado))
+        return stream
+
+    def test_dispara_no_fechamento_do_candle(self):
+        # Preço parado: só o fechamento do candle (1s) pode disparar.
+        stream = self.iniciar(KlineStandIn(candle_segundos=1.0, volatilidade=0.0))
+        self.assertTrue(stream.aguardar(3))
+        self.assertEqual(stream.ultimo_preco, 100.0)
+
+    def test_dispara_quando_o_preco_passa_do_limiar(self):
+        # Candle de 1h: o disparo só pode vir da variação de preço.
+        stream = self.iniciar(KlineStandIn(candle_segundos=3600, volatilidade=0.05), limiar_percent=0.5)
+        self.assertTrue(stream.aguardar(3))
+        self.assertNotEqual(stream.ultimo_preco, 100.0)
+
+    def test_sem_disparo_sem_fechamento_nem_variacao(self):
+        stream = self.iniciar(KlineStandIn(candle_segundos=3600, volatilidade=0.0))
+        self.assertFalse(stream.aguardar(1))
+
+    def test_desconexao_volta_ao_polling_e_reconecta(self):
+        standin = KlineStandIn(candle_segundos=3600, volatilidade=0.0)
+        stream = self.iniciar(standin)
+        standin.derrubar_conexoes()
+        # Desconectado, o chamador (tarefa ou runner) usa o polling REST.
+        self.assertTrue(esperar(lambda: not stream.conectado))
+        self.assertTrue(esperar(lambda: stream.conectado and standin.conexoes_recebidas >= 2))
+
+    def test_evento_malformado_nao_derruba_a_thread(self):
+        class StandInMalformado(KlineStandIn):
+            async def _transmitir(self, ws, streams):
+                if self.conexoes_recebidas == 1:
+                    await ws.send_json({"data": {"e": "kline"}})  # sem "k": KeyError no consumidor
+                await super()._transmitir(ws, streams)
+
+        standin = StandInMalformado(candle_segundos=3600, volatilidade=0.0)
+        stream = self.iniciar(standin)
+        self.assertTrue(esperar(lambda: standin.conexoes_recebidas >= 2 and stream.conectado))
+        self.assertTrue(stream._thread.is_alive())
+
+
+# ===================================================================
+# TradingBot contra o simulador de exchange
+# ===================================================================
+
+class TradingBotSimuladorTests(TestCase):
+
+    def setUp(self):
+        self.exchange = SimulatedExchange(simbolos=("BTCUSDT",), aceleracao=1.0, seed=1)
+        # O `manage.py test` já criou o banco de teste; o resto (Binance, Telegram, Redis de teste) vem do ambiente.
+        ambiente = ambiente_isolado(self.exchange, criar_banco=False)
+        ambiente.__enter__()
+        self.addCleanup(ambiente.__exit__, None, None, None)
+        # As notificações saem em background: entrega tudo ao Telegram falso antes de desmontar o ambiente.
+        self.addCleanup(get_dispatcher().esvaziar)
+
+        self.user = User.objects.create(username="sim")
+        self.perfil = UserProfile.objects.create(
+            user=self.user, api_key="sim-key", api_secret="sim", telegram_bot_token="sim", telegram_chat_id="1",
+        )
+        self.control = BotControl.objects.create(user=self.user, symbol="BTCUSDT", timeframe="1m", ema_fast=6, ema_slow=12)
+
+    def posicao_na_exchange(self):
+        posicoes = self.exchange.cliente("sim-key").futures_position_information(symbol="BTCUSDT")
+        return sum(float(p["positionAmt"]) for p in posicoes)
+
+    def test_run_single_check_carrega_candles_sem_erros(self):
+        bot = TradingBot(self.control, self.perfil)
+        bot.run_single_check()
+        bot.run_single_check()
+        self.assertIsNotNone(bot.serie)
+        self.assertGreaterEqual(len(bot.prices), 200)
+        self.assertIn(bot.estado, ("IDLE", "AWAITING_PULLBACK", "IN_POSITION"))
+
+    def test_abrir_e_reverter_registram_trades_e_posicao(self):
+        bot = TradingBot(self.control, self.perfil)
+        preco = bot.trader.get_current_price("BTCUSDT")
+
+        bot._executar_decisao(Decisao(ABRIR, "long", "teste"), preco)
+        self.assertEqual(bot.estado, "IN_POSITION")
+        self.assertGreater(self.posicao_na_exchange(), 0)
+        aberto = Trade.objects.get(user=self.user, is_open=True)
+        self.assertEqual(aberto.side, "long")
+
+        bot._executar_decisao(Decisao(REVERTER, "short", "teste"), preco)
+        self.assertEqual(bot.posicao_atual_tipo, "short")
+        self.assertLess(self.posicao_na_exchange(), 0)
+        aberto.refresh_from_db()
+        self.assertFalse(aberto.is_open)
+        self.assertIsNotNone(aberto.exit_price)
+        self.assertEqual(Trade.objects.get(user=self.user, is_open=True).side, "short")
+
+    def ordens_sem(self, bot, *campos):
+        """Faz as ordens do bot voltarem da Binance sem os `campos` da resposta RESULT."""
+        original = bot.trader.market_order
+
+        def market_order(*args, **kwargs):
+            ordem = original(*args, **kwargs)
+            return ordem and {k: v for k, v in ordem.items() if k not in campos}
+
+        bot.trader.market_order = market_order
+
+    def test_reverter_usa_a_posicao_real_e_nao_a_do_estado_local(self):
+        bot = TradingBot(self.control, self.perfil)
+        preco = bot.trader.get_current_price("BTCUSDT")
+        bot._executar_decisao(Decisao(ABRIR, "long", "teste"), preco)
+        aberta = self.posicao_na_exchange()
+
+        bot.quantidade_em_moeda *= 3  # estado local velho (checkpoint, ordem manual...)
+        bot._executar_decisao(Decisao(REVERTER, "short", "teste"), preco)
+        self.assertAlmostEqual(self.posicao_na_exchange(), -aberta, places=6)
+        self.assertAlmostEqual(bot.quantidade_em_moeda, aberta, places=6)
+        self.assertEqual(Trade.objects.get(user=self.user, is_open=True).side, "short")
+
+    def test_reverter_sem_executed_qty_nao_fecha_o_trade_e_confere_a_posicao(self):
+        bot = TradingBot(self.control, self.perfil)
+        preco = bot.trader.get_current_price("BTCUSDT")
+        bot._executar_decisao(Decisao(ABRIR, "long", "teste"), preco)
+        aberto = Trade.objects.get(user=self.user, is_open=True)
+
+        self.ordens_sem(bot, "executedQty")
+        bot._executar_decisao(Decisao(REVERTER, "short", "teste"), preco)
+        aberto.refresh_from_db()
+        self.assertTrue(aberto.is_open)
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(bot.posicao_atual_tipo, "short")
+        self.assertAlmostEqual(bot.quantidade_em_moeda, abs(self.posicao_na_exchange()), places=6)
+
+    def test_abrir_sem_preco_de_execucao_usa_a_entrada_da_binance(self):
+        bot = TradingBot(self.control, self.perfil)
+        preco = bot.trader.get_current_price("BTCUSDT")
+        self.ordens_sem(bot, "avgPrice")
+        bot.trader.get_current_price = lambda symbol: None
+
+        bot._executar_decisao(Decisao(ABRIR, "long", "teste"), preco)
+        aberto = Trade.objects.get(user=self.user, is_open=True)
+        entrada = self.exchange.cliente("sim-key").futures_position_information(symbol="BTCUSDT")[0]["entryPrice"]
+        self.assertAlmostEqual(float(aberto.entry_price), float(entrada), places=4)
+        self.assertEqual(bot.estado, "IN_POSITION")
+
+    def test_reinicio_retoma_o_sinal_pendente_so_com_os_mesmos_indicadores(self):
+        bot = TradingBot(self.control, self.perfil)
+        bot.estado, bot.sinal_pendente_tipo = "AWAITING_PULLBACK", "long"
+        bot._salvar_checkpoint()
+
+        retomado = TradingBot(self.control, self.perfil)
+        self.assertEqual((retomado.estado, retomado.sinal_pendente_tipo), ("AWAITING_PULLBACK", "long"))
+        self.assertEqual(retomado.conta_configurada, bot.conta_configurada)  # sem reconfigurar a conta
+
+        self.control.timeframe = "5m"
+        reconfigurado = TradingBot(self.control, self.perfil)
+        self.assertEqual((reconfigurado.estado, reconfigurado.sinal_pendente_tipo), ("IDLE", None))
+
+
+# ===================================================================
+# Checkpoint do estado dos bots
+# ===================================================================
+
+class CheckpointBotTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="checkpoint")
+        self.dados = {"estado": "IN_POSITION", "posicao_tipo": "long", "parametros": (6, 12)}
+
+    def test_so_grava_quando_o_estado_muda(self):
+        checkpoint = CheckpointBot(self.user.id)
+        self.assertTrue(checkpoint.salvar(self.dados))
+        with self.assertNumQueries(0):
+            # Tupla e lista são o mesmo snapshot depois do JSON.
+            self.assertFalse(checkpoint.salvar(dict(self.dados, parametros=[6, 12])))
+        self.assertTrue(checkpoint.salvar(dict(self.dados, estado="IDLE")))
+        self.assertEqual(BotCheckpoint.objects.get(user=self.user).dados["estado"], "IDLE")
+
+    def test_carregar_retoma_os_dados_e_a_comparacao(self):
+        CheckpointBot(self.user.id).salvar(self.dados)
+        checkpoint = CheckpointBot(self.user.id)
+        dados, idade = checkpoint.carregar()
+        self.assertEqual(dados, normalizar(self.dados))
+        self.assertLess(idade, 5)
+        with self.assertNumQueries(0):
+            self.assertFalse(checkpoint.salvar(self.dados))
+
+    def test_outra_versao_e_ignorada(self):
+        self.assertIsNone(CheckpointBot(self.user.id).carregar())
+        CheckpointBot(self.user.id).salvar(self.dados)
+        with mock.patch("bot.checkpoint.VERSAO", VERSAO_CHECKPOINT + 1):
+            self.assertIsNone(CheckpointBot(self.user.id).carregar())
+
+
+# ===================================================================
+# UserDataStream contra o user data stream do simulador
+# ===================================================================
+
+class UserDataStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.exchange = SimulatedExchange(simbolos=("BTCUSDT",), aceleracao=1.0, seed=1)
+        self.standin = UserStreamStandIn(self.exchange).iniciar()
+        self.addCleanup(self.standin.parar)
+
+    def iniciar(self, keepalive=60, reconciliar=60, reconexao=0.2):
+        stream = UserDataStream(
+            1, self.exchange.cliente("user-1"), url_base=self.standin.url, keepalive=keepalive, reconciliar=reconciliar,
+        )
+        stream.RECONEXAO_MIN = reconexao
+        stream.iniciar()
+        self.addCleanup(stream.parar)
+        self.assertTrue(esperar(lambda: stream.conectado))
+        return stream
+
+    def amt(self, stream):
+        posicao = stream.posicao("BTCUSDT")
+        return posicao and posicao["amt"]
+
+    def test_eventos_atualizam_posicao_e_ordens(self):
+        stream = self.iniciar()
+        self.assertEqual(self.amt(stream), 0.0)
+
+        self.exchange.executar_ordem("user-1", "BTCUSDT", "BUY", 0.01)  # ORDER_TRADE_UPDATE + ACCOUNT_UPDATE
+        self.assertTrue(esperar(lambda: self.amt(stream) == 0.01))
+
+        ordem = {"s": "BTCUSDT", "i": 999, "X": "NEW", "S": "SELL", "q": "0.01"}
+        self.exchange._publicar("user-1", [{"e": "ORDER_TRADE_UPDATE", "o": ordem}])
+        self.assertTrue(esperar(lambda: "999" in stream.ordens))
+        self.exchange._publicar("user-1", [{"e": "ORDER_TRADE_UPDATE", "o": dict(ordem, X="CANCELED")}])
+        self.assertTrue(esperar(lambda: "999" not in stream.ordens))
+
+    def test_evento_malformado_e_ignorado_sem_derrubar_a_conexao(self):
+        stream = self.iniciar()
+        self.exchange._publicar("user-1", [{"e": "ORDER_TRADE_UPDATE"}])  # sem "o": KeyError no consumidor
+        self.exchange.executar_ordem("user-1", "BTCUSDT", "SELL", 0.02)
+        self.assertTrue(esperar(lambda: self.amt(stream) == -0.02))
+        self.assertTrue(stream.conectado)
+        self.assertTrue(stream._thread.is_alive())
+
+    def test_listen_key_expirada_reconecta_com_chave_nova(self):
+        stream = self.iniciar()
+        chave = stream.listen_key
+        self.exchange.expirar_listen_key(chave)
+        self.assertTrue(esperar(lambda: stream.conectado and stream.listen_key not in (None, chave)))
+
+    def test_keepalive_recusado_reconecta_com_chave_nova(self):
+        stream = self.iniciar(keepalive=0.3)
+        chave = stream.listen_key
+        # A chave some sem aviso pelo socket: só o keepalive (-1125) percebe.
+        self.exchange.fechar_listen_key("user-1", chave)
+        self.assertTrue(esperar(lambda: stream.conectado and stream.listen_key not in (None, chave)))
+
+    def test_reconciliacao_corrige_posicao_alterada_desconectado(self):
+        stream = self.iniciar(reconexao=1.0)
+        self.standin.derrubar_conexoes()
+        self.assertTrue(esperar(lambda: not stream.conectado))
+        # Ordem executada com o socket fora: o evento se perde e só o REST a enxerga.
+        self.exchange.executar_ordem("user-1", "BTCUSDT", "BUY", 0.05)
+        self.assertEqual(self.amt(stream), 0.0)
+        self.assertTrue(esperar(lambda: stream.conectado and self.amt(stream) == 0.05))
+
+    def test_posicao_none_quando_o_livro_fica_velho(self):
+        stream = self.iniciar(reconciliar=0.5)
+        stream.url_base = "ws://127.0.0.1:1"  # as reconexões passam a falhar
+        self.standin.derrubar_conexoes()
+        self.assertTrue(esperar(lambda: not stream.conectado))
+        self.assertIsNotNone(stream.posicao("BTCUSDT"))  # ainda dentro da janela de reconciliação
+        self.assertTrue(esperar(lambda: stream.posicao("BTCUSDT") is None))
+
+
+# ===================================================================
+# Canal de controle (pub/sub de start/stop/reconfigure)
+# ===================================================================
+
+class ControlChannelTests(SimpleTestCase):
+
+    def setUp(self):
+        self.servidor = usar_redis_falso(self)
+        self.canal = ControlChannel()
+        self.canal.ESPERA_RECONEXAO = 0.1
+        self.recebidos = {"u1": [], "u2": [], "todos": []}
+        self.canal.assinar(self.recebidos["u1"].append, user_id=1)
+        self.canal.assinar(self.recebidos["u2"].append, user_id=2)
+        self.canal.assinar(self.recebidos["todos"].append)
+        # Ao conectar, todos recebem um resync.
+        self.assertTrue(esperar(lambda: all(self.recebidos.values())))
+
+    def tipos(self, nome):
+        return [evento["tipo"] for evento in self.recebidos[nome]]
+
+    def test_evento_chega_so_ao_usuario_e_aos_globais(self):
+        self.assertTrue(publicar_evento(1, EVENTO_STOP))
+        self.assertTrue(esperar(lambda: EVENTO_STOP in self.tipos("u1")))
+        self.assertTrue(esperar(lambda: EVENTO_STOP in self.tipos("todos")))
+        self.assertNotIn(EVENTO_STOP, self.tipos("u2"))
+        self.assertIs(ler_flag_rodando(1), False)
+        self.assertIsNone(ler_flag_rodando(2))
+
+    def test_cancelado_nao_recebe_mais(self):
+        self.canal.cancelar(self.recebidos["u1"].append, user_id=1)
+        publicar_evento(1, EVENTO_RECONFIGURE)
+        self.assertTrue(esperar(lambda: EVENTO_RECONFIGURE in self.tipos("todos")))
+        self.assertNotIn(EVENTO_RECONFIGURE, self.tipos("u1"))
+
+    def test_reconexao_entrega_resync_a_todos(self):
+        self.servidor.connected = False
+        self.assertTrue(esperar(lambda: not self.canal.conectado))
+        # Publicado com o canal fora do ar: a mensagem se perde, mas a flag fica.
+        self.assertFalse(publicar_evento(2, EVENTO_START))
+        self.servidor.connected = True
+        self.assertTrue(esperar(lambda: self.tipos("u2").count(EVENTO_RESYNC) == 2))
+        self.assertEqual(self.tipos("u1"), [EVENTO_RESYNC, EVENTO_RESYNC])
+
+    def test_flag_sem_redis_e_desconhecida(self):
+        publicar_evento(1, EVENTO_START)
+        self.servidor.connected = False
+        self.assertIsNone(ler_flag_rodando(1))
+
+
+# ===================================================================
+# BotRunner: leases entre workers
+# ===================================================================
+
+# TransactionTestCase: o runner chama close_old_connections(), que derruba a transação do TestCase.
+class BotRunnerLeaseTests(TransactionTestCase):
+
+    def setUp(self):
+        self.servidor = usar_redis_falso(self)
+        self.redis = redis_client.get_redis()
+        user = User.objects.create(username="lease")
+        BotControl.objects.create(user=user, symbol="BTCUSDT", is_running=True)
+        self.user_id = user.id
+        self.a = self.criar_runner("worker-a")
+        self.b = self.criar_runner("worker-b")
+
+    def criar_runner(self, worker_id):
+        runner = BotRunner(worker_id=worker_id, threads=1)
+        self.addCleanup(runner.executor.shutdown, wait=False)
+        return runner
+
+    def dono_do_lease(self):
+        dono = self.redis.get(CHAVE_LEASE.format(user_id=self.user_id))
+        return dono and dono.decode()
+
+    def test_lease_tomado_por_outro_worker_para_o_slot(self):
+        self.a._rebalancear()
+        self.assertIn(self.user_id, self.a.slots)
+        self.assertEqual(self.dono_do_lease(), "worker-a")
+
+        # O loop de A trava por mais que o TTL: o heartbeat e o lease expiram e B adota o bot.
+        timeout = settings.BOT_RUNNER_WORKER_TIMEOUT
+        self.redis.zadd(CHAVE_WORKERS, {"worker-a": time.time() - timeout - 1})
+        self.redis.delete(CHAVE_LEASE.format(user_id=self.user_id))
+        self.b._rebalancear()
+        self.assertIn(self.user_id, self.b.slots)
+        self.assertEqual(self.dono_do_lease(), "worker-b")
+
+        # A volta: a renovação falha e o slot sai dele, sem mexer no lease de B.
+        self.a._rebalancear()
+        self.assertNotIn(self.user_id, self.a.slots)
+        self.assertEqual(self.dono_do_lease(), "worker-b")
+
+    def test_lease_renovado_mantem_o_slot(self):
+        self.a._rebalancear()
+        self.a._rebalancear()
+        self.assertIn(self.user_id, self.a.slots)
+        self.assertEqual(self.dono_do_lease(), "worker-a")
+
+    def test_redis_fora_por_mais_que_o_ttl_para_os_slots(self):
+        self.a._rebalancear()
+        self.servidor.connected = False
+
+        self.a._rebalancear()
+        self.assertIn(self.user_id, self.a.slots)  # dentro do TTL o lease ainda vale
+
+        self.a._leases_renovados_em -= settings.BOT_RUNNER_WORKER_TIMEOUT + 1
+        self.a._rebalancear()
+        self.assertEqual(self.a.slots, {})
+
+
+class BotFalso:
+    """O que o runner usa do TradingBot, contando checagens e encerramentos."""
+
+    def __init__(self, symbol="BTCUSDT", timeframe="1m"):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.rotulos = {}
+        self.checagens = 0
+        self.encerramentos = 0
+
+    def run_single_check(self):
+        self.checagens += 1
+
+    def encerrar(self):
+        self.encerramentos += 1
+
+
+def adicionar_slot(runner, user_id, bot):
+    """Põe um slot com `bot` no runner como se o `_iniciar` tivesse terminado."""
+    redis_client.get_redis().set(CHAVE_ATIVO.format(user_id=user_id), runner.worker_id)  # sem aviso de início
+    slot = _BotSlot(user_id)
+    slot.bot = bot
+    slot.username = f"user{user_id}"
+    slot.user_profile = SimpleNamespace(telegram_bot_token="", telegram_chat_id="")
+    runner.slots[user_id] = slot
+    runner._retornos.append(("iniciado", slot))
+    runner._aplicar_retornos()
+    return slot
+
+
+class BotRunnerSlotsTests(TransactionTestCase):
+
+    def setUp(self):
+        usar_redis_falso(self)
+        self.runner = BotRunner(worker_id="worker-a", threads=1)
+        self.addCleanup(self.runner.executor.shutdown, wait=False)
+
+    def test_inicio_sem_contexto_so_solta_o_slot_na_thread_do_loop(self):
+        user = User.objects.create(username="sem_perfil")
+        BotControl.objects.create(user=user, symbol="BTCUSDT", is_running=True)
+        self.runner._rebalancear()
+        slot = self.runner.slots[user.id]
+
+        self.runner._iniciar(slot)  # roda no pool: não pode mexer em self.slots
+        self.assertIs(self.runner.slots[user.id], slot)
+
+        self.runner._aplicar_retornos()
+        self.assertNotIn(user.id, self.runner.slots)
+        self.assertIsNone(redis_client.get_redis().get(CHAVE_LEASE.format(user_id=user.id)))
+
+    def test_slot_removido_durante_o_inicio_encerra_o_bot_uma_vez(self):
+        slot = _BotSlot(1)
+        self.runner.slots[1] = slot
+        slot.bot = BotFalso()  # o pool terminou de criar o bot...
+        self.runner._remover(1, parado_pelo_usuario=False)  # ...mas o loop já tinha tirado o slot
+        self.runner._retornos.append(("iniciado", slot))
+        self.runner._aplicar_retornos()
+        self.assertEqual(slot.bot.encerramentos, 1)
+        self.assertNotIn(1, self.runner.slots)
+
+
+# ===================================================================
+# BotRunner com BOT_STREAMING_ENABLED
+# ===================================================================
+
+class BotRunnerStreamingTests(SimpleTestCase):
+
+    def iniciar(self, standin):
+        usar_redis_falso(self)
+        standin.intervalo = 0.1
+        standin.iniciar()
+        self.addCleanup(standin.parar)
+        configuracao = self.settings(BOT_STREAMING_ENABLED=True, BINANCE_WS_URL=standin.url)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        runner = BotRunner(worker_id="worker-a", threads=2)
+        self.addCleanup(runner.executor.shutdown, wait=False)
+        self.addCleanup(lambda: [stream.parar() for stream, _ in runner._streams.values()])
+        return runner
+
+    def test_fechamento_do_candle_checa_todos_os_bots_do_par(self):
+        runner = self.iniciar(KlineStandIn(candle_segundos=1.0, volatilidade=0.0))
+        bots = [BotFalso(), BotFalso()]
+        for user_id, bot in enumerate(bots, start=1):
+            adicionar_slot(runner, user_id, bot)
+        self.assertEqual(len(runner._streams), 1)  # um stream por par, não por bot
+
+        def checou_todos():
+            runner._disparar_streams()
+            return all(bot.checagens >= 1 for bot in bots)
+
+        self.assertTrue(esperar(checou_todos))
+
+    def test_timer_so_checa_com_o_stream_desconectado(self):
+        standin = KlineStandIn(candle_segundos=3600, volatilidade=0.0)
+        runner = self.iniciar(standin)
+        slot = adicionar_slot(runner, 1, BotFalso())
+        stream = runner._stream_do_slot(slot)
+        self.assertTrue(esperar(lambda: stream.conectado))
+
+        runner._disparar(1, slot.geracao)
+        time.sleep(0.2)
+        self.assertEqual(slot.bot.checagens, 0)
+
+        standin.derrubar_conexoes()
+        self.assertTrue(esperar(lambda: not stream.conectado))
+        runner._disparar(1, slot.geracao)
+        self.assertTrue(esperar(lambda: slot.bot.checagens == 1))
+
+    def test_remover_o_ultimo_bot_para_o_stream(self):
+        runner = self.iniciar(KlineStandIn(candle_segundos=3600, volatilidade=0.0))
+        slot = adicionar_slot(runner, 1, BotFalso())
+        stream = runner._stream_do_slot(slot)
+        runner._remover(1, parado_pelo_usuario=False)
+        self.assertEqual(runner._streams, {})
+        self.assertEqual(slot.bot.encerramentos, 1)
+        self.assertTrue(esperar(lambda: not stream._thread.is_alive()))
+
+
+# ===================================================================
+# Governador de peso da Binance
+# ===================================================================
+
+class RespostaFalsa:
+    """Resposta HTTP mínima que o `_handle_response` do python-binance aceita."""
+
+    def __init__(self, usado, status_code=200, retry_after=None, ao_ler=None):
+        self.status_code = status_code
+        self.headers = {"x-mbx-used-weight-1m": str(usado)}
+        if retry_after is not None:
+            self.headers["Retry-After"] = str(retry_after)
+        self.text = "{}"
+        self.ao_ler = ao_ler
+
+    def json(self):
+        if self.ao_ler:
+            self.ao_ler()
+        return {"ok": True}
+
+
+class WeightGovernorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.servidor = usar_redis_falso(self)
+        self.governador = WeightGovernor("teste", limite=100, reserva_ordens=0.1, teto_dados=0.5, espera_max=0)
+
+    def usado(self):
+        return int(redis_client.get_redis().get(
+            CHAVE_JANELA.format(ambiente="teste", minuto=int(time.time() // 60))) or 0)
+
+    def test_cada_prioridade_para_no_seu_teto(self):
+        self.assertIsNotNone(self.governador.reservar(50, "painel"))
+        with self.assertRaises(PesoEsgotado):
+            self.governador.reservar(1, "mercado")
+        self.governador.reservar(40, "conta")
+        with self.assertRaises(PesoEsgotado):
+            self.governador.reservar(1, "conta")
+        self.governador.reservar(30, "ordem")  # ordens passam até do limite
+        self.assertEqual(self.usado(), 120)
+
+    def test_ordem_nunca_espera_a_proxima_janela(self):
+        governador = WeightGovernor("teste", limite=100, reserva_ordens=0.1, teto_dados=0.5, espera_max=120)
+        governador.reservar(100, "ordem")
+        inicio = time.monotonic()
+        with prioridade_binance("ordem"):
+            self.assertEqual(prioridade_endpoint("ticker/24hr"), "ordem")
+            governador.reservar(5, prioridade_endpoint("positionRisk"))
+        self.assertLess(time.monotonic() - inicio, 0.5)
+        self.assertEqual(prioridade_endpoint("ticker/24hr"), "mercado")
+
+    def test_429_bloqueia_todas_as_prioridades(self):
+        minuto = self.governador.reservar(1, "ordem")
+        self.governador.registrar_resposta(minuto, RespostaFalsa(99, status_code=429, retry_after=30))
+        self.assertEqual(self.usado(), 99)
+        with self.assertRaises(PesoEsgotado) as erro:
+            self.governador.reservar(1, "ordem")
+        self.assertTrue(erro.exception.bloqueado)
+
+    def test_sem_redis_segue_sem_governador_e_sem_tentar_de_novo(self):
+        self.servidor.connected = False
+        self.assertIsNone(self.governador.reservar(1, "ordem"))
+        self.servidor.connected = True
+        self.assertIsNone(self.governador.reservar(1, "ordem"))  # ainda na pausa: nem tenta o Redis
+        self.assertEqual(self.usado(), 0)
+
+    def test_cliente_corrige_pelo_cabecalho_da_propria_chamada(self):
+        cliente = ClienteGovernado("chave", "segredo", testnet=True, ping=False)
+        outra = RespostaFalsa(7)
+        # Outra thread usando o mesmo cliente do pool troca `self.response` no meio da chamada.
+        propria = RespostaFalsa(42, ao_ler=lambda: setattr(cliente, "response", outra))
+        cliente.session = SimpleNamespace(get=lambda *args, **kwargs: propria, close=lambda: None)
+        registradas = []
+        governador = get_weight_governor("testnet")
+        with mock.patch.object(governador, "registrar_resposta", lambda minuto, r: registradas.append(r)):
+            cliente.futures_ticker(symbol="BTCUSDT")
+        self.assertEqual(registradas, [propria])
+
+
+# ===================================================================
+# Pool de clientes da Binance
+# ===================================================================
+
+class BinanceClientPoolTests(SimpleTestCase):
+
+    @override_settings(BINANCE_POOL_CONNECTIONS=20, BOT_RUNNER_THREADS=64)
+    def test_cada_thread_do_runner_tem_conexao_sem_esperar(self):
+        pool = BinanceClientPool()
+        # O HTTPConnectionPool do urllib3 é o que bloqueia quando todas as conexões estão em uso.
+        conexoes = pool._adapter.poolmanager.connection_from_url("https://fapi.binance.com")
+        emprestadas = [conexoes._get_conn(timeout=0.1) for _ in range(64)]
+        with self.assertRaises(EmptyPoolError):
+            conexoes._get_conn(timeout=0.1)
+        self.assertEqual(len(emprestadas), 64)
+
+    def test_runner_com_mais_threads_que_conexoes_avisa(self):
+        with mock.patch("bot.runner.get_binance_pool", return_value=SimpleNamespace(conexoes=8)), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as saida:
+            runner = BotRunner(worker_id="teste", threads=16)
+        self.addCleanup(runner.executor.shutdown)
+        self.assertIn("16 threads e só 8 conexões", saida.getvalue())
+
+
+# ===================================================================
+# Registro de filtros (exchange info)
+# ===================================================================
+
+class ClienteExchangeInfo:
+    """Cliente que só responde `futures_exchange_info`, contando as chamadas."""
+
+    def __init__(self, demora=0.0, durante=None):
+        self.chamadas = 0
+        self.demora = demora
+        self.durante = durante
+        self.mutex = threading.Lock()
+
+    def futures_exchange_info(self):
+        with self.mutex:
+            self.chamadas += 1
+        time.sleep(self.demora)
+        if self.durante:
+            self.durante()
+        return {"symbols": [{
+            "symbol": "BTCUSDT", "quantityPrecision": 3,
+            "filters": [
+                {"filterType": "LOT_SIZE", "stepSize": "0.001", "minQty": "0.001"},
+                {"filterType": "MIN_NOTIONAL", "notional": "5"},
+            ],
+        }]}
+
+
+class SymbolRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.servidor = usar_redis_falso(self)
+        self.redis = redis_client.get_redis()
+
+    def test_threads_do_processo_fazem_uma_carga_so(self):
+        self.servidor.connected = False  # sem o lock do Redis, só a guarda do processo segura
+        registro = SymbolRegistry("teste", ttl=600)
+        cliente = ClienteExchangeInfo(demora=0.2)
+        resultados = []
+        threads = [
+            threading.Thread(target=lambda: resultados.append(registro.obter("BTCUSDT", cliente)))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(cliente.chamadas, 1)
+        self.assertEqual([f.step_size for f in resultados], ["0.001"] * 8)
+
+    def test_outro_processo_le_do_redis(self):
+        SymbolRegistry("teste", ttl=600).obter("BTCUSDT", ClienteExchangeInfo())
+        cliente = ClienteExchangeInfo()
+        filtros = SymbolRegistry("teste", ttl=600).obter("BTCUSDT", cliente)
+        self.assertEqual(cliente.chamadas, 0)
+        self.assertEqual(filtros.min_notional, "5")
+
+    def test_lock_de_outro_worker_nao_e_apagado(self):
+        chave = CHAVE_LOCK_EXINFO.format(ambiente="teste")
+        # O download passou do LOCK_TIMEOUT: o lock venceu e outro worker o pegou.
+        cliente = ClienteExchangeInfo(durante=lambda: self.redis.set(chave, "outro"))
+        SymbolRegistry("teste", ttl=600).obter("BTCUSDT", cliente)
+        self.assertEqual(self.redis.get(chave), b"outro")
+
+    def test_lock_proprio_e_liberado(self):
+        SymbolRegistry("teste", ttl=600).obter("BTCUSDT", ClienteExchangeInfo())
+        self.assertIsNone(self.redis.get(CHAVE_LOCK_EXINFO.format(ambiente="teste")))
+
+
+# ===================================================================
+# Métricas
+# ===================================================================
+
+class MetricsRegistryTests(SimpleTestCase):
+
+    def test_remover_series_apaga_so_o_bot_parado(self):
+        usar_redis_falso(self)
+        metricas = MetricsRegistry(intervalo_envio=3600)
+        metricas.observar("bot_cycle_seconds", 0.2, bot="7")
+        metricas.observar("bot_cycle_seconds", 0.2, bot="71")
+        metricas.incrementar("bot_cycle_overruns_total", bot="7")
+        metricas.definir("fila", 3)
+        metricas.enviar()
+        metricas.incrementar("bot_cycle_overruns_total", bot="7")  # ainda não enviado
+
+        metricas.remover_series(bot="7")
+        metricas.enviar()
+
+        r = redis_client.get_redis()
+        campos = [c.decode() for c in r.hkeys(CHAVE_VALORES)]
+        self.assertFalse([c for c in campos if 'bot="7"' in c])
+        self.assertIn('bot_cycle_seconds_count{bot="71"}', campos)
+        self.assertIn(b"fila", r.hkeys(CHAVE_GAUGES))
+
+
+# ===================================================================
+# Dispatcher de notificações do Telegram
+# ===================================================================
+
+class NotificationDispatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        # Sem Redis o exportar() mostra só este registro, sem o que o registro global enviou.
+        usar_redis_falso(self).connected = False
+        self.metricas = MetricsRegistry(intervalo_envio=3600)
+        patcher = mock.patch("bot.telegram.get_metrics", return_value=self.metricas)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.envios = []
+        self.respostas = []  # (ok, retry_after, permanente, erro) devolvidas em ordem; depois, ok
+
+    def post_falso(self, mensagem, token, chat_id, timeout=10, markdown=True):
+        self.envios.append((chat_id, mensagem, markdown))
+        return self.respostas.pop(0) if self.respostas else (True, None, False, None)
+
+    def dispatcher(self, **kwargs):
+        patcher = mock.patch("bot.telegram._post_telegram", side_effect=self.post_falso)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return NotificationDispatcher(tamanho_fila=100, taxa_global=100, **kwargs)
+
+    def test_exporta_latencia_de_entrega_e_contadores(self):
+        dispatcher = self.dispatcher(intervalo_chat=0.2)
+        for i in range(3):
+            dispatcher.enfileirar(f"msg {i}", "tok", "1")
+        self.assertTrue(dispatcher.esvaziar())
+
+        texto = self.metricas.exportar()
+        self.assertIn("telegram_delivery_seconds_count 3", texto)
+        self.assertIn('telegram_notifications_total{resultado="enfileiradas"} 3', texto)
+        self.assertIn('telegram_notifications_total{resultado="entregues"} 3', texto)
+        self.assertIn("# TYPE telegram_queue_size gauge", texto)
+        self.assertEqual(dispatcher.metricas()["entregues"], 3)
+
+    def test_400_de_markdown_reenvia_como_texto_puro(self):
+        dispatcher = self.dispatcher(intervalo_chat=0)
+        self.respostas = [(False, None, True, '{"ok":false,"error_code":400,"description":"Bad Request: can\'t parse entities"}')]
+        dispatcher.enfileirar("*quebrado", "tok", "1")
+        self.assertTrue(dispatcher.esvaziar())
+        self.assertEqual([markdown for _, _, markdown in self.envios], [True, False])
+        self.assertEqual(dispatcher.metricas()["entregues"], 1)
+
+    def test_4xx_nao_e_repetido(self):
+        dispatcher = self.dispatcher(intervalo_chat=0)
+        self.respostas = [(False, None, True, '{"ok":false,"error_code":403,"description":"Forbidden"}')]
+        dispatcher.enfileirar("oi", "tok", "1")
+        self.assertTrue(dispatcher.esvaziar())
+        self.assertEqual(len(self.envios), 1)
+        self.assertEqual(dispatcher.metricas()["falhas"], 1)
+        self.assertIn('telegram_notifications_total{resultado="falhas"} 1', self.metricas.exportar())
+
+    def test_falha_temporaria_e_repetida(self):
+        dispatcher = self.dispatcher(intervalo_chat=0)
+        dispatcher.BACKOFF_INICIAL = 0.05
+        self.respostas = [(False, None, False, "Erro de conexão"), (False, 0.05, False, "429")]
+        dispatcher.enfileirar("oi", "tok", "1")
+        self.assertTrue(dispatcher.esvaziar())
+        self.assertEqual(len(self.envios), 3)
+        self.assertEqual(dispatcher.metricas()["entregues"], 1)
+
+    def test_chats_liberados_sao_esquecidos(self):
+        dispatcher = self.dispatcher(intervalo_chat=0.05)
+        dispatcher.INTERVALO_LIMPEZA = 0.1
+        for chat in range(20):
+            dispatcher.enfileirar("oi", "tok", str(chat))
+        self.assertTrue(dispatcher.esvaziar())
+        self.assertTrue(esperar(lambda: not dispatcher._liberado_em))
+
+    def test_texto_longo_e_cortado_numa_quebra_de_linha(self):
+        dispatcher = self.dispatcher()
+        linhas = [f"*linha {i}* `{'x' * 40}`" for i in range(200)]
+        texto = dispatcher._montar_texto([("\n".join(linhas), 0.0)])
+        self.assertLessEqual(len(texto), dispatcher.LIMITE_TEXTO)
+        self.assertTrue(texto[:-1] in "\n".join(linhas) and texto.endswith("…"))
+        self.assertEqual(texto[:-1].count("*") % 2, 0)
+        self.assertEqual(texto[:-1].count("`") % 2, 0)
+
+
+# ===================================================================
+# Histórico de candles em disco (ohlcv_store)
+# ===================================================================
+
+def klines_1m(inicio, quantidade):
+    """Klines de 1m a partir do minuto `inicio`, com fechamento igual ao índice do minuto."""
+    return [[(inicio + i) * 60_000, "1", "2", "0.5", str(inicio + i), "10"] for i in range(quantidade)]
+
+
+class OhlcvStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        raiz = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, raiz, ignore_errors=True)
+        self.store = OhlcvStore(raiz)
+        self.serie = self.store.serie("btcusdt", "1m")
+
+    def test_grava_so_candles_fechados_e_novos(self):
+        agora_ms = 110 * 60_000 + 1  # o candle do minuto 110 ainda está em formação
+        self.assertEqual(self.store.acrescentar_klines("BTCUSDT", "1m", klines_1m(100, 11), agora_ms), 10)
+        self.assertEqual(self.store.acrescentar_klines("BTCUSDT", "1m", klines_1m(105, 10), 120 * 60_000), 5)
+        self.assertEqual(len(self.serie), 15)
+        self.assertEqual(self.serie.ultimo_open_time(), 114 * 60_000)
+        self.assertEqual(self.serie.ler(ultimos=3)["close"].tolist(), [112.0, 113.0, 114.0])
+        self.assertEqual(self.serie.ler(inicio_ms=102 * 60_000, fim_ms=104 * 60_000)["close"].tolist(),
+                         [102.0, 103.0, 104.0])
+
+    def test_leitura_e_somente_leitura_e_acompanha_o_crescimento(self):
+        self.serie.acrescentar(colunas_de_klines(klines_1m(0, 5)))
+        antes = self.serie.ler()
+        self.assertFalse(antes["close"].flags.writeable)
+        self.serie.acrescentar(colunas_de_klines(klines_1m(5, 5)))
+        self.assertEqual(len(antes["close"]), 5)
+        self.assertEqual(self.serie.ler()["close"].tolist(), [float(i) for i in range(10)])
+
+    def test_gravacao_interrompida_e_reparada_na_proxima(self):
+        self.serie.acrescentar(colunas_de_klines(klines_1m(0, 5)))
+        # O processo morreu depois de gravar algumas colunas, antes do open_time.
+        for nome in ("open", "close"):
+            with open(os.path.join(self.serie.diretorio, f"{nome}.bin"), "ab") as arquivo:
+                arquivo.write(np.array([99.0, 99.0]).tobytes())
+        self.assertEqual(len(self.serie), 5)
+
+        self.assertEqual(self.serie.acrescentar(colunas_de_klines(klines_1m(5, 2))), 2)
+        dados = self.serie.ler()
+        self.assertEqual(dados["close"].tolist(), [float(i) for i in range(7)])
+        self.assertEqual(dados["open_time"].tolist(), [i * 60_000 for i in range(7)])
+
+    def test_open_time_fora_de_ordem_nao_e_gravado(self):
+        with self.assertRaises(ValueError):
+            self.serie.acrescentar(colunas_de_klines(klines_1m(0, 2) + klines_1m(1, 1)))
+        self.assertEqual(len(self.serie), 0)
+
+    def test_fonte_store(self):
+        self.assertEqual(fonte_store("BTCUSDT:1m"), ("BTCUSDT", "1m"))
+        self.assertIsNone(fonte_store("BTCUSDT-1m-2024.csv"))
+        with self.assertRaises(ValueError):
+            self.store.serie("BTCUSDT", "1M")
+
+
+# ===================================================================
+# Gravação e arquivamento de trades
+# ===================================================================
+
+class TradeStoreTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="trades")
+
+    def fechado_ha(self, meses, pnl=1.0):
+        """Trade fechado no dia 15 de `meses` meses atrás."""
+        hoje = timezone.now().date()
+        ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - meses, 12)
+        saida = datetime(ano, mes + 1, 15, 12, tzinfo=dt_timezone.utc)
+        return Trade.objects.create(user=self.user, symbol="BTCUSDT", side="long", entry_price=100.0,
+                                    quantity=1.0, exit_price=101.0, pnl=pnl, is_open=False, exit_timestamp=saida)
+
+    def test_arquiva_por_mes_so_os_fechados_antigos(self):
+        antigos = [self.fechado_ha(3), self.fechado_ha(3), self.fechado_ha(2)]
+        recentes = [self.fechado_ha(1), self.fechado_ha(0)]
+        aberto = Trade.objects.create(user=self.user, symbol="BTCUSDT", side="long", entry_price=100.0, quantity=1.0)
+
+        movidos = arquivar_trades(meses_mantidos=1, tamanho_lote=1)
+
+        self.assertEqual(sorted(movidos.values()), [1, 2])
+        self.assertEqual(set(Trade.objects.values_list("id", flat=True)), {t.id for t in recentes} | {aberto.id})
+        arquivados = {a.trade_id: a for a in TradeArchive.objects.all()}
+        self.assertEqual(set(arquivados), {t.id for t in antigos})
+        for trade in antigos:
+            self.assertEqual(arquivados[trade.id].mes, trade.exit_timestamp.date().replace(day=1))
+        self.assertEqual(arquivar_trades(meses_mantidos=1), {})
+
+    def test_comando_informa_o_que_foi_arquivado(self):
+        self.fechado_ha(4)
+        saida = io.StringIO()
+        call_command("archive_trades", "--meses", "2", stdout=saida)
+        self.assertIn("1 trade(s) arquivado(s)", saida.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("archive_trades", "--meses", "-1")
+
+    def test_lote_grava_aberturas_e_fechamentos_juntos(self):
+        aberto = Trade.objects.create(user=self.user, symbol="BTCUSDT", side="short", entry_price=100.0, quantity=2.0)
+        with TradeBatch() as lote:
+            lote.fechar(aberto, 90.0, leverage=5)
+            lote.abrir(self.user, "BTCUSDT", "long", 90.0, 2.0)
+            self.assertEqual(Trade.objects.filter(is_open=True).count(), 1)  # nada gravado ainda
+
+        aberto.refresh_from_db()
+        self.assertFalse(aberto.is_open)
+        self.assertEqual(aberto.pnl, 20.0)
+        self.assertEqual(aberto.pnl_percent, 50.0)
+        self.assertEqual(buscar_trade_aberto(self.user, "BTCUSDT").side, "long")
+
+
+# ===================================================================
+# Backtest e otimizador
+# ===================================================================
+
+def serie_queda_e_alta():
+    """Queda curta e alta até o fim: um long abre no fundo e nunca é fechado pela estratégia."""
+    return np.concatenate([np.linspace(100, 90, 30), np.linspace(90, 200, 300)])
+
+
+class BacktestOtimizadorTests(SimpleTestCase):
+
+    def test_fechamento_no_fim_da_serie_e_marcado(self):
+        resultado = executar_backtest(serie_queda_e_alta(), 3, 6)
+        self.assertEqual(resultado["trades"], 1)
+        self.assertTrue(resultado["lista_trades"][-1]["forcado"])
+
+    def test_fora_da_amostra_ignora_fechamentos_forcados(self):
+        closes = serie_queda_e_alta()
+        with SeriesCompartilhadas() as compartilhadas:
+            compartilhadas.adicionar("BTCUSDT", "1m", closes)
+            _inicializar_worker(compartilhadas.descritores)
+            try:
+                resultado = avaliar_combinacao("BTCUSDT", "1m", 3, 6, 5, 2, 0.7, {})
+            finally:
+                _fechar_anexados()
+        self.assertGreater(resultado["pnl_total"], 0)
+        self.assertEqual(resultado["pnl_fora_amostra"], 0)
+
+    def test_janelas_de_teste_nao_se_sobrepoem(self):
+        janelas = janelas_walk_forward(1000, 4, 0.7)
+        self.assertEqual(janelas[-1][2], 1000)
+        for (_, _, fim), (_, inicio_teste, _) in zip(janelas, janelas[1:]):
+            self.assertEqual(fim, inicio_teste)
+
+    def test_otimizar_avalia_cada_combinacao_em_cada_simbolo(self):
+        closes = 100 + np.cumsum(np.random.default_rng(1).normal(0, 1, 2000))
+        open_times = np.arange(len(closes), dtype=np.int64) * 60_000
+        combinacoes = gerar_combinacoes([3, 5], [10, 20], ["5m"], [5])
+        resultados = list(otimizar(
+            {"BTCUSDT": (open_times, closes), "ETHUSDT": (open_times, closes[::-1].copy())},
+            combinacoes, dobras=2, workers=2,
+        ))
+        self.assertEqual(len(resultados), 8)
+        self.assertEqual({r["symbol"] for r in resultados}, {"BTCUSDT", "ETHUSDT"})
+        self.assertTrue(all(r["pnl_fora_amostra"] is not None for r in resultados))
+
+    def test_optimize_recusa_dois_arquivos_do_mesmo_simbolo(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        caminhos = []
+        for nome in ("BTCUSDT-1m-2023.csv", "BTCUSDT-1m-2024.csv"):
+            caminho = os.path.join(pasta, nome)
+            with open(caminho, "w") as arquivo:
+                arquivo.write("0,1,1,1,1,1\n60000,1,1,1,1,1\n")
+            caminhos.append(caminho)
+        with self.assertRaisesMessage(CommandError, "mesmo símbolo"):
+            call_command("optimize", *caminhos, stdout=io.StringIO())
+
+
+# ===================================================================
+# Ledger de fills
+# ===================================================================
+
+class ClienteFills:
+    """userTrades da Binance: por tempo (startTime/endTime, sem símbolo) ou por fromId com símbolo."""
+
+    def __init__(self, fills):
+        self.fills = sorted(fills, key=lambda t: (t["time"], t["id"]))
+
+    def futures_account_trades(self, startTime=None, endTime=None, symbol=None, fromId=None, limit=500):
+        if fromId is not None:
+            selecionados = sorted((t for t in self.fills if t["symbol"] == symbol and t["id"] >= fromId),
+                                  key=lambda t: t["id"])
+        else:
+            selecionados = [t for t in self.fills if startTime <= t["time"] <= endTime]
+        return [dict(t) for t in selecionados[:limit]]
+
+
+def fill_binance(trade_id, instante_ms, pnl=1.0, symbol="BTCUSDT"):
+    return {
+        "id": trade_id, "orderId": trade_id, "symbol": symbol, "side": "SELL", "price": "100", "qty": "0.01",
+        "realizedPnl": str(pnl), "commission": "0.01", "commissionAsset": "USDT", "time": instante_ms,
+    }
+
+
+class LedgerTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="ledger")
+        self.agora_ms = int(time.time() * 1000) - 60_000
+        patcher = mock.patch("bot.ledger.LIMITE_POR_PAGINA", 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pagina_cheia_nao_perde_fills_do_mesmo_ms(self):
+        # O fim da primeira página divide o ms com fills que só cabem na seguinte.
+        fills = [fill_binance(i, self.agora_ms - 1000 + i) for i in range(8)]
+        fills += [fill_binance(100 + i, self.agora_ms - 500) for i in range(5)]
+        fills += [fill_binance(200 + i, self.agora_ms - 100 + i) for i in range(4)]
+        self.assertEqual(sincronizar_fills(self.user.id, ClienteFills(fills)), len(fills))
+        self.assertEqual(AccountFill.objects.filter(user=self.user).count(), len(fills))
+
+    def test_pagina_inteira_no_mesmo_ms_segue_por_from_id(self):
+        fills = [fill_binance(i, self.agora_ms - 500, symbol="BTCUSDT") for i in range(15)]
+        fills += [fill_binance(i, self.agora_ms - 500, symbol="ETHUSDT") for i in range(7)]
+        fills += [fill_binance(50, self.agora_ms - 100)]
+        sincronizar_fills(self.user.id, ClienteFills(fills))
+        self.assertEqual(AccountFill.objects.filter(user=self.user).count(), len(fills))
+
+    def test_indicadores_usam_janela_movel_de_7x24h(self):
+        agora = self.agora_ms
+        hora = 3_600_000
+        fills = [
+            fill_binance(1, agora - 7 * 24 * hora - hora, pnl=100.0),   # fora da janela
+            fill_binance(2, agora - 7 * 24 * hora + hora, pnl=-2.0),
+            fill_binance(3, agora - 24 * hora, pnl=5.0),
+            fill_binance(4, agora - hora, pnl=1.0),
+        ]
+        sincronizar_fills(self.user.id, ClienteFills(fills))
+
+        kpis, perf = indicadores_periodo(self.user.id, dias=7)
+        self.assertEqual(kpis["total_trades"], 3)
+        self.assertEqual(kpis["total_pnl"], 4.0)
+        self.assertEqual(kpis["win_rate"], round(2 / 3 * 100, 2))
+        self.assertEqual(perf["equity_curve_data"], [-2.0, 3.0, 4.0])
+        self.assertEqual(len(perf["equity_curve_labels"]), 3)
+
+    def test_curva_parte_do_pnl_dos_trades_que_nao_aparecem(self):
+        fills = [fill_binance(i, self.agora_ms - 10_000 + i, pnl=1.0) for i in range(5)]
+        sincronizar_fills(self.user.id, ClienteFills(fills))
+        _, perf = indicadores_periodo(self.user.id, dias=7, ultimos_trades=2)
+        self.assertEqual(perf["equity_curve_data"], [4.0, 5.0])
+
+
+# ===================================================================
+# Cache de snapshots da conta (dashboard)
+# ===================================================================
+
+class ClienteConta:
+    """Saldos e posições; com `barreira`, as duas chamadas só voltam se estiverem em paralelo."""
+
+    def __init__(self, barreira=None):
+        self.barreira = barreira
+        self.chamadas = []
+        self.saldo = "10.0"
+
+    def _chamar(self, nome):
+        self.chamadas.append(nome)
+        if self.barreira is not None:
+            self.barreira.wait(timeout=2)
+
+    def futures_account_balance(self):
+        self._chamar("saldos")
+        return [{"asset": "USDT", "balance": self.saldo}, {"asset": "BNB", "balance": "0.0"}]
+
+    def futures_account(self):
+        self._chamar("posicoes")
+        return {"positions": [
+            {"symbol": "BTCUSDT", "positionAmt": "0.01", "entryPrice": "100", "unrealizedProfit": "1", "leverage": "5"},
+            {"symbol": "ETHUSDT", "positionAmt": "0", "entryPrice": "0", "unrealizedProfit": "0", "leverage": "5"},
+        ]}
+
+
+class AccountSnapshotCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        usar_redis_falso(self)
+        self.cliente = ClienteConta()
+        for alvo, valor in (("get_client", lambda *args, **kwargs: self.cliente),
+                            ("sincronizar_fills", lambda user_id, client: 2)):
+            patcher = mock.patch(f"bot.account_cache.{alvo}", valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cache = AccountSnapshotCache(ttls={"fills": 60, "saldos": 60, "posicoes": 60}, max_stale=600)
+        self.addCleanup(self.cache._executor.shutdown)
+
+    def test_sem_cache_busca_tudo_em_paralelo_e_guarda_so_o_que_o_painel_usa(self):
+        self.cliente.barreira = threading.Barrier(2)
+        snapshot = self.cache.obter(1, "k", "s")
+        self.assertEqual(snapshot.fills, {"novos": 2})
+        self.assertEqual(snapshot.saldos, [{"asset": "USDT", "balance": "10.0"}])
+        self.assertEqual(snapshot.posicoes, [
+            {"symbol": "BTCUSDT", "positionAmt": "0.01", "entryPrice": "100", "unrealizedProfit": "1"},
+        ])
+
+    def test_dentro_do_ttl_nao_chama_a_binance(self):
+        self.cache.obter(1, "k", "s")
+        self.cache.obter(1, "k", "s")
+        self.assertEqual(sorted(self.cliente.chamadas), ["posicoes", "saldos"])
+
+    def test_vencido_serve_o_anterior_e_atualiza_em_segundo_plano(self):
+        self.cache.obter(1, "k", "s")
+        self.cache.ttls["saldos"] = 0
+        self.cliente.saldo = "20.0"
+        anterior = self.cache.obter(1, "k", "s")
+        self.assertEqual(anterior.saldos[0]["balance"], "10.0")
+        self.assertTrue(esperar(lambda: self.cache.obter(1, "k", "s").saldos[0]["balance"] == "20.0"))
+        self.assertNotIn("posicoes", self.cliente.chamadas[2:])
+
+    def test_invalidar_faz_a_proxima_leitura_buscar(self):
+        self.cache.obter(1, "k", "s")
+        self.cache.invalidar(1, tipos=("saldos",))
+        self.cliente.saldo = "30.0"
+        self.assertEqual(self.cache.obter(1, "k", "s").saldos[0]["balance"], "30.0")
+        self.assertEqual(self.cliente.chamadas.count("posicoes"), 1)
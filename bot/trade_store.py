@@ -0,0 +1,196 @@
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Trade, TradeArchive
+
+# ===================================================================
+# Gravação dos trades do bot (tabela Trade) e arquivamento mensal
+# ===================================================================
+
+
+def buscar_trade_aberto(user, symbol):
+    """Trade aberto mais recente do usuário no símbolo (coberto pelos índices de Trade)."""
+    return Trade.objects.filter(user=user, symbol=symbol, is_open=True).order_by("-entry_timestamp").first()
+
+
+def novo_trade(user, symbol, side, entry_price, quantity):
+    """Monta (sem salvar) um Trade aberto."""
+    return Trade(user=user, symbol=symbol, side=side, entry_price=entry_price, quantity=quantity)
+
+
+def preencher_fechamento(trade, exit_price, leverage):
+    """
+    Calcula PnL e marca o trade como fechado, sem salvar.
+
+    Args:
+        trade (Trade): Trade aberto.
+        exit_price (float): Preço de saída.
+        leverage (int): Alavancagem da posição, para o PnL percentual sobre a margem.
+    """
+    pnl_usdt = (exit_price - trade.entry_price) * trade.quantity
+    if trade.side == "short":
+        pnl_usdt = -pnl_usdt
+    margem_inicial = (trade.entry_price * trade.quantity) / leverage
+    trade.exit_price = exit_price
+    trade.exit_timestamp = timezone.now()
+    trade.pnl = pnl_usdt
+    trade.pnl_percent = (pnl_usdt / margem_inicial) * 100 if margem_inicial > 0 else 0
+    trade.is_open = False
+    return trade
+
+
+CAMPOS_FECHAMENTO = ["exit_price", "exit_timestamp", "pnl", "pnl_percent", "is_open"]
+
+
+def registrar_abertura(user, symbol, side, entry_price, quantity):
+    trade = novo_trade(user, symbol, side, entry_price, quantity)
+    trade.save()
+    return trade
+
+
+def registrar_fechamento(trade, exit_price, leverage):
+    preencher_fechamento(trade, exit_price, leverage)
+    trade.save(update_fields=CAMPOS_FECHAMENTO)
+    return trade
+
+
+class TradeBatch:
+    """
+    Acumula aberturas e fechamentos e grava tudo numa única transação.
+
+    Para operações sobre a frota inteira (encerrar todos os bots, simulações, cargas
+    de teste), onde um autocommit por trade domina o custo:
+
+        with TradeBatch() as lote:
+            lote.fechar(trade, preco, leverage)
+            lote.abrir(user, symbol, "long", preco, qtd)
+    """
+
+    def __init__(self, tamanho_lote=500):
+        self.tamanho_lote = tamanho_lote
+        self._novos = []
+        self._fechados = []
+
+    def abrir(self, user, symbol, side, entry_price, quantity):
+        trade = novo_trade(user, symbol, side, entry_price, quantity)
+        self._novos.append(trade)
+        return trade
+
+    def fechar(self, trade, exit_price, leverage):
+        self._fechados.append(preencher_fechamento(trade, exit_price, leverage))
+        return trade
+
+    def gravar(self):
+        """Grava o que foi acumulado. Returns: (abertos, fechados)."""
+        novos, fechados = self._novos, self._fechados
+        self._novos, self._fechados = [], []
+        with transaction.atomic():
+            if novos:
+                Trade.objects.bulk_create(novos, batch_size=self.tamanho_lote)
+            if fechados:
+                Trade.objects.bulk_update(fechados, CAMPOS_FECHAMENTO, batch_size=self.tamanho_lote)
+        return len(novos), len(fechados)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        if tipo is None:
+            self.gravar()
+
+
+def _inicio_do_mes(dia):
+    return date(dia.year, dia.month, 1)
+
+
+def _proximo_mes(dia):
+    return date(dia.year + dia.month // 12, dia.month % 12 + 1, 1)
+
+
+def _meia_noite(dia):
+    return datetime.combine(dia, time.min, tzinfo=dt_timezone.utc)
+
+
+def arquivar_trades(meses_mantidos=3, tamanho_lote=5000):
+    """
+    Move para TradeArchive os trades fechados antes dos últimos `meses_mantidos` meses.
+
+    Cada mês vai numa transação própria. No PostgreSQL o mês inteiro é movido num
+    único comando (DELETE ... RETURNING dentro de um INSERT ... SELECT); nos outros
+    bancos (SQLite local) a cópia é feita pelo ORM em lotes.
+
+    Returns:
+        dict: {"AAAA-MM": quantidade movida}
+    """
+    hoje = timezone.now().date()
+    limite = _inicio_do_mes(hoje)
+    for _ in range(meses_mantidos):
+        limite = _inicio_do_mes(date.fromordinal(limite.toordinal() - 1))
+
+    primeiro = (
+        Trade.objects.filter(is_open=False, exit_timestamp__lt=_meia_noite(limite))
+        .aggregate(m=Min("exit_timestamp"))["m"]
+    )
+    movidos = {}
+    if primeiro is None:
+        return movidos
+
+    mes = _inicio_do_mes(primeiro.date())
+    while mes < limite:
+        fim = _proximo_mes(mes)
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                quantidade = _mover_mes_postgres(mes, fim)
+            else:
+                quantidade = _mover_mes_orm(mes, fim, tamanho_lote)
+        if quantidade:
+            movidos[f"{mes:%Y-%m}"] = quantidade
+        mes = fim
+    return movidos
+
+
+def _mover_mes_postgres(mes, fim):
+    trade, arquivo = Trade._meta.db_table, TradeArchive._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH movidos AS (
+                DELETE FROM {trade}
+                WHERE is_open = false AND exit_timestamp >= %s AND exit_timestamp < %s
+                RETURNING *
+            )
+            INSERT INTO {arquivo} (trade_id, user_id, symbol, side, entry_price, exit_price, quantity,
+                                   pnl, pnl_percent, entry_timestamp, exit_timestamp, mes)
+            SELECT id, user_id, symbol, side, entry_price, exit_price, quantity,
+                   pnl, pnl_percent, entry_timestamp, exit_timestamp, %s
+            FROM movidos
+            """,
+            [_meia_noite(mes), _meia_noite(fim), mes],
+        )
+        return cursor.rowcount
+
+
+def _mover_mes_orm(mes, fim, tamanho_lote):
+    total = 0
+    while True:
+        lote = list(
+            Trade.objects.filter(
+                is_open=False, exit_timestamp__gte=_meia_noite(mes), exit_timestamp__lt=_meia_noite(fim)
+            )[:tamanho_lote]
+        )
+        if not lote:
+            return total
+        TradeArchive.objects.bulk_create([
+            TradeArchive(
+                trade_id=t.id, user_id=t.user_id, symbol=t.symbol, side=t.side,
+                entry_price=t.entry_price, exit_price=t.exit_price, quantity=t.quantity,
+                pnl=t.pnl, pnl_percent=t.pnl_percent, entry_timestamp=t.entry_timestamp,
+                exit_timestamp=t.exit_timestamp, mes=mes,
+            )
+            for t in lote
+        ])
+        Trade.objects.filter(id__in=[t.id for t in lote]).delete()
+        total += len(lote)
@@ -5,5 +5,6 @@ from .views import create_superuser_temp_view
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('metrics/', views.metrics_view, name='metrics'),
     path('setup/criar-super-usuario-agora-92i374y5h/', create_superuser_temp_view, name='create_superuser_temp'),
 ]
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import threading
+import time
+
+import aiohttp
+from binance.exceptions import BinanceAPIException
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+# Espelho do livro no Redis, para outros processos (dashboard, admin) enxergarem a conta.
+CHAVE_POSICOES = "conta:{user_id}:livro:posicoes"
+CHAVE_ORDENS = "conta:{user_id}:livro:ordens"
+URL_TESTNET = "wss://stream.binancefuture.com"
+STATUS_FINAIS = {"FILLED", "CANCELED", "EXPIRED", "REJECTED", "EXPIRED_IN_MATCH"}
+
+
+class UserDataStream:
+    """
+    Livro de posições e ordens de uma conta mantido pelo user data stream de futuros.
+
+    Roda numa thread própria com event loop (como o KlineStream): pede o listenKey,
+    renova a cada USER_STREAM_KEEPALIVE_SECONDS e troca de chave quando ela expira.
+    Cada (re)conexão e a cada USER_STREAM_RECONCILE_SECONDS o livro é conferido
+    pelo REST, cobrindo eventos perdidos enquanto o socket estava fora.
+
+    `posicao()` só responde quando o livro é confiável (conectado, ou reconciliado há
+    pouco); fora isso devolve None e o chamador deve consultar o REST.
+    """
+    RECONEXAO_MIN = 1    # segundos
+    RECONEXAO_MAX = 60   # segundos
+    HEARTBEAT = 30       # segundos entre pings do aiohttp
+
+    def __init__(self, user_id, client, url_base=None, keepalive=None, reconciliar=None):
+        self.user_id = user_id
+        self.client = client
+        url_padrao = settings.BINANCE_USER_WS_URL or (
+            URL_TESTNET if getattr(client, "testnet", False) else settings.BINANCE_WS_URL
+        )
+        self.url_base = (url_base or url_padrao).rstrip("/")
+        self.keepalive = keepalive or settings.USER_STREAM_KEEPALIVE_SECONDS
+        self.reconciliar = reconciliar or settings.USER_STREAM_RECONCILE_SECONDS
+        self.posicoes = {}   # symbol -> {"amt": float, "entrada": float}
+        self.ordens = {}     # orderId -> ordem aberta (campos do ORDER_TRADE_UPDATE)
+        self.conectado = False
+        self.reconciliado_em = None  # time.monotonic() da última conferência pelo REST
+        self.listen_key = None
+        self._mutex = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._ws = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._rodar, name=f"user-stream-{self.user_id}", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._loop is not None and self._ws is not None:
+            asyncio.run_coroutine_threadsafe(self._ws.close(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def posicao(self, symbol):
+        """
+        Posição do símbolo segundo o livro.
+
+        Returns:
+            dict | None: {"amt", "entrada"} (amt 0 = sem posição), ou None se o livro
+            não é confiável agora.
+        """
+        if not self.confiavel:
+            return None
+        with self._mutex:
+            return dict(self.posicoes.get(symbol, {"amt": 0.0, "entrada": 0.0}))
+
+    @property
+    def confiavel(self):
+        if self.reconciliado_em is None:
+            return False
+        # Desconectado, o livro ainda vale até a próxima reconciliação que deveria ter havido.
+        return self.conectado or time.monotonic() - self.reconciliado_em < self.reconciliar
+
+    # --- Internos ---
+
+    def _rodar(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._conectar_sempre())
+        finally:
+            self._loop.close()
+
+    async def _rest(self, funcao, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, funcao, *args)
+
+    async def _conectar_sempre(self):
+        espera = self.RECONEXAO_MIN
+        async with aiohttp.ClientSession() as session:
+            while not self._parar.is_set():
+                tarefas = []
+                try:
+                    self.listen_key = await self._rest(self.client.futures_stream_get_listen_key)
+                    async with session.ws_connect(f"{self.url_base}/ws/{self.listen_key}", heartbeat=self.HEARTBEAT) as ws:
+                        self._ws = ws
+                        # Conecta antes de reconciliar: o que mudar no meio chega pelo socket.
+                        await self._rest(self._reconciliar)
+                        self.conectado = True
+                        espera = self.RECONEXAO_MIN
+                        print(f"[UserStream {self.user_id}] Conectado em {self.url_base}.")
+                        tarefas = [
+                            asyncio.create_task(self._manter_listen_key(ws)),
+                            asyncio.create_task(self._reconciliar_periodicamente()),
+                        ]
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                try:
+                                    continuar = self._processar(json.loads(msg.data))
+                                except (ValueError, KeyError, TypeError) as e:
+                                    # Um evento fora do formato não derruba a conexão; o que ele
+                                    # traria vem da conferência pelo REST.
+                                    print(f"[UserStream {self.user_id}] Evento ignorado ({type(e).__name__}: {e}).")
+                                    await self._rest(self._reconciliar)
+                                    continue
+                                if not continuar:
+                                    break
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, BinanceAPIException) as e:
+                    print(f"[UserStream {self.user_id}] Erro no stream: {e}")
+                except Exception as e:
+                    # Sem isso a thread morreria calada e os bots ficariam no REST para sempre.
+                    print(f"[UserStream {self.user_id}] Erro inesperado no stream ({type(e).__name__}: {e}); reconectando.")
+                finally:
+                    for tarefa in tarefas:
+                        tarefa.cancel()
+                    self._ws = None
+                    if self.conectado:
+                        print(f"[UserStream {self.user_id}] Desconectado. Posições voltam a vir do REST.")
+                    self.conectado = False
+
+                if not self._parar.is_set():
+                    await asyncio.sleep(espera)
+                    espera = min(espera * 2, self.RECONEXAO_MAX)
+
+            if self.listen_key:
+                try:
+                    await self._rest(self.client.futures_stream_close, self.listen_key)
+                except Exception:
+                    pass
+
+    async def _manter_listen_key(self, ws):
+        while True:
+            await asyncio.sleep(self.keepalive)
+            try:
+                await self._rest(self.client.futures_stream_keepalive, self.listen_key)
+            except BinanceAPIException as e:
+                # -1125: a chave já expirou. Fechar o socket faz o loop pedir outra.
+                print(f"[UserStream {self.user_id}] Keepalive recusado ({e.code}); renovando o listenKey.")
+                await ws.close()
+                return
+            except Exception as e:
+                print(f"[UserStream {self.user_id}] Erro no keepalive: {e}")
+
+    async def _reconciliar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.reconciliar)
+            try:
+                await self._rest(self._reconciliar)
+            except Exception as e:
+                print(f"[UserStream {self.user_id}] Erro na reconciliação: {e}")
+
+    def _reconciliar(self):
+        posicoes = {
+            p["symbol"]: {"amt": float(p["positionAmt"]), "entrada": float(p["entryPrice"])}
+            for p in self.client.futures_position_information()
+            if p.get("positionSide", "BOTH") == "BOTH"
+        }
+        ordens = {str(o["orderId"]): o for o in self.client.futures_get_open_orders()}
+        with self._mutex:
+            divergentes = [
+                s for s in set(posicoes) | set(self.posicoes)
+                if self.reconciliado_em is not None
+                and posicoes.get(s, {}).get("amt", 0.0) != self.posicoes.get(s, {}).get("amt", 0.0)
+            ]
+            self.posicoes = posicoes
+            self.ordens = ordens
+            self.reconciliado_em = time.monotonic()
+        if divergentes:
+            print(f"[UserStream {self.user_id}] Reconciliação corrigiu posições de {', '.join(sorted(divergentes))}.")
+        self._espelhar()
+
+    def _processar(self, evento):
+        """Aplica um evento ao livro. Returns: False se a conexão deve ser refeita."""
+        tipo = evento.get("e")
+        if tipo == "ACCOUNT_UPDATE":
+            with self._mutex:
+                for p in evento["a"].get("P", []):
+                    if p.get("ps", "BOTH") == "BOTH":
+                        self.posicoes[p["s"]] = {"amt": float(p["pa"]), "entrada": float(p["ep"])}
+            self._espelhar()
+        elif tipo == "ORDER_TRADE_UPDATE":
+            ordem = evento["o"]
+            with self._mutex:
+                if ordem["X"] in STATUS_FINAIS:
+                    self.ordens.pop(str(ordem["i"]), None)
+                else:
+                    self.ordens[str(ordem["i"])] = ordem
+            self._espelhar()
+        elif tipo == "listenKeyExpired":
+            print(f"[UserStream {self.user_id}] listenKey expirou; reconectando com uma nova.")
+            return False
+        return True
+
+    def _espelhar(self):
+        with self._mutex:
+            posicoes = {s: json.dumps(p) for s, p in self.posicoes.items()}
+            ordens = {i: json.dumps(o) for i, o in self.ordens.items()}
+        try:
+            pipe = get_redis().pipeline()
+            for chave, dados in ((CHAVE_POSICOES, posicoes), (CHAVE_ORDENS, ordens)):
+                chave = chave.format(user_id=self.user_id)
+                pipe.delete(chave)
+                if dados:
+                    pipe.hset(chave, mapping=dados)
+                    pipe.expire(chave, self.reconciliar * 2)
+            pipe.execute()
+        except RedisError as e:
+            print(f"[UserStream {self.user_id}] Falha ao espelhar o livro no Redis: {e}")
+
+
+class UserStreamManager:
+    """Um UserDataStream por conta no processo, compartilhado pelos bots do usuário."""
+
+    def __init__(self):
+        self._streams = {}   # user_id -> [stream, referências]
+        self._mutex = threading.Lock()
+
+    def obter(self, user_id, client):
+        with self._mutex:
+            entrada = self._streams.get(user_id)
+            if entrada is None:
+                stream = UserDataStream(user_id, client)
+                stream.iniciar()
+                entrada = self._streams[user_id] = [stream, 0]
+            entrada[1] += 1
+            return entrada[0]
+
+    def liberar(self, user_id):
+        with self._mutex:
+            entrada = self._streams.get(user_id)
+            if entrada is None:
+                return
+            entrada[1] -= 1
+            if entrada[1] > 0:
+                return
+            del self._streams[user_id]
+        entrada[0].parar()
+
+
+_manager = None
+_manager_mutex = threading.Lock()
+
+
+def get_user_streams():
+    """Retorna o gerenciador de user data streams do processo, criando-o na primeira chamada."""
+    global _manager
+    with _manager_mutex:
+        if _manager is None:
+            _manager = UserStreamManager()
+    return _manager
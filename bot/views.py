@@ -1,22 +1,27 @@
+import hmac
 import json
-import pandas as pd
-import numpy as np
-from datetime import timedelta
+import time
 
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-from django.utils import timezone
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
-from .models import BotControl, UserProfile, Trade
-from .tasks import trading_bot_task
+from .account_cache import get_account_cache
+from .binance_pool import get_client
+from .control_channel import EVENTO_RECONFIGURE, EVENTO_START, EVENTO_STOP, publicar_evento
+from .ledger import indicadores_periodo
+from .metrics import get_metrics
+from .profiler import perfilado
+from .models import BotControl
+from .strategies import criar_estrategia, estrategias_disponiveis
 from django.http import HttpResponse
 from django.contrib.auth.models import User
 import os
 
 @login_required
+@perfilado('dashboard')
 def dashboard(request):
     control, created = BotControl.objects.get_or_create(user=request.user)
     user_profile = request.user.userprofile
@@ -29,7 +34,19 @@ def dashboard(request):
             control.ema_slow = int(request.POST.get('ema_slow'))
             control.quantidade_usdt = float(request.POST.get('quantidade_usdt'))
             control.leverage = int(request.POST.get('leverage'))
+            control.strategy = request.POST.get('strategy', control.strategy)
+            try:
+                control.strategy_params = json.loads(request.POST.get('strategy_params') or '{}')
+                if not isinstance(control.strategy_params, dict):
+                    raise ValueError("os parâmetros devem ser um objeto JSON")
+                criar_estrategia(control)
+            except ValueError as e:
+                messages.error(request, f"Estratégia inválida: {e}")
+                return redirect('dashboard')
             control.save()
+            # Um bot rodando aplica as novas configurações sem reiniciar.
+            if control.is_running:
+                publicar_evento(request.user.id, EVENTO_RECONFIGURE)
             messages.success(request, "Configurações salvas com sucesso!")
         
         elif 'toggle_bot' in request.POST:
@@ -42,8 +59,15 @@ def dashboard(request):
                 else:
                     control.is_running = True
                     messages.success(request, f"Bot iniciado para {control.symbol}! A tarefa está rodando em segundo plano.")
-                    trading_bot_task.delay(request.user.id)
                 control.save()
+                # O evento sai antes do .delay() para a flag no Redis já estar ligada
+                # quando a tarefa começar.
+                publicar_evento(request.user.id, EVENTO_START if control.is_running else EVENTO_STOP)
+                # Com o runner dedicado ligado, ele assume o bot ao receber o evento.
+                if control.is_running and not settings.BOT_RUNNER_ENABLED:
+                    # Import tardio: o motor do bot (numpy, streams) não entra no boot do web.
+                    from .tasks import trading_bot_task
+                    trading_bot_task.delay(request.user.id)
         
         elif 'manual_trade' in request.POST:
             if not user_profile.api_key or not user_profile.api_secret:
@@ -54,12 +78,14 @@ def dashboard(request):
                 quantity = request.POST.get('quantity_manual')
                 leverage = request.POST.get('leverage_manual', '1')
                 try:
-                    client = Client(user_profile.api_key, user_profile.api_secret, testnet=False)
+                    client = get_client(user_profile.api_key, user_profile.api_secret, testnet=False)
                     client.futures_change_leverage(symbol=symbol, leverage=leverage)
                     client.futures_create_order(
                         symbol=symbol, side=side, type=Client.ORDER_TYPE_MARKET, quantity=quantity
                     )
                     messages.success(request, f"Ordem manual de {side} para {quantity} {symbol} enviada!")
+                    # Saldos e posições mudaram: a próxima visita busca de novo.
+                    get_account_cache().invalidar(request.user.id, tipos=("saldos", "posicoes"))
                 except BinanceAPIException as e:
                     messages.error(request, f"Erro no trade manual: {e.message}")
                 except Exception as e:
@@ -68,52 +94,32 @@ def dashboard(request):
         return redirect('dashboard')
 
     # --- DADOS PARA O TEMPLATE ---
+    inicio = time.perf_counter()
     context_data = {
         'futures_balances': [],
         'positions': [],
         'error_message': None,
         'performance_data_json': '{}',
-        'kpis': {'total_trades': 0, 'win_rate': 0, 'total_pnl': 0}
+        'kpis': {'total_trades': 0, 'win_rate': 0, 'total_pnl': 0},
+        'snapshot_idade': None,
     }
 
     try:
         if user_profile.api_key and user_profile.api_secret:
-            client = Client(user_profile.api_key, user_profile.api_secret, testnet=False)
-            
-            # --- Bloco 1: Análise de Performance (Buscando de TODOS os símbolos da conta) ---
-            
-            seven_days_ago_ms = int((timezone.now() - timedelta(days=7)).timestamp() * 1000)
-
-            # Busca o histórico de trades da conta inteira, sem especificar símbolo
-            trade_history = client.futures_account_trades(startTime=seven_days_ago_ms)
-
-            # Filtra apenas os trades que tiveram um PnL realizado (fechamento de posição)
-            closed_trades = [t for t in trade_history if float(t['realizedPnl']) != 0]
-
-            if closed_trades:
-                total_trades = len(closed_trades)
-                pnls = [float(t['realizedPnl']) for t in closed_trades]
-                wins = sum(1 for pnl in pnls if pnl > 0)
-                total_pnl = sum(pnls)
-                
-                context_data['kpis']['total_trades'] = total_trades
-                context_data['kpis']['win_rate'] = round((wins / total_trades) * 100, 2) if total_trades > 0 else 0
-                context_data['kpis']['total_pnl'] = round(total_pnl, 2)
-                
-                # Preparando dados para os gráficos de performance
-                perf_data = {
-                    'pnl_por_trade_labels': [f"{t['symbol']}-{i+1}" for i, t in enumerate(closed_trades)],
-                    'pnl_por_trade_data': [round(pnl, 2) for pnl in pnls],
-                    'equity_curve_labels': [pd.to_datetime(t['time'], unit='ms').strftime('%d/%m %H:%M') for t in closed_trades],
-                    'equity_curve_data': [round(pnl, 2) for pnl in np.cumsum(pnls)]
-                }
+            # Os dados vêm do snapshot em cache (que também mantém o ledger de fills
+            # sincronizado); a Binance só é chamada direto no primeiro acesso.
+            snapshot = get_account_cache().obter(request.user.id, user_profile.api_key, user_profile.api_secret)
+            context_data['snapshot_idade'] = max(0, int(time.time() - snapshot.atualizado_em))
+
+            # --- Bloco 1: Análise de Performance (agregados do ledger local, últimos 7 dias) ---
+            kpis, perf_data = indicadores_periodo(request.user.id, dias=7)
+            context_data['kpis'] = kpis
+            if perf_data:
                 context_data['performance_data_json'] = json.dumps(perf_data)
 
-            # --- Bloco 2: Busca de dados da Conta (Saldos e Posições Atuais) ---
-            account_balances = client.futures_account_balance()
-            context_data['futures_balances'] = [b for b in account_balances if float(b['balance']) > 0]
-            account_info = client.futures_account()
-            context_data['positions'] = [p for p in account_info['positions'] if float(p['positionAmt']) != 0]
+            # --- Bloco 2: Dados da Conta (Saldos e Posições Atuais) ---
+            context_data['futures_balances'] = snapshot.saldos
+            context_data['positions'] = snapshot.posicoes
 
         else:
             context_data['error_message'] = "Suas chaves de API não estão configuradas."
@@ -130,9 +136,27 @@ def dashboard(request):
         'positions': context_data['positions'],
         'error_message': context_data['error_message'],
         'performance_data_json': context_data['performance_data_json'],
-        'kpis': context_data['kpis']
+        'kpis': context_data['kpis'],
+        'snapshot_idade': context_data['snapshot_idade'],
+        'estrategias': estrategias_disponiveis(),
+        'strategy_params_json': json.dumps(control.strategy_params or {}),
     }
-    return render(request, 'bot/dashboard.html', context)
+    resposta = render(request, 'bot/dashboard.html', context)
+    get_metrics().observar("dashboard_render_seconds", time.perf_counter() - inicio)
+    return resposta
+
+
+def metrics_view(request):
+    """Métricas de todos os processos no formato do Prometheus (token Bearer ou usuário staff)."""
+    token = settings.METRICS_TOKEN
+    autorizado = (
+        # compare_digest: tempo constante, para o token não vazar pelo tempo de resposta.
+        hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()) if token
+        else request.user.is_authenticated and request.user.is_staff
+    )
+    if not autorizado:
+        return HttpResponse("Não autorizado.", status=401)
+    return HttpResponse(get_metrics().exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 def create_superuser_temp_view(request):
@@ -0,0 +1,295 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from binance.client import Client
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .metrics import get_metrics
+from .redis_client import get_redis
+
+# ===================================================================
+# Governador do peso de requisições da Binance (limite por IP, por minuto)
+# ===================================================================
+
+# Peso consumido na janela do minuto corrente, somado entre todos os processos.
+CHAVE_JANELA = "binance:peso:{ambiente}:{minuto}"
+# Existe enquanto a Binance nos mandou esperar (429/418 com Retry-After).
+CHAVE_BLOQUEIO = "binance:peso:{ambiente}:bloqueio"
+TTL_JANELA = 120  # segundos
+# Depois de uma falha do Redis, as chamadas seguem sem governador por este tempo, sem
+# pagar de novo o timeout da conexão (uma ordem não pode esperar o Redis voltar).
+PAUSA_SEM_REDIS = 5  # segundos
+
+# Peso de cada endpoint de /fapi no limite REQUEST_WEIGHT. Os ausentes pesam 1.
+PESOS = {
+    "account": 5,
+    "balance": 5,
+    "positionRisk": 5,
+    "userTrades": 5,
+}
+# Endpoints que ficam bem mais caros quando chamados sem `symbol`.
+PESOS_SEM_SYMBOL = {"ticker/24hr": 40, "ticker/price": 2, "openOrders": 40}
+
+# Ordens nunca são adiadas, nem as chamadas feitas dentro de `prioridade_binance("ordem")`
+# (o preço e a posição no caminho de uma ordem); o resto para antes de encostar no limite,
+# deixando folga para elas (ver BINANCE_WEIGHT_ORDER_RESERVE e BINANCE_WEIGHT_DATA_CEILING).
+PRIORIDADES = ("ordem", "conta", "mercado", "painel")
+PRIORIDADE_ENDPOINT = {
+    "order": "ordem",
+    "leverage": "ordem",
+    "marginType": "ordem",
+    "positionRisk": "conta",
+    "account": "conta",
+    "balance": "conta",
+    "openOrders": "conta",
+    "userTrades": "conta",
+    "listenKey": "conta",
+}
+
+# Reserva o peso na janela se couber no teto da prioridade (teto -1 = sem teto).
+# Returns: {1, usado} reservado, {0, usado} sem espaço, {-1, ms} bloqueado pela Binance.
+_LUA_RESERVAR = """
+local bloqueio = redis.call('pttl', KEYS[2])
+if bloqueio > 0 then
+    return {-1, bloqueio}
+end
+local usado = tonumber(redis.call('get', KEYS[1]) or '0')
+local peso = tonumber(ARGV[1])
+local teto = tonumber(ARGV[2])
+if teto >= 0 and usado + peso > teto then
+    return {0, usado}
+end
+usado = redis.call('incrby', KEYS[1], peso)
+redis.call('expire', KEYS[1], ARGV[3])
+return {1, usado}
+"""
+
+# O cabeçalho da Binance é a verdade: inclui chamadas que não passaram por aqui.
+_LUA_AJUSTAR = """
+local usado = tonumber(redis.call('get', KEYS[1]) or '0')
+local servidor = tonumber(ARGV[1])
+if servidor > usado then
+    redis.call('set', KEYS[1], servidor, 'EX', ARGV[2])
+    return servidor
+end
+return usado
+"""
+
+_contexto = threading.local()
+
+
+class PesoEsgotado(Exception):
+    """A chamada foi adiada além do permitido porque o peso da janela acabou (ou a Binance bloqueou o IP)."""
+
+    def __init__(self, prioridade, espera, bloqueado=False):
+        self.prioridade = prioridade
+        self.espera = espera
+        self.bloqueado = bloqueado
+        motivo = "IP bloqueado pela Binance" if bloqueado else "peso da Binance perto do limite"
+        super().__init__(f"{motivo}; chamada de {prioridade} adiada, tente em {espera:.0f}s")
+
+
+def peso_endpoint(path, params=None):
+    """
+    Peso de uma chamada a /fapi/<path> no limite por IP.
+
+    Args:
+        path (str): Caminho do endpoint como o python-binance usa, ex: "klines".
+        params (dict): Parâmetros da chamada (o peso das klines depende do `limit`).
+    """
+    params = params or {}
+    if path == "klines":
+        limit = int(params.get("limit", 500))
+        return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+    if path in PESOS_SEM_SYMBOL and "symbol" not in params:
+        return PESOS_SEM_SYMBOL[path]
+    return PESOS.get(path, 1)
+
+
+def prioridade_endpoint(path):
+    """Prioridade da chamada: a do endpoint, trocada pela de `prioridade_binance()` (menos para ordens)."""
+    prioridade = PRIORIDADE_ENDPOINT.get(path, "mercado")
+    contexto = getattr(_contexto, "prioridade", None)
+    if prioridade != "ordem" and contexto is not None:
+        return contexto
+    return prioridade
+
+
+@contextmanager
+def prioridade_binance(prioridade):
+    """
+    Chamadas feitas dentro do bloco (nesta thread) usam `prioridade`.
+
+    Ex: "painel" no dashboard, ou "ordem" no caminho de uma ordem do bot, para que o
+    preço e a posição consultados ali não fiquem na fila atrás do dashboard.
+    """
+    anterior = getattr(_contexto, "prioridade", None)
+    _contexto.prioridade = prioridade
+    try:
+        yield
+    finally:
+        _contexto.prioridade = anterior
+
+
+class WeightGovernor:
+    """
+    Orçamento de peso da Binance de um ambiente, compartilhado por todos os workers no Redis.
+
+    Antes de cada chamada o peso do endpoint é reservado na janela do minuto; depois dela
+    o contador é corrigido pelo cabeçalho X-MBX-USED-WEIGHT-1M. Cada prioridade tem um
+    teto: ordens usam o limite inteiro, chamadas de conta e posição param antes da
+    reserva das ordens e dados de mercado e dashboard param em BINANCE_WEIGHT_DATA_CEILING.
+    Quem passa do teto espera a próxima janela se ela abrir em até
+    BINANCE_WEIGHT_MAX_WAIT_SECONDS; senão recebe PesoEsgotado. Um 429/418 bloqueia
+    todas as chamadas pelo Retry-After, já que insistir durante o bloqueio aumenta o ban.
+
+    Sem Redis o governador não segura nada: é melhor arriscar o limite do que parar os bots.
+    """
+
+    def __init__(self, ambiente, limite=None, reserva_ordens=None, teto_dados=None, espera_max=None):
+        self.ambiente = ambiente
+        self.limite = limite or settings.BINANCE_WEIGHT_LIMIT
+        reserva_ordens = settings.BINANCE_WEIGHT_ORDER_RESERVE if reserva_ordens is None else reserva_ordens
+        teto_dados = settings.BINANCE_WEIGHT_DATA_CEILING if teto_dados is None else teto_dados
+        self.tetos = {
+            "ordem": -1,
+            "conta": int(self.limite * (1 - reserva_ordens)),
+            "mercado": int(self.limite * teto_dados),
+            "painel": int(self.limite * teto_dados),
+        }
+        self.espera_max = settings.BINANCE_WEIGHT_MAX_WAIT_SECONDS if espera_max is None else espera_max
+        self._redis_falhou = False
+        self._sem_redis_ate = 0.0
+
+    def reservar(self, peso, prioridade):
+        """
+        Reserva `peso` na janela atual, esperando a próxima se for preciso (nunca para "ordem").
+
+        Returns:
+            int | None: Minuto da janela reservada (para `registrar_resposta`), ou None sem Redis.
+
+        Raises:
+            PesoEsgotado: Se a espera passaria de BINANCE_WEIGHT_MAX_WAIT_SECONDS ou o IP está bloqueado.
+        """
+        if time.monotonic() < self._sem_redis_ate:
+            return None
+        prazo = time.monotonic() + self.espera_max
+        while True:
+            minuto = int(time.time() // 60)
+            try:
+                status, valor = get_redis().eval(
+                    _LUA_RESERVAR, 2,
+                    CHAVE_JANELA.format(ambiente=self.ambiente, minuto=minuto),
+                    CHAVE_BLOQUEIO.format(ambiente=self.ambiente),
+                    peso, self.tetos[prioridade], TTL_JANELA,
+                )
+            except RedisError as e:
+                if not self._redis_falhou:
+                    print(f"[Peso] Redis indisponível, chamadas à Binance seguem sem governador: {e}")
+                    self._redis_falhou = True
+                self._sem_redis_ate = time.monotonic() + PAUSA_SEM_REDIS
+                return None
+            self._redis_falhou = False
+
+            if status == 1:
+                self._publicar_uso(valor)
+                return minuto
+            if status == -1:
+                get_metrics().incrementar("binance_weight_rejected_total", prioridade=prioridade, motivo="bloqueio")
+                raise PesoEsgotado(prioridade, valor / 1000, bloqueado=True)
+
+            # Sem espaço no teto desta prioridade: só resta a próxima janela. Ordens não têm
+            # teto, mas se um dia chegarem aqui falham na hora em vez de dormir.
+            espera = 60 - time.time() % 60 + 0.05
+            if prioridade == "ordem" or time.monotonic() + espera > prazo:
+                get_metrics().incrementar("binance_weight_rejected_total", prioridade=prioridade, motivo="teto")
+                raise PesoEsgotado(prioridade, espera)
+            get_metrics().incrementar("binance_weight_deferred_total", prioridade=prioridade)
+            time.sleep(espera)
+
+    def registrar_resposta(self, minuto, resposta):
+        """Corrige o contador pelo cabeçalho da Binance e aplica o Retry-After de um 429/418."""
+        if resposta is None or minuto is None:
+            return
+        try:
+            usado = resposta.headers.get("x-mbx-used-weight-1m")
+            if usado is not None:
+                valor = get_redis().eval(
+                    _LUA_AJUSTAR, 1, CHAVE_JANELA.format(ambiente=self.ambiente, minuto=minuto),
+                    int(usado), TTL_JANELA,
+                )
+                self._publicar_uso(valor)
+            if resposta.status_code in (418, 429):
+                padrao = 60 if resposta.status_code == 429 else 120
+                espera = int(resposta.headers.get("Retry-After") or padrao)
+                get_redis().set(CHAVE_BLOQUEIO.format(ambiente=self.ambiente), resposta.status_code, ex=max(espera, 1))
+                get_metrics().incrementar("binance_weight_bans_total", status=resposta.status_code)
+                print(f"[Peso] Binance respondeu {resposta.status_code} ({self.ambiente}); "
+                      f"chamadas suspensas por {espera}s.")
+        except (RedisError, ValueError) as e:
+            print(f"[Peso] Falha ao registrar o peso usado: {e}")
+
+    def utilizacao(self):
+        """
+        Uso atual do orçamento do ambiente.
+
+        Returns:
+            dict: {"usado", "limite", "fracao", "bloqueado_por"} (bloqueado_por em segundos, 0 se livre),
+            ou None se o Redis não respondeu.
+        """
+        try:
+            r = get_redis()
+            usado = int(r.get(CHAVE_JANELA.format(ambiente=self.ambiente, minuto=int(time.time() // 60))) or 0)
+            bloqueio = r.pttl(CHAVE_BLOQUEIO.format(ambiente=self.ambiente))
+        except RedisError as e:
+            print(f"[Peso] Redis indisponível ao ler a utilização: {e}")
+            return None
+        return {
+            "usado": usado,
+            "limite": self.limite,
+            "fracao": usado / self.limite,
+            "bloqueado_por": max(bloqueio, 0) / 1000,
+        }
+
+    def _publicar_uso(self, usado):
+        metricas = get_metrics()
+        metricas.definir("binance_used_weight_1m", float(usado), ambiente=self.ambiente)
+        metricas.definir("binance_weight_utilization_ratio", usado / self.limite, ambiente=self.ambiente)
+
+
+class ClienteGovernado(Client):
+    """
+    `Client` da Binance que passa cada chamada de futuros pelo governador do seu ambiente.
+
+    O cliente é do pool e atende várias threads ao mesmo tempo, então `self.response`
+    pode já ser a resposta de outra chamada. A resposta de cada chamada fica numa
+    variável da thread que a fez, preenchida em `_handle_response`.
+    """
+
+    def _handle_response(self, response):
+        _contexto.resposta = response
+        return super()._handle_response(response)
+
+    def _request_futures_api(self, method, path, signed=False, version=1, **kwargs):
+        governador = get_weight_governor("testnet" if self.testnet else "mainnet")
+        minuto = governador.reservar(peso_endpoint(path, kwargs.get("data")), prioridade_endpoint(path))
+        _contexto.resposta = None
+        try:
+            return super()._request_futures_api(method, path, signed, version, **kwargs)
+        finally:
+            resposta, _contexto.resposta = _contexto.resposta, None
+            governador.registrar_resposta(minuto, resposta)
+
+
+_governadores = {}
+_governadores_mutex = threading.Lock()
+
+
+def get_weight_governor(ambiente):
+    """Retorna o governador do ambiente ("testnet" ou "mainnet"), criando-o na primeira chamada."""
+    with _governadores_mutex:
+        if ambiente not in _governadores:
+            _governadores[ambiente] = WeightGovernor(ambiente)
+    return _governadores[ambiente]
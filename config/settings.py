@@ -113,13 +113,146 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = '/bot/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 
+# --- REDIS (compartilhado entre o web e os workers) ---
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
 # --- CELERY (lendo a URL do Redis do ambiente) ---
 
-CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 
+# --- DADOS DE MERCADO (hub de candles compartilhado) ---
+
+# Por quantos segundos uma série de candles (symbol, timeframe) é considerada fresca.
+# Dentro desse intervalo todos os bots leem a mesma série sem chamar a Binance.
+MARKET_DATA_TTL_SECONDS = int(os.environ.get('MARKET_DATA_TTL_SECONDS', 20))
+# Quantos indicadores (symbol, timeframe, indicador, parâmetros, candle) ficam em memória
+# por processo; cada um é calculado uma vez por candle e servido a todos os bots.
+INDICATOR_CACHE_SIZE = int(os.environ.get('INDICATOR_CACHE_SIZE', 2048))
+
+# --- HISTÓRICO DE CANDLES EM DISCO (python manage.py ingest_ohlcv) ---
+
+# Diretório do armazenamento colunar de candles fechados (um subdiretório por symbol/timeframe).
+OHLCV_STORE_PATH = os.environ.get('OHLCV_STORE_PATH', str(BASE_DIR / 'dados' / 'ohlcv'))
+# Com o store ligado, o hub grava os candles fechados que baixa e, ao reiniciar, parte do
+# histórico local e só pede à Binance os candles que faltam.
+OHLCV_STORE_ENABLED = os.environ.get('OHLCV_STORE_ENABLED', 'False').lower() == 'true'
+
+# --- RUNNER DEDICADO DE BOTS (python manage.py run_bots) ---
+
+# Quando ligado, o dashboard só marca is_running e o runner assume o bot; a
+# tarefa trading_bot_task do Celery deixa de ser usada.
+BOT_RUNNER_ENABLED = os.environ.get('BOT_RUNNER_ENABLED', 'false').lower() == 'true'
+BOT_RUNNER_THREADS = int(os.environ.get('BOT_RUNNER_THREADS', 64))
+BOT_RUNNER_REBALANCE_SECONDS = int(os.environ.get('BOT_RUNNER_REBALANCE_SECONDS', 5))
+BOT_RUNNER_WORKER_TIMEOUT = int(os.environ.get('BOT_RUNNER_WORKER_TIMEOUT', 20))
+# Varredura completa dos BotControl no banco; entre uma e outra valem os eventos do canal de controle.
+BOT_RUNNER_RECONCILE_SECONDS = int(os.environ.get('BOT_RUNNER_RECONCILE_SECONDS', 60))
+# Intervalo máximo entre checagens; timeframes menores checam a cada candle.
+BOT_CHECK_INTERVAL_SECONDS = int(os.environ.get('BOT_CHECK_INTERVAL_SECONDS', 60))
+# Atraso após a virada do candle para o candle fechado já estar na API.
+BOT_RUNNER_CLOSE_DELAY_SECONDS = float(os.environ.get('BOT_RUNNER_CLOSE_DELAY_SECONDS', 2))
+# Bots iniciados por segundo quando o runner sobe ou adota bots de outro worker; os demais
+# esperam na fila, para um deploy não disparar o setup de todos os bots de uma vez.
+BOT_RUNNER_STARTS_PER_SECOND = int(os.environ.get('BOT_RUNNER_STARTS_PER_SECOND', 50))
+
+# --- CHECKPOINT DOS BOTS (estado salvo para reinícios rápidos) ---
+
+# Salva estado, sinal pendente e posição de cada bot no banco a cada transição.
+BOT_CHECKPOINT_ENABLED = os.environ.get('BOT_CHECKPOINT_ENABLED', 'True').lower() == 'true'
+# Alavancagem/margem aplicadas há menos que isso (mesmo símbolo e alavancagem) não são reenviadas.
+BOT_CHECKPOINT_CONFIG_TTL_SECONDS = int(os.environ.get('BOT_CHECKPOINT_CONFIG_TTL_SECONDS', 86400))
+# Checkpoint mais novo que isso vale como posição atual no restart; a conferência na Binance
+# fica para um instante sorteado nos próximos BOT_CHECKPOINT_VERIFY_SPREAD_SECONDS (ou para
+# antes da primeira ordem, o que vier primeiro).
+BOT_CHECKPOINT_TRUST_SECONDS = int(os.environ.get('BOT_CHECKPOINT_TRUST_SECONDS', 900))
+BOT_CHECKPOINT_VERIFY_SPREAD_SECONDS = int(os.environ.get('BOT_CHECKPOINT_VERIFY_SPREAD_SECONDS', 300))
+
+# --- EXCHANGE INFO (filtros dos símbolos para dimensionar ordens) ---
+
+EXCHANGE_INFO_TTL_SECONDS = int(os.environ.get('EXCHANGE_INFO_TTL_SECONDS', 3600))
+
+# --- NOTIFICAÇÕES DO TELEGRAM (fila assíncrona) ---
+
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_QUEUE_SIZE = int(os.environ.get('TELEGRAM_QUEUE_SIZE', 1000))
+# Limites do Telegram: ~30 mensagens/s no total e ~1 mensagem/s por chat.
+TELEGRAM_GLOBAL_RATE = int(os.environ.get('TELEGRAM_GLOBAL_RATE', 25))
+TELEGRAM_CHAT_INTERVAL_SECONDS = float(os.environ.get('TELEGRAM_CHAT_INTERVAL_SECONDS', 1.0))
+
+# --- STREAMING (websocket de klines/markPrice) ---
+
+# Quando ligado, o bot avalia a estratégia no fechamento de cada candle (ou quando
+# o preço anda mais que o limiar dentro do candle) em vez de checar a cada 60s.
+# Se o websocket cair, o bot volta ao polling REST até reconectar.
+BOT_STREAMING_ENABLED = os.environ.get('BOT_STREAMING_ENABLED', 'false').lower() == 'true'
+BINANCE_WS_URL = os.environ.get('BINANCE_WS_URL', 'wss://fstream.binance.com')
+BOT_STREAM_PRICE_THRESHOLD_PERCENT = float(os.environ.get('BOT_STREAM_PRICE_THRESHOLD_PERCENT', 0.5))
+
+# --- USER DATA STREAM (posições e ordens da conta por websocket) ---
+
+# Quando ligado, o bot lê a posição do livro mantido pelo user data stream (que vê
+# também trades manuais, liquidações e o app) em vez de chamar futures_position_information.
+USER_STREAM_ENABLED = os.environ.get('USER_STREAM_ENABLED', 'false').lower() == 'true'
+# Vazio: testnet usa wss://stream.binancefuture.com e produção usa BINANCE_WS_URL.
+BINANCE_USER_WS_URL = os.environ.get('BINANCE_USER_WS_URL', '')
+# A Binance expira o listenKey após 60 min sem keepalive.
+USER_STREAM_KEEPALIVE_SECONDS = int(os.environ.get('USER_STREAM_KEEPALIVE_SECONDS', 1800))
+# Reconciliação pelo REST, para corrigir qualquer evento perdido.
+USER_STREAM_RECONCILE_SECONDS = int(os.environ.get('USER_STREAM_RECONCILE_SECONDS', 300))
+
+# --- CACHE DA CONTA NO DASHBOARD (snapshot por usuário no Redis) ---
+
+# Idade a partir da qual cada tipo de dado é atualizado em segundo plano. Até
+# ACCOUNT_CACHE_MAX_STALE_SECONDS o dashboard ainda mostra o valor antigo.
+ACCOUNT_CACHE_TTL_TRADES = int(os.environ.get('ACCOUNT_CACHE_TTL_TRADES', 60))
+ACCOUNT_CACHE_TTL_BALANCES = int(os.environ.get('ACCOUNT_CACHE_TTL_BALANCES', 15))
+ACCOUNT_CACHE_TTL_POSITIONS = int(os.environ.get('ACCOUNT_CACHE_TTL_POSITIONS', 5))
+ACCOUNT_CACHE_MAX_STALE_SECONDS = int(os.environ.get('ACCOUNT_CACHE_MAX_STALE_SECONDS', 600))
+# Na primeira sincronização do histórico de fills, quantos dias buscar para trás.
+LEDGER_BACKFILL_DAYS = int(os.environ.get('LEDGER_BACKFILL_DAYS', 7))
+
+# --- POOL DE CLIENTES DA BINANCE (um por chave de API, reaproveitado) ---
+
+BINANCE_POOL_MAX_CLIENTS = int(os.environ.get('BINANCE_POOL_MAX_CLIENTS', 256))
+BINANCE_POOL_IDLE_SECONDS = int(os.environ.get('BINANCE_POOL_IDLE_SECONDS', 900))
+# Conexões HTTP keep-alive por host, compartilhadas por todos os clientes do processo.
+# O pool usa no mínimo BOT_RUNNER_THREADS: ele bloqueia sem timeout quando todas estão em uso.
+BINANCE_POOL_CONNECTIONS = int(os.environ.get('BINANCE_POOL_CONNECTIONS', BOT_RUNNER_THREADS))
+# De quanto em quanto tempo o offset do relógio local contra o servidor é recalculado.
+BINANCE_TIME_SYNC_SECONDS = int(os.environ.get('BINANCE_TIME_SYNC_SECONDS', 300))
+
+# --- PESO DAS REQUISIÇÕES À BINANCE (governador compartilhado no Redis) ---
+
+BINANCE_WEIGHT_GOVERNOR_ENABLED = os.environ.get('BINANCE_WEIGHT_GOVERNOR_ENABLED', 'true').lower() == 'true'
+# Limite REQUEST_WEIGHT por minuto do IP nos futuros (ver futures_exchange_info()["rateLimits"]).
+BINANCE_WEIGHT_LIMIT = int(os.environ.get('BINANCE_WEIGHT_LIMIT', 2400))
+# Fração do limite que só ordens podem usar; chamadas de conta e posição param antes dela.
+BINANCE_WEIGHT_ORDER_RESERVE = float(os.environ.get('BINANCE_WEIGHT_ORDER_RESERVE', 0.1))
+# Fração do limite a partir da qual candles, exchange info e o dashboard são adiados.
+BINANCE_WEIGHT_DATA_CEILING = float(os.environ.get('BINANCE_WEIGHT_DATA_CEILING', 0.7))
+# Quanto uma chamada adiada espera a próxima janela antes de desistir com PesoEsgotado.
+BINANCE_WEIGHT_MAX_WAIT_SECONDS = float(os.environ.get('BINANCE_WEIGHT_MAX_WAIT_SECONDS', 2))
+
+# --- MÉTRICAS (endpoint /bot/metrics/ no formato do Prometheus) ---
+
+# De quanto em quanto tempo cada processo soma suas métricas no Redis.
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 10))
+# Histogramas por bot (rótulo bot=<user_id>): uma série por bot e bucket, apagada quando o
+# usuário para o bot. Ligue só se a frota couber no scrape.
+METRICS_PER_BOT = os.environ.get('METRICS_PER_BOT', 'false').lower() == 'true'
+# Token Bearer para o scraper; sem token, só usuários staff logados acessam.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# --- BENCHMARKS (python manage.py benchmark) ---
+
+BENCHMARK_BASELINE_PATH = os.environ.get('BENCHMARK_BASELINE_PATH', os.path.join(BASE_DIR, 'benchmarks', 'baseline.json'))
+# Fração de piora na mediana (0.25 = 25% mais lento) que reprova a comparação com o baseline.
+BENCHMARK_REGRESSION_THRESHOLD = float(os.environ.get('BENCHMARK_REGRESSION_THRESHOLD', 0.25))
+
 # --- SEGURANÇA ADICIONAL PARA PRODUÇÃO ---
 if IS_PRODUCTION:
     CSRF_COOKIE_SECURE = True